@@ -22,4 +22,4 @@ cdef class BoxSortNNPS(LinkedListNNPS):
     ############################################################################
     cdef public map[long, int] cell_to_index  # Maps cell ID to an index
 
-
+    cdef bint _update_incrementally(self)
@@ -33,6 +33,10 @@ cdef class BoxSortNNPS(LinkedListNNPS):
 
     #### Private protocol ################################################
 
+    cdef bint _update_incrementally(self):
+        # Only the occupied cells are stored so always bin from scratch.
+        return False
+
     cdef long _get_flattened_cell_index(self, cPoint pnt, double cell_size):
         cdef long cell_id = flatten(
             find_cell_id(pnt, cell_size), self.ncells_per_dim, self.dim
@@ -25,7 +25,6 @@ cdef class CellIndexingNNPS(NNPS):
     cdef u_int J
     cdef u_int K
 
-    cdef double radius_scale2
     cdef NNPSParticleArrayWrapper dst, src
 
     ##########################################################################
@@ -4,12 +4,19 @@ Do not import any PySPH specific extensions here, if you must, do the import
 inside the function/method.
 """
 
+import os
 import sys
 
 
 class Config(object):
     def __init__(self):
         self._use_openmp = None
+        self._use_symmetric_loop = None
+        self._use_cell_loop = None
+        self._use_fused_groups = None
+        self._use_profiling = None
+        self._use_double = None
+        self._max_cache_size = None
 
     @property
     def use_openmp(self):
@@ -24,6 +31,98 @@ class Config(object):
     def _use_openmp_default(self):
         return False
 
+    @property
+    def use_symmetric_loop(self):
+        if self._use_symmetric_loop is None:
+            self._use_symmetric_loop = self._use_symmetric_loop_default()
+        return self._use_symmetric_loop
+
+    @use_symmetric_loop.setter
+    def use_symmetric_loop(self, value):
+        self._use_symmetric_loop = value
+
+    def _use_symmetric_loop_default(self):
+        return False
+
+    @property
+    def use_cell_loop(self):
+        """Find the neighbors of the destination particles cell by cell so
+        the candidate neighbors are gathered once for each cell.
+        """
+        if self._use_cell_loop is None:
+            self._use_cell_loop = self._use_cell_loop_default()
+        return self._use_cell_loop
+
+    @use_cell_loop.setter
+    def use_cell_loop(self, value):
+        self._use_cell_loop = value
+
+    def _use_cell_loop_default(self):
+        return False
+
+    @property
+    def use_fused_groups(self):
+        """Merge consecutive groups of equations that do not depend on each
+        other so they share the neighbor queries and the precomputed
+        symbols, see `pysph.sph.acceleration_eval.fuse_groups`.
+        """
+        if self._use_fused_groups is None:
+            self._use_fused_groups = self._use_fused_groups_default()
+        return self._use_fused_groups
+
+    @use_fused_groups.setter
+    def use_fused_groups(self, value):
+        self._use_fused_groups = value
+
+    def _use_fused_groups_default(self):
+        return False
+
+    @property
+    def use_profiling(self):
+        if self._use_profiling is None:
+            self._use_profiling = self._use_profiling_default()
+        return self._use_profiling
+
+    @use_profiling.setter
+    def use_profiling(self, value):
+        self._use_profiling = value
+
+    def _use_profiling_default(self):
+        return False
+
+    @property
+    def use_double(self):
+        """Use double precision for the floating point variables in the
+        generated code, single precision (float) is used otherwise.
+        """
+        if self._use_double is None:
+            self._use_double = self._use_double_default()
+        return self._use_double
+
+    @use_double.setter
+    def use_double(self, value):
+        self._use_double = value
+
+    def _use_double_default(self):
+        return True
+
+    @property
+    def max_cache_size(self):
+        """Maximum size (in MB) of the compiled modules cached in
+        ~/.pysph/source, the least recently used modules are removed when
+        this is exceeded.  A value of zero disables the limit.
+        """
+        if self._max_cache_size is None:
+            self._max_cache_size = self._max_cache_size_default()
+        return self._max_cache_size
+
+    @max_cache_size.setter
+    def max_cache_size(self, value):
+        self._max_cache_size = value
+
+    def _max_cache_size_default(self):
+        return float(os.environ.get('PYSPH_MAX_CACHE_SIZE', 1024))
+
 
 _config = None
 
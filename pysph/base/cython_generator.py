@@ -11,7 +11,9 @@ except ImportError:
     from ordereddict import OrderedDict
 import inspect
 import logging
+import re
 from mako.template import Template
+import numpy
 from textwrap import dedent
 import types
 
@@ -23,13 +25,17 @@ from pysph.base.config import get_config
 logger = logging.getLogger(__name__)
 
 class CythonClassHelper(object):
-    def __init__(self, name='', public_vars=None, methods=None):
+    def __init__(self, name='', public_vars=None, methods=None, final=False):
         self.name = name
         self.public_vars = public_vars
         self.methods = methods if methods is not None else []
+        self.final = final
 
     def generate(self):
         template = dedent("""
+%if final:
+@cython.final
+%endif
 cdef class ${class_name}:
     %for name, type in public_vars.items():
     cdef public ${type} ${name}
@@ -49,7 +55,7 @@ ${line}
         t = Template(text=template)
         return t.render(class_name=self.name,
                         public_vars=self.public_vars,
-                        methods=self.methods)
+                        methods=self.methods, final=self.final)
 
 def get_func_definition(sourcelines):
     """Given a block of source lines for a method or function,
@@ -64,6 +70,14 @@ def get_func_definition(sourcelines):
     return sourcelines[:count], sourcelines[count:]
 
 
+def get_cython_decorators(sourcelines):
+    """Return the Cython decorators (like ``@cython.boundscheck(False)``)
+    in the given definition lines of a method or function.
+    """
+    return [line.strip() for line in sourcelines
+            if line.strip().startswith('@cython.')]
+
+
 def all_numeric(seq):
     """Return true if all values in given sequence are numeric.
     """
@@ -93,7 +107,7 @@ class KnownType(object):
 
 
 class CythonGenerator(object):
-    def __init__(self, known_types=None, python_methods=False):
+    def __init__(self, known_types=None, python_methods=False, final=False):
         """
         Parameters
         -----------
@@ -104,10 +118,17 @@ class CythonGenerator(object):
 
              specifies if convenient Python friendly wrappers are to be
              generated in addition to the low-level c wrappers.
+
+        - final: bool: declare the wrapped classes final.
+
+             the methods of a final class are called directly instead of
+             through its virtual table so the C compiler can inline them.
+             The generated module must ``cimport cython``.
         """
 
         self.code = ''
         self.python_methods = python_methods
+        self.final = final
         # Methods to not wrap.
         self.ignore_methods = ['_cython_code_']
         self.known_types = known_types if known_types is not None else {}
@@ -115,6 +136,12 @@ class CythonGenerator(object):
 
     ##### Public protocol #####################################################
 
+    def get_float_type(self):
+        """Return the C type used for floating point scalars, this is
+        `float` if the configuration does not use double precision.
+        """
+        return 'double' if self._config.use_double else 'float'
+
     def ctype_to_python(self, type_str):
         """Given a c-style type declaration obtained from the `detect_type`
         method, return a Python friendly type declaration.
@@ -140,13 +167,17 @@ class CythonGenerator(object):
         elif isinstance(value, str):
             return 'str'
         elif isinstance(value, float):
-            return 'double'
+            return self.get_float_type()
         elif isinstance(value, (list, tuple)):
             if all_numeric(value):
                 # We don't deal with integer lists for now.
                 return 'double*'
             else:
                 return 'list' if isinstance(value, list) else 'tuple'
+        elif isinstance(value, numpy.ndarray) and value.ndim == 1 and \
+             value.dtype == numpy.float64:
+            # Typed memoryviews can be indexed without the GIL.
+            return 'double[::1]'
         else:
             return 'object'
 
@@ -162,6 +193,51 @@ class CythonGenerator(object):
         else:
             raise TypeError('Unsupport type to wrap: %s'%obj_type)
 
+    def parse_specialized(self, obj):
+        """Wrap the public methods of the instance as inline functions named
+        `ClassName_method` with the numeric attributes of the instance
+        replaced by their values.  The C compiler can then fold these, for
+        example the branches on the dimension of a kernel.
+
+        A `CodeGenerationError` is raised if a method uses any other
+        attribute or method of the instance.
+        """
+        cls = obj.__class__
+        constants = dict(
+            (name, value) for name, value in obj.__dict__.items()
+            if all_numeric([value])
+        )
+
+        def _substitute(match):
+            name = match.group(1)
+            if name not in constants:
+                raise CodeGenerationError(
+                    'Cannot specialize %s.%s'%(cls.__name__, name)
+                )
+            value = repr(constants[name])
+            return '(%s)'%value if value.startswith('-') else value
+
+        code = []
+        for name in dir(cls):
+            meth = getattr(cls, name)
+            if name.startswith('_') or name in self.ignore_methods or \
+               not callable(meth):
+                continue
+            sourcelines = inspect.getsourcelines(meth)[0]
+            defn, lines = get_func_definition(sourcelines)
+            m_name, returns, args = self._analyze_method(meth, lines)
+            c_defn = self._get_c_method_spec(
+                '%s_%s'%(cls.__name__, m_name), returns, args[1:]
+            )
+            body = self._get_method_body(meth, lines, indent=' '*8)
+            if re.search(r'\bself\.\w+\s*(\(|[-+*/]?=[^=])', body):
+                raise CodeGenerationError(
+                    'Cannot specialize %s.%s'%(cls.__name__, m_name)
+                )
+            body = re.sub(r'\bself\.(\w+)', _substitute, body)
+            code.append('{defn}\n{body}'.format(defn=c_defn, body=body))
+        self.code = '\n'.join(code)
+
     ###### Private protocol ###################################################
 
     def _analyze_method(self, meth, lines):
@@ -214,7 +290,7 @@ class CythonGenerator(object):
             c_type = self.detect_type(arg, value)
             c_args.append('{type} {arg}'.format(type=c_type, arg=arg))
 
-        c_ret = 'double' if returns else 'void'
+        c_ret = self.get_float_type() if returns else 'void'
         c_arg_def = ', '.join(c_args)
         if self._config.use_openmp:
             ignore = ['reduce', 'converged']
@@ -253,7 +329,8 @@ class CythonGenerator(object):
         dedented_body = dedent(body)
         symbols = get_assigned(dedented_body)
         undefined = symbols - set(declared) - args
-        declare = [indent +'cdef double %s\n'%x for x in sorted(undefined)]
+        declare = [indent + 'cdef %s %s\n'%(self.get_float_type(), x)
+                   for x in sorted(undefined)]
         code = ''.join(declare) + cython_body
         return code
 
@@ -262,6 +339,10 @@ class CythonGenerator(object):
         defn, lines = get_func_definition(sourcelines)
         m_name, returns, args = self._analyze_method(meth, lines)
         c_defn = self._get_c_method_spec(m_name, returns, args)
+        # Keep any Cython decorators (compiler directives) of the method.
+        decorators = get_cython_decorators(defn)
+        if len(decorators) > 0:
+            c_defn = ('\n' + indent[4:]).join(decorators + [c_defn])
         c_body = self._get_method_body(meth, lines, indent=indent)
         self.code = '{defn}\n{body}'.format(defn=c_defn, body=c_body)
         if self.python_methods:
@@ -299,7 +380,7 @@ class CythonGenerator(object):
             else:
                 call_sig.append('{arg}'.format(arg=arg))
 
-        py_ret = ' double' if returns else ''
+        py_ret = ' ' + self.get_float_type() if returns else ''
         py_arg_def = ', '.join(py_args)
         pydefn = 'cpdef{ret} py_{name}({arg_def}):'\
                      .format(ret=py_ret, name=name, arg_def=py_arg_def)
@@ -320,7 +401,7 @@ class CythonGenerator(object):
         code = declare[9:-2]
         if code.startswith('matrix'):
             sz = matrix(eval(code[7:-1]))
-            defn = 'cdef double %s%s'%(name, sz)
+            defn = 'cdef %s %s%s'%(self.get_float_type(), name, sz)
             return defn
         else:
             defn = 'cdef {type} {name}'.format(type=code, name=name)
@@ -340,7 +421,7 @@ class CythonGenerator(object):
         public_vars = self._get_public_vars(obj)
         methods = self._get_methods(cls)
         helper = CythonClassHelper(name=name, public_vars=public_vars,
-                                   methods=methods)
+                                   methods=methods, final=self.final)
         self.code = helper.generate()
 
     def _process_body_line(self, line):
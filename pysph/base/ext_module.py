@@ -6,11 +6,14 @@ from distutils.errors import CompileError, LinkError
 import hashlib
 import imp
 import importlib
+import json
 import numpy
 import os
-from os.path import dirname, exists, expanduser, isdir, join
+from os.path import dirname, exists, expanduser, getmtime, getsize, isdir, \
+    isfile, join
 from pyximport import pyxbuild
 import shutil
+import subprocess
 import sys
 import time
 
@@ -31,6 +34,11 @@ from pysph.base.config import get_config
 from pysph.base.capture_stream import CaptureMultipleStreams
 
 
+# Processes building extension modules in the background keyed on the path
+# of the extension module.
+_background_builds = {}
+
+
 def get_platform_dir():
     return 'py{version}-{platform_dir}'.format(
         version=sys.version[:3], platform_dir=get_platform()
@@ -42,6 +50,163 @@ def get_md5(data):
     return hashlib.md5(data.encode()).hexdigest()
 
 
+@contextmanager
+def lock_directory(lock_path, timeout=90):
+    """Acquire a lock by creating the directory `lock_path`, this is atomic on
+    all platforms.  If the lock cannot be acquired in `timeout` seconds we
+    proceed anyway.
+    """
+    t1 = time.time()
+    def _is_timed_out():
+        if timeout is None:
+            return False
+        else:
+            return (time.time() - t1) > timeout
+    def _try_to_lock():
+        if not exists(lock_path):
+            try:
+                os.mkdir(lock_path)
+            except OSError:
+                return False
+            else:
+                return True
+        return False
+
+    while not _try_to_lock():
+        time.sleep(0.1)
+        if _is_timed_out():
+            break
+    try:
+        yield
+    finally:
+        os.rmdir(lock_path)
+
+
+class CacheIndex(object):
+    """A persistent index of the compiled modules in a cache directory.
+
+    The index records when each module was last used so that the least
+    recently used modules can be removed when the cache grows too large.
+    Modules that are not in the index (for example those created by older
+    versions) are assumed to have been last used when they were modified.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.build_dir = join(root, 'build')
+        self.path = join(root, 'cache_index.json')
+        self.lock_path = join(root, 'cache_index.lock')
+
+    def touch(self, name):
+        """Mark the module with the given name as used now.
+        """
+        with lock_directory(self.lock_path):
+            index = self._read()
+            index[name] = time.time()
+            self._write(index)
+
+    def get_modules(self):
+        """Return a dictionary mapping the name of each cached module to a
+        tuple of its last used time and the list of its files.
+        """
+        with lock_directory(self.lock_path):
+            return self._get_modules()
+
+    def get_size(self):
+        """Return the total size in bytes of all the cached modules.
+        """
+        with lock_directory(self.lock_path):
+            return sum(
+                self._get_size(paths)
+                for last_used, paths in self._get_modules().values()
+            )
+
+    def evict(self, max_size, keep=()):
+        """Remove the least recently used modules until the total size of the
+        cache is at most `max_size` bytes.
+
+        Modules in `keep` and those which are locked (being written or
+        compiled) are never removed.  Returns the names of the removed
+        modules.
+        """
+        removed = []
+        with lock_directory(self.lock_path):
+            index = self._read()
+            modules = self._get_modules()
+            sizes = dict(
+                (name, self._get_size(paths))
+                for name, (last_used, paths) in modules.items()
+            )
+            total = sum(sizes.values())
+            for name in sorted(modules, key=lambda x: modules[x][0]):
+                if total <= max_size:
+                    break
+                if name in keep or exists(join(self.root, name + '.lock')):
+                    continue
+                for f in modules[name][1]:
+                    try:
+                        os.remove(f)
+                    except OSError:
+                        pass
+                total -= sizes[name]
+                index.pop(name, None)
+                removed.append(name)
+            self._write(index)
+        return removed
+
+    #### Private protocol ###################################################
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, index):
+        with open(self.path, 'w') as f:
+            json.dump(index, f)
+
+    def _get_modules(self):
+        # Files may be removed by another process at any time, those which
+        # have gone missing are skipped.
+        index = self._read()
+        modules = {}
+        for name, paths in self._get_files().items():
+            existing = []
+            mtimes = []
+            for f in paths:
+                try:
+                    mtimes.append(getmtime(f))
+                except OSError:
+                    continue
+                existing.append(f)
+            if len(existing) > 0:
+                modules[name] = (index.get(name, max(mtimes)), existing)
+        return modules
+
+    def _get_size(self, paths):
+        size = 0
+        for f in paths:
+            try:
+                size += getsize(f)
+            except OSError:
+                pass
+        return size
+
+    def _get_files(self):
+        files = {}
+        def _add(path, fname):
+            if fname.startswith('m_') and isfile(path):
+                files.setdefault(fname.split('.', 1)[0], []).append(path)
+
+        for fname in os.listdir(self.root):
+            _add(join(self.root, fname), fname)
+        for dirpath, dirnames, fnames in os.walk(self.build_dir):
+            for fname in fnames:
+                _add(join(dirpath, fname), fname)
+        return files
+
+
 class ExtModule(object):
     """Encapsulates the generated code, extension module etc.
     """
@@ -94,32 +259,8 @@ class ExtModule(object):
         self.ext_path = join(self.root, base + get_config_var('SO'))
         self.lock_path = join(self.root, base + '.lock')
 
-    @contextmanager
     def _lock(self, timeout=90):
-        t1 = time.time()
-        def _is_timed_out():
-            if timeout is None:
-                return False
-            else:
-                return (time.time() - t1) > timeout
-        def _try_to_lock():
-            if not exists(self.lock_path):
-                try:
-                    os.mkdir(self.lock_path)
-                except OSError:
-                    return False
-                else:
-                    return True
-            return False
-
-        while not _try_to_lock():
-            time.sleep(0.1)
-            if _is_timed_out():
-                break
-        try:
-            yield
-        finally:
-            os.rmdir(self.lock_path)
+        return lock_directory(self.lock_path, timeout)
 
     def _create_source(self):
         # Create the source.
@@ -187,54 +328,101 @@ class ExtModule(object):
     def build(self, force=False):
         """Build source into an extension module.  If force is False
         previously compiled module is returned.
+
+        If the module is being built in the background (see
+        `build_in_background`), this waits for that build to finish.
         """
+        self._wait_for_background_build()
         if not self.shared_filesystem or self.rank == 0:
-            with self._lock():
-                if force or self.should_recompile():
-                    self._message("Compiling code at:", self.src_path)
-                    inc_dirs = [numpy.get_include()]
-                    # Add pysph/base directory to inc_dirs for including spatial_hash.h
-                    # for SpatialHashNNPS
-                    inc_dirs.append(os.path.dirname(os.path.realpath(__file__)))
-                    extra_compile_args, extra_link_args = self._get_extra_args()
-
-                    extension = Extension(
-                        name=self.name, sources=[self.src_path],
-                        include_dirs=inc_dirs,
-                        extra_compile_args=extra_compile_args,
-                        extra_link_args=extra_link_args,
-                        language="c++"
-                    )
-
-                    if not hasattr(sys.stdout, 'errors'):
-                        # FIXME: This happens when nosetests replaces the
-                        # stdout with the a Tee instance.  This Tee instance
-                        # does not have errors which breaks the tests so we
-                        # disable verbose reporting.
-                        script_args = []
-                    else:
-                        script_args = ['--verbose']
-                    try:
-                        with CaptureMultipleStreams() as stream:
-                            mod = pyxbuild.pyx_to_dll(self.src_path, extension,
-                                pyxbuild_dir=self.build_dir, force_rebuild=True,
-                                setup_args={'script_args': script_args}
-                            )
-                    except (CompileError, LinkError):
-                        hline = "*"*80
-                        print(hline + "\nERROR")
-                        print(stream.get_output()[0])
-                        print(stream.get_output()[1])
-                        msg = "Compilation of code failed, please check "\
-                                "error messages above."
-                        print(hline + "\n" + msg)
-                        sys.exit(1)
-                    shutil.copy(mod, self.ext_path)
-                else:
-                    self._message("Precompiled code from:", self.src_path)
+            self._build(force)
         if MPI is not None:
             self.comm.barrier()
 
+    def build_in_background(self):
+        """Start building the extension module in a separate process and
+        return immediately.
+
+        Only the processes which would compile the module in `build` start a
+        build and this does nothing if the module is already built.  A later
+        call to `build` or `load` on any ExtModule with the same source waits
+        for the background build to finish.  The module is built by a new
+        Python interpreter (see `main`) as forking a process which uses MPI
+        is not safe.  In parallel runs, the module is built by `build` as
+        usual.
+        """
+        if self.num_procs > 1 or self.ext_path in _background_builds:
+            return
+        with self._lock():
+            if not self.should_recompile():
+                return
+            config = get_config()
+            cmd = [
+                sys.executable, '-m', 'pysph.base.ext_module', self.src_path,
+                '--max-cache-size', str(config.max_cache_size)
+            ]
+            if config.use_openmp:
+                cmd.append('--openmp')
+            if self.depends:
+                cmd.extend(['--depends'] + list(self.depends))
+            # If the build fails, `build` compiles the module again which
+            # reports the errors, so the output is discarded here.
+            with open(os.devnull, 'w') as devnull:
+                proc = subprocess.Popen(cmd, stdout=devnull, stderr=devnull)
+        _background_builds[self.ext_path] = proc
+
+    def _wait_for_background_build(self):
+        proc = _background_builds.pop(self.ext_path, None)
+        if proc is not None:
+            proc.wait()
+
+    def _build(self, force=False):
+        with self._lock():
+            if force or self.should_recompile():
+                self._message("Compiling code at:", self.src_path)
+                inc_dirs = [numpy.get_include()]
+                # Add pysph/base directory to inc_dirs for including spatial_hash.h
+                # for SpatialHashNNPS
+                inc_dirs.append(os.path.dirname(os.path.realpath(__file__)))
+                extra_compile_args, extra_link_args = self._get_extra_args()
+
+                extension = Extension(
+                    name=self.name, sources=[self.src_path],
+                    include_dirs=inc_dirs,
+                    extra_compile_args=extra_compile_args,
+                    extra_link_args=extra_link_args,
+                    language="c++"
+                )
+
+                if not hasattr(sys.stdout, 'errors'):
+                    # FIXME: This happens when nosetests replaces the
+                    # stdout with the a Tee instance.  This Tee instance
+                    # does not have errors which breaks the tests so we
+                    # disable verbose reporting.
+                    script_args = []
+                else:
+                    script_args = ['--verbose']
+                try:
+                    with CaptureMultipleStreams() as stream:
+                        mod = pyxbuild.pyx_to_dll(self.src_path, extension,
+                            pyxbuild_dir=self.build_dir, force_rebuild=True,
+                            setup_args={'script_args': script_args}
+                        )
+                except (CompileError, LinkError):
+                    hline = "*"*80
+                    print(hline + "\nERROR")
+                    print(stream.get_output()[0])
+                    print(stream.get_output()[1])
+                    msg = "Compilation of code failed, please check "\
+                            "error messages above."
+                    print(hline + "\n" + msg)
+                    sys.exit(1)
+                shutil.copy(mod, self.ext_path)
+                compiled = True
+            else:
+                self._message("Precompiled code from:", self.src_path)
+                compiled = False
+        self._update_cache(compiled)
+
     def load(self):
         """Build and load the built extension module.
 
@@ -244,6 +432,21 @@ class ExtModule(object):
         file, path, desc = imp.find_module(self.name, [dirname(self.ext_path)])
         return imp.load_module(self.name, file, path, desc)
 
+    def _update_cache(self, compiled):
+        """Record the use of this module in the cache index and if a new
+        module was compiled, evict the least recently used ones when the cache
+        exceeds the configured size.
+        """
+        index = CacheIndex(self.root)
+        index.touch(self.name)
+        max_size = get_config().max_cache_size
+        if compiled and max_size > 0:
+            removed = index.evict(max_size*1024*1024, keep=[self.name])
+            if len(removed) > 0:
+                self._message(
+                    "Removed %d old module(s) from cache." % len(removed)
+                )
+
     def _get_extra_args(self):
         if get_config().use_openmp:
             if sys.platform == 'win32':
@@ -256,3 +459,46 @@ class ExtModule(object):
     def _message(self, *args):
         if self.verbose:
             print(' '.join(args))
+
+
+def main(args=None):
+    """Build the extension module for the given source file.
+
+    This is used by `ExtModule.build_in_background` to compile a module in a
+    separate process.
+    """
+    from argparse import ArgumentParser
+    parser = ArgumentParser(
+        description='Build the extension module of a generated source file.'
+    )
+    parser.add_argument("src_path", help="Path to the generated source.")
+    parser.add_argument(
+        "--openmp", action="store_true", default=False,
+        help="Compile the module with OpenMP."
+    )
+    parser.add_argument(
+        "--max-cache-size", action="store", type=float, default=None,
+        help="Maximum size of the module cache in MB."
+    )
+    parser.add_argument(
+        "--depends", nargs="*", default=None,
+        help="Modules which trigger a recompilation when they change."
+    )
+    options = parser.parse_args(args)
+    config = get_config()
+    config.use_openmp = options.openmp
+    if options.max_cache_size is not None:
+        config.max_cache_size = options.max_cache_size
+
+    with open(options.src_path) as f:
+        code = f.read()
+    extension = options.src_path.rsplit('.', 1)[1]
+    mod = ExtModule(
+        code, extension=extension, root=dirname(options.src_path),
+        depends=options.depends
+    )
+    mod._build()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,17 @@
 
 from math import pi, sqrt, exp
 
+import cython
+import numpy
+
 M_1_PI = 1.0 / pi
 M_2_SQRTPI = 2.0 / sqrt(pi)
 
 
+# This is defined to silence editor warnings for the use of declare.
+def declare(*args): pass
+
+
 def get_correction(kernel, h0):
     rij = kernel.deltap * h0
     return kernel.kernel(rij=rij, h=h0)
@@ -1088,3 +1095,145 @@ class QuinticSpline(object):
             dw -= 75.0 * tmp1 * tmp1 * tmp1 * tmp1
 
         return -fac * h1 * (dw * q + w * self.dim)
+
+
+###############################################################################
+# `TabulatedKernel` class.
+###############################################################################
+class TabulatedKernel(object):
+    r"""A kernel that looks up the values of another kernel in tables.
+
+    The kernel :math:`W(q)`, its derivative :math:`dW/dq` and the derivative
+    with respect to h of the given kernel are tabulated for :math:`h=1` at
+    `n` + 1 equally spaced values of :math:`q` in :math:`[0, q_{max}]`,
+    where :math:`q_{max}` is the radius scale of the kernel.  These are
+    linearly interpolated and scaled by the appropriate power of
+    :math:`1/h`.  With `cubic`, the kernel is interpolated with cubic
+    Hermite polynomials using the tabulated derivatives instead, which is
+    much more accurate for the same number of intervals.
+
+    The cost of a kernel evaluation is then the same for all kernels so
+    this is useful for the expensive ones like the `Gaussian`,
+    `SuperGaussian` and `QuinticSpline`.
+
+    Parameters
+    ----------
+
+    kernel : object
+        The kernel to tabulate, for example ``QuinticSpline(dim=2)``.
+    n : int
+        The number of intervals in the tables.
+    cubic : bool
+        Interpolate the kernel with cubic Hermite polynomials.
+    """
+
+    def __init__(self, kernel=None, n=4096, cubic=False):
+        if kernel is None:
+            kernel = CubicSpline(dim=2)
+        self.base_kernel = kernel.__class__.__name__
+        self.radius_scale = kernel.radius_scale
+        self.dim = kernel.dim
+        self.deltap = kernel.get_deltap()
+        self.n = n
+        self.cubic = bool(cubic)
+        self.dq1 = n / kernel.radius_scale
+
+        q = numpy.linspace(0.0, kernel.radius_scale, n + 1)
+        grad = [0.0, 0.0, 0.0]
+        w, dwdq, dwdh = [], [], []
+        for qi in q:
+            w.append(kernel.kernel(rij=qi, h=1.0))
+            kernel.gradient(xij=[qi, 0.0, 0.0], rij=qi, h=1.0, grad=grad)
+            dwdq.append(grad[0])
+            dwdh.append(kernel.gradient_h(rij=qi, h=1.0))
+        self.w = numpy.asarray(w)
+        self.dwdq = numpy.asarray(dwdq)
+        self.dwdh = numpy.asarray(dwdh)
+
+    def get_deltap(self):
+        return self.deltap
+
+    # The table lookups are checked above so the generated code does not
+    # need to check the bounds of (or the initialization of) the tables.
+    @cython.boundscheck(False)
+    @cython.initializedcheck(False)
+    def kernel(self, xij=[0., 0, 0], rij=1.0, h=1.0):
+        h1 = 1. / h
+
+        # get the kernel normalizing factor
+        if self.dim == 1:
+            fac = h1
+        elif self.dim == 2:
+            fac = h1 * h1
+        else:
+            fac = h1 * h1 * h1
+
+        # position in the table
+        x = rij * h1 * self.dq1
+        if x >= self.n:
+            return 0.0
+        i = declare('int')
+        i = int(x)
+        t = x - i
+
+        if self.cubic:
+            dq = 1.0 / self.dq1
+            t2 = t * t
+            t3 = t2 * t
+            val = (2.0 * t3 - 3.0 * t2 + 1.0) * self.w[i] + \
+                (t3 - 2.0 * t2 + t) * dq * self.dwdq[i] + \
+                (3.0 * t2 - 2.0 * t3) * self.w[i + 1] + \
+                (t3 - t2) * dq * self.dwdq[i + 1]
+        else:
+            val = self.w[i] + t * (self.w[i + 1] - self.w[i])
+
+        return val * fac
+
+    @cython.boundscheck(False)
+    @cython.initializedcheck(False)
+    def gradient(self, xij=[0., 0, 0], rij=1.0, h=1.0, grad=[0., 0, 0]):
+        h1 = 1. / h
+
+        # get the kernel normalizing factor for the derivative
+        if self.dim == 1:
+            fac = h1 * h1
+        elif self.dim == 2:
+            fac = h1 * h1 * h1
+        else:
+            fac = h1 * h1 * h1 * h1
+
+        # compute the gradient
+        x = rij * h1 * self.dq1
+        val = 0.0
+        i = declare('int')
+        if (x < self.n) and (rij > 1e-12):
+            i = int(x)
+            t = x - i
+            val = self.dwdq[i] + t * (self.dwdq[i + 1] - self.dwdq[i])
+            val = val * fac / rij
+
+        grad[0] = val * xij[0]
+        grad[1] = val * xij[1]
+        grad[2] = val * xij[2]
+
+    @cython.boundscheck(False)
+    @cython.initializedcheck(False)
+    def gradient_h(self, xij=[0., 0, 0], rij=1.0, h=1.0):
+        h1 = 1. / h
+
+        # get the kernel normalizing factor for the derivative
+        if self.dim == 1:
+            fac = h1 * h1
+        elif self.dim == 2:
+            fac = h1 * h1 * h1
+        else:
+            fac = h1 * h1 * h1 * h1
+
+        x = rij * h1 * self.dq1
+        if x >= self.n:
+            return 0.0
+        i = declare('int')
+        i = int(x)
+        t = x - i
+
+        return (self.dwdh[i] + t * (self.dwdh[i + 1] - self.dwdh[i])) * fac
@@ -13,15 +13,35 @@ cdef class LinkedListNNPS(NNPS):
     cdef public bint fixed_h             # Constant cell sizes
     cdef public list heads               # Head arrays for the cells
     cdef public list nexts               # Next arrays for the particles
+    cdef public double slack             # Padding of the cells, see _refresh
+    cdef public long n_relinked          # Particles moved in the last update
+    cdef public bint vectorize           # Filter the candidates in blocks
+    cdef list _cids                      # Cell index of each particle
+    cdef list _new_cids                  # Scratch space for the cell indices
 
     cdef NNPSParticleArrayWrapper src, dst # Current source and destination.
     cdef UIntArray next, head              # Current next and head arrays.
+    cdef UIntArray _dst_cells              # Occupied cells of the destination
+    cdef UIntArray _dst_head, _dst_next    # Destination head and next arrays
 
     cpdef long _count_occupied_cells(self, long n_cells) except -1
     cpdef long _get_number_of_cells(self) except -1
     cdef long _get_flattened_cell_index(self, cPoint pnt, double cell_size)
     cdef long _get_valid_cell_index(self, int cid_x, int cid_y, int cid_z,
             int* ncells_per_dim, int dim, int n_cells) nogil
+    cdef bint _update_incrementally(self)
     cdef void find_nearest_neighbors(self, size_t d_idx, UIntArray nbrs) nogil
+    cdef void _find_neighbors_of_point(self, double x, double y, double z,
+            double hi2, UIntArray nbrs, bint check_bounds) nogil
+    cdef void _find_cell(self, size_t d_idx, int* cid) nogil
+    cdef void _gather_coords(self, UIntArray candidates,
+                             DoubleArray coords) nogil
+
+    cpdef long prepare_cell_query(self) except -1
+    cdef void get_cell_particles(self, long cell, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords) nogil
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil
 
 
@@ -20,11 +20,52 @@ from cpython.list cimport PyList_GetItem, PyList_SetItem, PyList_GET_ITEM
 # Cython for compiler directives
 cimport cython
 
+# Number of candidate neighbors filtered together, see `_filter_block`.
+DEF FILTER_BLOCK = 64
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _filter_block(unsigned int* indices, double* s_x,
+        double* s_y, double* s_z, double* s_h, int n, double x, double y,
+        double z, double hi2, double radius_scale, UIntArray nbrs) nogil:
+    """Append the candidates that are neighbors of the point (x, y, z) to
+    `nbrs`, in order.
+
+    The coordinates and smoothing lengths of the `n` (at most FILTER_BLOCK)
+    candidates `indices` are contiguous so the distances and the search
+    radii are computed in a branch-free loop that the compiler can
+    vectorize.  The candidates are then selected with the same comparisons
+    as in `LinkedListNNPS.find_nearest_neighbors`.
+    """
+    cdef double xij2[FILTER_BLOCK]
+    cdef double rij2[FILTER_BLOCK]
+    cdef double hj2
+    cdef unsigned int* data
+    cdef long length = nbrs.length
+    cdef int k, count = 0
+
+    for k in range(n):
+        hj2 = radius_scale * s_h[k]
+        hj2 *= hj2
+        xij2[k] = norm2(s_x[k] - x, s_y[k] - y, s_z[k] - z)
+        rij2[k] = hi2 if hi2 > hj2 else hj2
+
+    if length + n > nbrs.alloc:
+        nbrs.c_reserve(2*(length + n))
+    data = nbrs.data + length
+    for k in range(n):
+        data[count] = indices[k]
+        count += xij2[k] < rij2[k]
+    nbrs.c_resize(length + count)
+
 
 #############################################################################
 cdef class LinkedListNNPS(NNPS):
     """Nearest neighbor query class using the linked list method.
     """
+    supports_virtual_images = True
+
     def __init__(self, int dim, list particles, double radius_scale=2.0,
                  int ghost_layers=1, domain=None,
                  bint fixed_h=False, bint cache=False, bint sort_gids=False):
@@ -69,6 +110,18 @@ cdef class LinkedListNNPS(NNPS):
         # initialize the head and next for each particle array
         self.heads = [UIntArray() for i in range(self.narrays)]
         self.nexts = [UIntArray() for i in range(self.narrays)]
+        self._cids = [IntArray() for i in range(self.narrays)]
+        self._new_cids = [IntArray() for i in range(self.narrays)]
+        self._dst_cells = UIntArray()
+
+        # The cells are padded by this fraction of the extent of the
+        # particles so they can be reused while the particles stay inside.
+        self.slack = 0.1
+        self.n_relinked = 0
+
+        # Select the neighbors without branches, see `find_nearest_neighbors`
+        # and `get_cell_neighbors`.
+        self.vectorize = True
 
         # flag for constant smoothing lengths
         self.fixed_h = fixed_h
@@ -92,10 +145,54 @@ cdef class LinkedListNNPS(NNPS):
         does not reset the neighbors array before it appends the
         neighbors to it.
 
+        With virtual periodic images, the neighbors of the images of the
+        particle are also found, see `DomainManager`.
+        """
+        cdef unsigned int* s_gid = self.src.gid.data
+
+        # this is the physical position of the particle that will be
+        # used in pairwise searching
+        cdef double x = self.dst.x.data[d_idx]
+        cdef double y = self.dst.y.data[d_idx]
+        cdef double z = self.dst.z.data[d_idx]
+
+        # gather search radius
+        cdef double hi2 = self.radius_scale * self.dst.h.data[d_idx]
+        hi2 *= hi2
+
+        cdef long orig_length = nbrs.length
+        cdef double shifts[24]
+        cdef int i, n_images
+
+        if self._use_images:
+            n_images = self._get_image_shifts(x, y, z, shifts)
+            for i in range(n_images):
+                self._find_neighbors_of_point(
+                    x + shifts[3*i], y + shifts[3*i + 1], z + shifts[3*i + 2],
+                    hi2, nbrs, i > 0
+                )
+        else:
+            self._find_neighbors_of_point(x, y, z, hi2, nbrs, False)
+
+        if self.sort_gids:
+            self._sort_neighbors(
+                &nbrs.data[orig_length], nbrs.length - orig_length, s_gid
+            )
+
+    cdef void _find_neighbors_of_point(self, double x, double y, double z,
+            double hi2, UIntArray nbrs, bint check_bounds) nogil:
+        """Append the source particles that are neighbors of the point
+        (x, y, z) with the squared search radius `hi2` to `nbrs`.  Set
+        `check_bounds` for points that may be outside the cells, like the
+        periodic images of the particles.
+
+        With `vectorize` set, the candidates are selected without branches
+        as whether a candidate is a neighbor is hard to predict.
         """
         # Number of cells
         cdef int n_cells = self.n_cells
         cdef int dim = self.dim
+        cdef int* ncells_per_dim = self.ncells_per_dim.data
 
         # cell shifts
         cdef int* shifts = self.cell_shifts.data
@@ -105,14 +202,6 @@ cdef class LinkedListNNPS(NNPS):
         cdef double* s_y = self.src.y.data
         cdef double* s_z = self.src.z.data
         cdef double* s_h = self.src.h.data
-        cdef unsigned int* s_gid = self.src.gid.data
-
-        # Destination particle arrays
-        cdef double* d_x = self.dst.x.data
-        cdef double* d_y = self.dst.y.data
-        cdef double* d_z = self.dst.z.data
-        cdef double* d_h = self.dst.h.data
-        cdef unsigned int* d_gid = self.dst.gid.data
 
         cdef unsigned int* head = self.head.data
         cdef unsigned int* next = self.next.data
@@ -125,21 +214,15 @@ cdef class LinkedListNNPS(NNPS):
         cdef double cell_size = self.cell_size
 
         # locals
-        cdef size_t indexj
         cdef double xij2
-        cdef double hi2, hj2
-        cdef int ierr, nnbrs
+        cdef double hj2
         cdef unsigned int _next
         cdef int ix, iy, iz
 
-        # this is the physical position of the particle that will be
-        # used in pairwise searching
-        cdef double x = d_x[d_idx]
-        cdef double y = d_y[d_idx]
-        cdef double z = d_z[d_idx]
+        cdef bint vectorize = self.vectorize
 
-        # get the un-flattened index for the destination particle with
-        # respect to the minimum
+        # get the un-flattened index for the point with respect to the
+        # minimum
         cdef int _cid_x, _cid_y, _cid_z
         find_cell_id_raw(
             x - xmin[0], y - xmin[1], z - xmin[2],
@@ -147,15 +230,9 @@ cdef class LinkedListNNPS(NNPS):
         )
 
         cdef int cid_x, cid_y, cid_z
-        cdef long cell_index, orig_length
+        cdef long cell_index
         cid_x = cid_y = cid_z = 0
 
-        # gather search radius
-        hi2 = radius_scale * d_h[d_idx]
-        hi2 *= hi2
-
-        orig_length = nbrs.length
-
         # Begin search through neighboring cells
         for ix in range(3):
             for iy in range(3):
@@ -164,33 +241,219 @@ cdef class LinkedListNNPS(NNPS):
                     cid_y = _cid_y + shifts[iy]
                     cid_z = _cid_z + shifts[iz]
 
+                    # The flattened index of a cell outside the cells may
+                    # be that of another cell.
+                    if check_bounds and not (
+                            0 <= cid_x < ncells_per_dim[0] and
+                            0 <= cid_y < ncells_per_dim[1] and
+                            0 <= cid_z < ncells_per_dim[2]):
+                        continue
+
                     # Only consider valid cell indices
                     cell_index = self._get_valid_cell_index(
-                        cid_x, cid_y, cid_z,
-                        self.ncells_per_dim.data, dim, n_cells
+                        cid_x, cid_y, cid_z, ncells_per_dim, dim, n_cells
                     )
                     if cell_index > -1:
 
                         # get the first particle and begin iteration
                         _next = head[ cell_index ]
-                        while( _next != UINT_MAX ):
-                            hj2 = radius_scale * s_h[_next]
-                            hj2 *= hj2
+                        if vectorize:
+                            # Branch-free selection, the candidate is always
+                            # written but only kept if it is a neighbor.
+                            while( _next != UINT_MAX ):
+                                if nbrs.length >= nbrs.alloc:
+                                    nbrs.c_reserve(2*nbrs.length + 16)
+                                hj2 = radius_scale * s_h[_next]
+                                hj2 *= hj2
+                                xij2 = norm2( s_x[_next]-x,
+                                              s_y[_next]-y,
+                                              s_z[_next]-z )
+                                nbrs.data[nbrs.length] = _next
+                                nbrs.length += (xij2 < hi2) | (xij2 < hj2)
+                                _next = next[_next]
+                        else:
+                            while( _next != UINT_MAX ):
+                                hj2 = radius_scale * s_h[_next]
+                                hj2 *= hj2
+
+                                xij2 = norm2( s_x[_next]-x,
+                                              s_y[_next]-y,
+                                              s_z[_next]-z )
+
+                                # select neighbor
+                                if ( (xij2 < hi2) or (xij2 < hj2) ):
+                                    nbrs.c_append(_next)
+
+                                # get the 'next' particle in this cell
+                                _next = next[_next]
+        if vectorize:
+            # Update the length of the numpy array.
+            nbrs.c_resize(nbrs.length)
+
+    cpdef long prepare_cell_query(self) except -1:
+        """Prepare the cell-wise neighbor queries for the current context and
+        return the number of occupied destination cells.
+        """
+        if self.use_cache or self._use_images:
+            return NNPS.prepare_cell_query(self)
 
-                            xij2 = norm2( s_x[_next]-x,
-                                          s_y[_next]-y,
-                                          s_z[_next]-z )
+        cdef UIntArray head = self.heads[self.dst_index]
+        cdef UIntArray dst_cells = self._dst_cells
+        cdef long i
 
-                            # select neighbor
-                            if ( (xij2 < hi2) or (xij2 < hj2) ):
-                                nbrs.c_append(_next)
+        self._dst_head = head
+        self._dst_next = self.nexts[self.dst_index]
+        dst_cells.reset()
+        for i in range(self.n_cells):
+            if head.data[i] != UINT_MAX:
+                dst_cells.c_append(i)
+        return dst_cells.length
+
+    cdef void get_cell_particles(self, long cell, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords) nogil:
+        """Set the destination particles of the given cell and the particles
+        in the source cells around them.
+
+        The candidates are the particles in the cells around the current
+        cell of the first destination particle, see `get_cell_neighbors`.
+        With `vectorize` their coordinates and smoothing lengths are copied
+        to `coords` as four contiguous blocks.
+        """
+        if self.use_cache or self._use_images:
+            NNPS.get_cell_particles(self, cell, dst_indices, candidates, coords)
+            return
 
-                            # get the 'next' particle in this cell
+        cdef unsigned int* dst_head = self._dst_head.data
+        cdef unsigned int* dst_next = self._dst_next.data
+        cdef unsigned int* head = self.head.data
+        cdef unsigned int* next = self.next.data
+        cdef int* shifts = self.cell_shifts.data
+        cdef unsigned int _next
+        cdef int ix, iy, iz
+        cdef int cid[3]
+        cdef long cell_index
+
+        dst_indices.c_reset()
+        _next = dst_head[self._dst_cells.data[cell]]
+        while _next != UINT_MAX:
+            dst_indices.c_append(_next)
+            _next = dst_next[_next]
+
+        candidates.c_reset()
+        self._find_cell(dst_indices.data[0], cid)
+        for ix in range(3):
+            for iy in range(3):
+                for iz in range(3):
+                    cell_index = self._get_valid_cell_index(
+                        cid[0] + shifts[ix], cid[1] + shifts[iy],
+                        cid[2] + shifts[iz],
+                        self.ncells_per_dim.data, self.dim, self.n_cells
+                    )
+                    if cell_index > -1:
+                        _next = head[cell_index]
+                        while _next != UINT_MAX:
+                            candidates.c_append(_next)
                             _next = next[_next]
-        if self.sort_gids:
-            self._sort_neighbors(
-                &nbrs.data[orig_length], nbrs.length - orig_length, s_gid
+
+        if self.vectorize:
+            self._gather_coords(candidates, coords)
+
+    cdef void _gather_coords(self, UIntArray candidates,
+                             DoubleArray coords) nogil:
+        """Copy the x, y, z and h of the candidates to `coords`."""
+        cdef double* s_x = self.src.x.data
+        cdef double* s_y = self.src.y.data
+        cdef double* s_z = self.src.z.data
+        cdef double* s_h = self.src.h.data
+        cdef long i, n = candidates.length
+        cdef unsigned int j
+        cdef double* data
+
+        coords.c_resize(4*n)
+        data = coords.data
+        for i in range(n):
+            j = candidates.data[i]
+            data[i] = s_x[j]
+            data[n + i] = s_y[j]
+            data[2*n + i] = s_z[j]
+            data[3*n + i] = s_h[j]
+
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil:
+        """Find the neighbors of `d_idx` from the candidates of its cell.
+
+        The candidates are in the same order as they are visited by
+        `find_nearest_neighbors` so the neighbors are identical.  A particle
+        that has moved out of the cell of the first particle since it was
+        binned is searched for individually.  With `vectorize` the
+        candidates are filtered in blocks from the contiguous `coords`.
+        """
+        if self.use_cache or self._use_images:
+            NNPS.get_cell_neighbors(
+                self, d_idx, dst_indices, candidates, coords, nbrs
             )
+            return
+
+        cdef double* s_x = self.src.x.data
+        cdef double* s_y = self.src.y.data
+        cdef double* s_z = self.src.z.data
+        cdef double* s_h = self.src.h.data
+        cdef unsigned int* s_gid = self.src.gid.data
+        cdef unsigned int* _candidates = candidates.data
+
+        cdef double x = self.dst.x.data[d_idx]
+        cdef double y = self.dst.y.data[d_idx]
+        cdef double z = self.dst.z.data[d_idx]
+        cdef double radius_scale = self.radius_scale
+        cdef double hi2, hj2, xij2
+        cdef unsigned int j
+        cdef long i
+        cdef int cid[3]
+        cdef int cid0[3]
+        cdef double* c_x = coords.data
+        cdef long nc = candidates.length
+
+        nbrs.c_reset()
+
+        self._find_cell(d_idx, cid)
+        self._find_cell(dst_indices.data[0], cid0)
+        if cid[0] != cid0[0] or cid[1] != cid0[1] or cid[2] != cid0[2]:
+            self.find_nearest_neighbors(d_idx, nbrs)
+            return
+
+        hi2 = radius_scale * self.dst.h.data[d_idx]
+        hi2 *= hi2
+
+        if self.vectorize:
+            for i in range(0, nc, FILTER_BLOCK):
+                _filter_block(
+                    &_candidates[i], &c_x[i], &c_x[nc + i], &c_x[2*nc + i],
+                    &c_x[3*nc + i], min(FILTER_BLOCK, nc - i), x, y, z, hi2,
+                    radius_scale, nbrs
+                )
+        else:
+            for i in range(candidates.length):
+                j = _candidates[i]
+                hj2 = radius_scale * s_h[j]
+                hj2 *= hj2
+
+                xij2 = norm2( s_x[j]-x, s_y[j]-y, s_z[j]-z )
+
+                if ( (xij2 < hi2) or (xij2 < hj2) ):
+                    nbrs.c_append(j)
+
+        if self.sort_gids:
+            self._sort_neighbors(nbrs.data, nbrs.length, s_gid)
+
+    cdef void _find_cell(self, size_t d_idx, int* cid) nogil:
+        """Find the (unflattened) cell of the destination particle."""
+        cdef double* xmin = self.xmin.data
+        find_cell_id_raw(
+            self.dst.x.data[d_idx] - xmin[0], self.dst.y.data[d_idx] - xmin[1],
+            self.dst.z.data[d_idx] - xmin[2], self.cell_size,
+            &cid[0], &cid[1], &cid[2]
+        )
 
     cpdef get_spatially_ordered_indices(self, int pa_index, LongArray indices):
         cdef UIntArray head = self.heads[pa_index]
@@ -255,6 +518,7 @@ cdef class LinkedListNNPS(NNPS):
         # the head and next arrays for this particle array
         cdef UIntArray head = self.heads[ pa_index ]
         cdef UIntArray next = self.nexts[ pa_index ]
+        cdef IntArray cids = self._cids[ pa_index ]
         cdef double cell_size = self.cell_size
 
         cdef UIntArray lindices, gindices
@@ -281,6 +545,92 @@ cdef class LinkedListNNPS(NNPS):
             # insert this particle
             next.data[ i ] = head.data[ _cid ]
             head.data[_cid] = i
+            cids.data[ i ] = _cid
+
+    cdef bint _update_incrementally(self):
+        """Move the particles whose cell has changed since the last update
+        to their new cells.
+
+        The existing cells are reused if their size is still valid for the
+        current smoothing lengths, the number of particles has not changed
+        and every particle is still inside the (padded) cells.  Returns
+        False if the particles must be binned from scratch.
+        """
+        cdef DomainManager domain = self.domain
+        cdef double cell_size = self.cell_size
+        cdef double* xmin = self.xmin.data
+        cdef int* ncells_per_dim = self.ncells_per_dim.data
+        cdef NNPSParticleArrayWrapper pa_wrapper
+        cdef UIntArray head, next
+        cdef IntArray cids, new_cids
+        cdef double *x, *y, *z
+        cdef int i, ix, iy, iz, old_cid, new_cid
+        cdef long j, np
+        cdef unsigned int _prev
+
+        if self.n_cells == 0:
+            return False
+
+        # Larger cells than needed are fine but make the search wasteful.
+        if domain.cell_size > cell_size or \
+           domain.cell_size < (1.0 - self.slack)*cell_size:
+            return False
+
+        # Find the new cells, giving up if any particle has left the grid.
+        for i in range(self.narrays):
+            pa_wrapper = self.pa_wrappers[i]
+            cids = self._cids[i]
+            new_cids = self._new_cids[i]
+            np = pa_wrapper.get_number_of_particles()
+            if np != cids.length:
+                return False
+
+            new_cids.resize(np)
+            x = pa_wrapper.x.data
+            y = pa_wrapper.y.data
+            z = pa_wrapper.z.data
+            for j in range(np):
+                find_cell_id_raw(
+                    x[j] - xmin[0], y[j] - xmin[1], z[j] - xmin[2],
+                    cell_size, &ix, &iy, &iz
+                )
+                if ix < 0 or ix >= ncells_per_dim[0] or \
+                   iy < 0 or iy >= ncells_per_dim[1] or \
+                   iz < 0 or iz >= ncells_per_dim[2]:
+                    return False
+                new_cids.data[j] = flatten_raw(
+                    ix, iy, iz, ncells_per_dim, self.dim
+                )
+
+        # Relink only the particles that have changed cells.
+        self.n_relinked = 0
+        for i in range(self.narrays):
+            head = self.heads[i]
+            next = self.nexts[i]
+            cids = self._cids[i]
+            new_cids = self._new_cids[i]
+            for j in range(cids.length):
+                old_cid = cids.data[j]
+                new_cid = new_cids.data[j]
+                if old_cid == new_cid:
+                    continue
+
+                # remove the particle from its old cell
+                if head.data[old_cid] == j:
+                    head.data[old_cid] = next.data[j]
+                else:
+                    _prev = head.data[old_cid]
+                    while next.data[_prev] != j:
+                        _prev = next.data[_prev]
+                    next.data[_prev] = next.data[j]
+
+                # and insert it into the new one
+                next.data[j] = head.data[new_cid]
+                head.data[new_cid] = j
+                cids.data[j] = new_cid
+                self.n_relinked += 1
+
+        return True
 
     cdef long _get_flattened_cell_index(self, cPoint pnt, double cell_size):
         return flatten(
@@ -347,11 +697,22 @@ cdef class LinkedListNNPS(NNPS):
         cdef NNPSParticleArrayWrapper pa_wrapper
         cdef list heads = self.heads
         cdef list nexts = self.nexts
+        cdef double* xmin = self.xmin.data
+        cdef double* xmax = self.xmax.data
 
         # locals
         cdef int i, j, np
         cdef long _ncells
+        cdef double pad
         cdef UIntArray head, next
+        cdef IntArray cids
+
+        # Pad the bounds so the cells can be reused by _update_incrementally
+        # while the particles move around.
+        for j in range(3):
+            pad = self.slack*(xmax[j] - xmin[j])
+            xmin[j] -= pad
+            xmax[j] += pad
 
         _ncells = self._get_number_of_cells()
 
@@ -367,9 +728,11 @@ cdef class LinkedListNNPS(NNPS):
             # re-size the head and next arrays
             head = <UIntArray>PyList_GetItem(heads, i)
             next = <UIntArray>PyList_GetItem(nexts, i )
+            cids = <IntArray>self._cids[i]
 
             head.resize( _ncells )
             next.resize( np )
+            cids.resize( np )
 
             # UINT_MAX is used to indicate an invalid index
             for j in range(_ncells):
@@ -171,6 +171,7 @@ cdef class DomainManager:
     cdef public int dim
     cdef public bint periodic_in_x, periodic_in_y, periodic_in_z
     cdef public bint is_periodic
+    cdef public bint virtual_images     # Search images instead of ghosts
 
     cdef public list pa_wrappers        # NNPS particle array wrappers
     cdef public int narrays             # number of arrays
@@ -243,11 +244,13 @@ cdef class NeighborCache:
     cdef void **_neighbors
     cdef list _neighbor_arrays
     cdef int _last_avg_nbr_size
+    cdef public bint used             # Neighbors asked for since creation
 
     cdef void get_neighbors_raw(self, size_t d_idx, UIntArray nbrs) nogil
     cpdef get_neighbors(self, int src_index, size_t d_idx, UIntArray nbrs)
     cpdef find_all_neighbors(self)
     cpdef update(self)
+    cpdef add_neighbor_counts(self, UIntArray counts)
 
     cdef void _update_last_avg_nbr_size(self)
     cdef void _find_neighbors(self, long d_idx) nogil
@@ -265,6 +268,10 @@ cdef class NNPSBase:
 
     cdef public DomainManager domain  # Domain manager
     cdef public bint is_periodic      # flag for periodicity
+    cdef bint _use_images             # Search the virtual periodic images
+    cdef double _period[3]            # Periodic length, zero if not periodic
+    cdef double _period_min[3]        # Lower limits of the periodic domain
+    cdef double _period_max[3]        # Upper limits of the periodic domain
 
     cdef public int dim               # Dimensionality of the problem
     cdef public DoubleArray xmin      # co-ordinate min values
@@ -272,6 +279,7 @@ cdef class NNPSBase:
     cdef public double cell_size      # Cell size for binning
     cdef public double hmin           # Minimum h
     cdef public double radius_scale   # Radius scale for kernel
+    cdef public double radius_scale2  # Square of the radius scale
     cdef IntArray cell_shifts         # cell shifts
     cdef public int n_cells           # number of cells
 
@@ -285,6 +293,21 @@ cdef class NNPSBase:
 
     cdef void find_nearest_neighbors(self, size_t d_idx, UIntArray nbrs) nogil
 
+    # Virtual periodic images, see `DomainManager`.
+    cpdef _update_images(self)
+    cdef int _get_image_shifts(self, double x, double y, double z,
+                               double* shifts) nogil
+
+    # Cell-wise neighbor queries for the current context, the destination
+    # particles are visited cell by cell so the candidate neighbors are
+    # gathered once for all the particles of a cell.
+    cpdef long prepare_cell_query(self) except -1
+    cdef void get_cell_particles(self, long cell, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords) nogil
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil
+
     cpdef get_spatially_ordered_indices(self, int pa_index, LongArray indices)
 
     cpdef get_nearest_particles(self, int src_index, int dst_index,
@@ -302,6 +325,14 @@ cdef class NNPS(NNPSBase):
 
     cdef public bint sort_gids        # Sort neighbors by their gids.
 
+    # Verlet list data.
+    cdef public double skin           # Skin as a fraction of the radius
+    cdef double _kernel_radius_scale  # Radius scale without the skin
+    cdef list _x0, _y0, _z0, _h0      # Positions and h at the last rebuild
+    cdef double _hmin0                # Minimum h at the last rebuild
+    cdef bint _rebuild                # Force a rebuild on the next update
+    cdef public long n_rebuilds       # Number of times the lists were built
+
     ##########################################################################
     # Member functions
     ##########################################################################
@@ -320,11 +351,24 @@ cdef class NNPS(NNPSBase):
     # compute the min and max for the particle coordinates
     cdef _compute_bounds(self)
 
+    # Check if the Verlet lists are to be rebuilt.
+    cdef bint _needs_rebuild(self)
+
+    # Save the positions and smoothing lengths used to build the lists.
+    cdef _save_verlet_state(self)
+
+    # Update the binning of the moved particles, False if a rebuild is needed.
+    cdef bint _update_incrementally(self)
+
     cdef void find_nearest_neighbors(self, size_t d_idx, UIntArray nbrs) nogil
 
     cdef void get_nearest_neighbors(self, size_t d_idx,
                                       UIntArray nbrs) nogil
 
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil
+
     # Neighbor query function. Returns the list of neighbors for a
     # requested particle. The returned list is assumed to be of type
     # unsigned int to follow the type of the local and global ids.
@@ -346,6 +390,20 @@ cdef class NNPS(NNPSBase):
 
     cpdef spatially_order_particles(self, int pa_index)
 
+    cpdef get_z_ordered_indices(self, int pa_index, LongArray indices)
+
+    cpdef reorder_particles(self)
+
+    cpdef set_skin(self, double skin)
+
+    cpdef set_context(self, int src_index, int dst_index)
+
+    # Rebuild the neighbor lists on the next update.
+    cpdef force_rebuild(self)
+
+    # Number of neighbors of each destination particle over all sources.
+    cpdef bint get_neighbor_counts(self, int dst_index, UIntArray counts)
+
     # refresh any data structures needed for binning
     cpdef _refresh(self)
 
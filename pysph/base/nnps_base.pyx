@@ -57,6 +57,10 @@ cdef int Ghost = ParticleTAGS.Ghost
 
 ctypedef pair[unsigned int, unsigned int] id_gid_pair_t
 
+cdef extern from "z_order.h":
+    ctypedef unsigned long long uint64_t
+    inline uint64_t get_key(uint64_t i, uint64_t j, uint64_t k) nogil
+
 
 cdef inline bint _compare_gids(id_gid_pair_t x, id_gid_pair_t y) nogil:
     return y.second > x.second
@@ -208,6 +212,13 @@ cpdef UIntArray arange_uint(int start, int stop=-1):
 
     return arange
 
+cdef _copy_double_array(DoubleArray src, DoubleArray dst):
+    """Copy the values of `src` into `dst`, resizing `dst` as needed."""
+    cdef long i
+    dst.resize(src.length)
+    for i in range(src.length):
+        dst.data[i] = src.data[i]
+
 ##############################################################################
 cdef class NNPSParticleArrayWrapper:
     def __init__(self, ParticleArray pa):
@@ -246,10 +257,23 @@ cdef class DomainManager:
     The initial domain limits could be given explicitly or asked to be
     computed from the particle arrays. The domain could be periodic.
 
+    By default, the particles near a periodic boundary are copied (with all
+    their properties) as ghost particles on the other side of the domain
+    on every update.  With `virtual_images`, no particles are copied;
+    instead the NNPS also searches for the neighbors of the periodic images
+    of the particles near the boundaries and the generated code takes the
+    minimum image of `XIJ`.  This requires that the equations only use the
+    relative position of the particles through `XIJ` (and the symbols
+    computed from it) and that the periodic lengths are larger than twice
+    the cell size.  Only the `LinkedListNNPS` and `BoxSortNNPS` support this
+    and it is ignored in parallel where the ghosts are created by the
+    parallel manager.
+
     """
     def __init__(self, double xmin=-1000, double xmax=1000, double ymin=0,
                  double ymax=0, double zmin=0, double zmax=0,
-                 periodic_in_x=False, periodic_in_y=False, periodic_in_z=False):
+                 periodic_in_x=False, periodic_in_y=False, periodic_in_z=False,
+                 virtual_images=False):
         """Constructor"""
         self._check_limits(xmin, xmax, ymin, ymax, zmin, zmax)
 
@@ -262,6 +286,7 @@ cdef class DomainManager:
         self.periodic_in_y = periodic_in_y
         self.periodic_in_z = periodic_in_z
         self.is_periodic = periodic_in_x or periodic_in_y or periodic_in_z
+        self.virtual_images = virtual_images
 
         # get the translates in each coordinate direction
         self.xtranslate = xmax - xmin
@@ -321,7 +346,8 @@ cdef class DomainManager:
             self._box_wrap_periodic()
 
             # create new periodic ghosts
-            self._create_ghosts_periodic()
+            if not self.virtual_images:
+                self._create_ghosts_periodic()
 
     #### Private protocol ###############################################
     cdef _add_to_array(self, DoubleArray arr, double disp):
@@ -744,6 +770,7 @@ cdef class NeighborCache:
         self._cached = IntArray(n_p)
         for i in range(n_p):
             self._cached.data[i] = 0
+        self.used = False
 
         self._last_avg_nbr_size = nnbr
         self._start_stop = UIntArray()
@@ -809,6 +836,18 @@ cdef class NeighborCache:
                 self._last_avg_nbr_size*np/n_threads + safety
             )
 
+    cpdef add_neighbor_counts(self, UIntArray counts):
+        """Add the number of cached neighbors of each destination particle
+        to `counts`.  Particles whose neighbors were not asked for since the
+        last update have none.
+        """
+        cdef size_t i
+        cdef size_t np = min(self._cached.length, counts.length)
+        for i in range(np):
+            if self._cached.data[i] == 1:
+                counts.data[i] += (self._start_stop.data[2*i + 1] -
+                                   self._start_stop.data[2*i])
+
     #### Private protocol ################################################
 
     cdef void _update_last_avg_nbr_size(self):
@@ -836,6 +875,9 @@ cdef class NeighborCache:
 
 ##############################################################################
 cdef class NNPSBase:
+    # Can search the virtual periodic images, see `DomainManager`.
+    supports_virtual_images = False
+
     def __init__(self, int dim, list particles, double radius_scale=2.0,
                  int ghost_layers=1, domain=None, bint cache=False,
                  bint sort_gids=False):
@@ -874,12 +916,19 @@ cdef class NNPSBase:
 
         # radius scale and problem dimensionality.
         self.radius_scale = radius_scale
+        self.radius_scale2 = radius_scale*radius_scale
         self.dim = dim
 
         self.domain = domain
         if domain is None:
             self.domain = DomainManager()
 
+        if self.domain.virtual_images and not self.supports_virtual_images:
+            msg = '%s does not support virtual periodic images.'%(
+                self.__class__.__name__
+            )
+            raise ValueError(msg)
+
         # set the particle array wrappers for the domain manager
         self.domain.set_pa_wrappers(self.pa_wrappers)
 
@@ -903,6 +952,8 @@ cdef class NNPSBase:
         self.xmin = DoubleArray(3)
         self.xmax = DoubleArray(3)
 
+        self._use_images = False
+
     cpdef brute_force_neighbors(self, int src_index, int dst_index,
                                 size_t d_idx, UIntArray nbrs):
         cdef NNPSParticleArrayWrapper src = self.pa_wrappers[src_index]
@@ -930,6 +981,8 @@ cdef class NNPSBase:
 
         cdef double hi = d_h.data[d_idx] * radius_scale # gather radius
         cdef double xj, yj, hj, xij2, xij
+        cdef double dx[3]
+        cdef int k
 
         # reset the neighbors
         nbrs.reset()
@@ -938,9 +991,17 @@ cdef class NNPSBase:
             xj = s_x.data[j]; yj = s_y.data[j]; zj = s_z.data[j];
             hj = radius_scale * s_h.data[j] # scatter radius
 
-            xij2 = (xi - xj)*(xi - xj) + \
-                   (yi - yj)*(yi - yj) + \
-                   (zi - zj)*(zi - zj)
+            dx[0] = xi - xj; dx[1] = yi - yj; dx[2] = zi - zj
+            if self._use_images:
+                # minimum image
+                for k in range(3):
+                    if self._period[k] > 0:
+                        if dx[k] > 0.5*self._period[k]:
+                            dx[k] -= self._period[k]
+                        elif dx[k] < -0.5*self._period[k]:
+                            dx[k] += self._period[k]
+
+            xij2 = dx[0]*dx[0] + dx[1]*dx[1] + dx[2]*dx[2]
             xij = sqrt(xij2)
 
             if ( (xij < hi) or (xij < hj) ):
@@ -978,6 +1039,95 @@ cdef class NNPSBase:
         # Implement this in the subclass to actually do something useful.
         pass
 
+    cpdef _update_images(self):
+        """Setup the search of the virtual periodic images for the current
+        domain, see `DomainManager`.
+        """
+        cdef DomainManager domain = self.domain
+        cdef bint periodic[3]
+        cdef double dmin[3]
+        cdef double dmax[3]
+        cdef int k
+
+        self._use_images = (domain.virtual_images and domain.is_periodic and
+                            not domain.in_parallel)
+        periodic[:] = [domain.periodic_in_x, domain.periodic_in_y,
+                       domain.periodic_in_z]
+        dmin[:] = [domain.xmin, domain.ymin, domain.zmin]
+        dmax[:] = [domain.xmax, domain.ymax, domain.zmax]
+        for k in range(3):
+            self._period_min[k] = dmin[k]
+            self._period_max[k] = dmax[k]
+            self._period[k] = 0.0
+            if self._use_images and periodic[k]:
+                self._period[k] = dmax[k] - dmin[k]
+                if self._period[k] < 2*self.cell_size:
+                    msg = 'The periodic length %s is smaller than twice '\
+                          'the cell size %s.'%(self._period[k], self.cell_size)
+                    raise ValueError(msg)
+
+    cdef int _get_image_shifts(self, double x, double y, double z,
+                               double* shifts) nogil:
+        """Find the shifts of the periodic images of the point (x, y, z) that
+        may have neighbors, i.e. those within a cell size of a periodic
+        boundary.  The shifts are stored as triplets in `shifts` (of size at
+        least 24), the first being zero for the point itself, and their
+        number is returned.
+        """
+        cdef double pos[3]
+        cdef double shift
+        cdef int k, i, j, n = 1
+        pos[0] = x; pos[1] = y; pos[2] = z
+        shifts[0] = shifts[1] = shifts[2] = 0.0
+        for k in range(3):
+            if self._period[k] == 0.0:
+                continue
+            shift = 0.0
+            if pos[k] - self._period_min[k] < self.cell_size:
+                shift = self._period[k]
+            elif self._period_max[k] - pos[k] < self.cell_size:
+                shift = -self._period[k]
+            if shift != 0.0:
+                # Shift all the images found so far, for the corners.
+                for i in range(n):
+                    for j in range(3):
+                        shifts[3*(n + i) + j] = shifts[3*i + j]
+                    shifts[3*(n + i) + k] += shift
+                n *= 2
+        return n
+
+    cpdef long prepare_cell_query(self) except -1:
+        """Prepare the cell-wise neighbor queries for the current context and
+        return the number of destination cells.
+
+        The neighbors of the destination particles can then be found cell
+        by cell with `get_cell_particles` and `get_cell_neighbors`.  By
+        default every destination particle is in a cell of its own.
+        """
+        cdef NNPSParticleArrayWrapper dst = self.pa_wrappers[self.dst_index]
+        return dst.get_number_of_particles()
+
+    cdef void get_cell_particles(self, long cell, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords) nogil:
+        """Set the destination particles of the given cell in `dst_indices`
+        and the candidate neighbors of all these particles in `candidates`.
+        `coords` is scratch space that may be used to store the coordinates
+        of the candidates.
+        """
+        dst_indices.c_reset()
+        dst_indices.c_append(cell)
+        candidates.c_reset()
+
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil:
+        """Set the neighbors of the destination particle `d_idx` of the cell
+        with the given `dst_indices`, `candidates` and `coords` (see
+        `get_cell_particles`) in `nbrs`.
+        """
+        nbrs.c_reset()
+        self.find_nearest_neighbors(d_idx, nbrs)
+
     cpdef get_spatially_ordered_indices(self, int pa_index, LongArray indices):
         raise NotImplementedError("NNPSBase :: get_spatially_ordered_indices called")
 
@@ -986,7 +1136,8 @@ cdef class NNPSBase:
         cdef int idx = dst_index*self.narrays + src_index
         if self.use_cache:
             if self.src_index != src_index \
-                or self.dst_index != dst_index:
+                or self.dst_index != dst_index \
+                or not self.current_cache.used:
                 self.set_context(src_index, dst_index)
             return self.cache[idx].get_neighbors(src_index, d_idx, nbrs)
         else:
@@ -1091,11 +1242,185 @@ cdef class NNPS(NNPSBase):
                 _cache.append(NeighborCache(self, d_idx, s_idx))
         self.cache = _cache
 
+        # Verlet lists are not used by default.
+        self.skin = 0.0
+        self._kernel_radius_scale = radius_scale
+        self._x0 = [DoubleArray() for i in range(self.narrays)]
+        self._y0 = [DoubleArray() for i in range(self.narrays)]
+        self._z0 = [DoubleArray() for i in range(self.narrays)]
+        self._h0 = [DoubleArray() for i in range(self.narrays)]
+        self._hmin0 = 0.0
+        self._rebuild = True
+        self.n_rebuilds = 0
+
     #### Public protocol #################################################
 
     def set_in_parallel(self, bint in_parallel):
         self.domain.in_parallel = in_parallel
 
+    cpdef bint get_neighbor_counts(self, int dst_index, UIntArray counts):
+        """Set `counts` to the number of neighbors of each particle of the
+        destination array over all the source arrays.
+
+        The counts are taken from the neighbor cache, so only the neighbors
+        found since the last update are counted, i.e. those used by the
+        equations.  Without the cache, the neighbors are not searched again
+        and this returns False with all the counts set to zero.
+
+        Parameters
+        ----------
+
+         dst_index: int: the index of the destination particle array.
+         counts: UIntArray: the output, resized to the number of particles.
+        """
+        cdef int src_index
+        cdef size_t d_idx
+        cdef NNPSParticleArrayWrapper dst = self.pa_wrappers[dst_index]
+        cdef size_t np = dst.get_number_of_particles()
+        cdef NeighborCache cache
+
+        counts.resize(np)
+        for d_idx in range(np):
+            counts.data[d_idx] = 0
+
+        if not self.use_cache:
+            return False
+
+        for src_index in range(self.narrays):
+            cache = self.cache[dst_index*self.narrays + src_index]
+            cache.add_neighbor_counts(counts)
+        return True
+
+    cpdef set_skin(self, double skin):
+        """Use persistent (Verlet) neighbor lists with the given skin.
+
+        The neighbors are found within a radius of
+        `radius_scale*(1 + skin)*h` and are cached.  Subsequent calls to
+        `update` only rebuild the lists when the particles have moved (or
+        their smoothing lengths changed) enough that a neighbor may have
+        been missed, i.e. when twice the maximum displacement exceeds the
+        skin.  Setting the skin to zero disables the Verlet lists.  The
+        lists are only built for the source and destination pairs that have
+        been used (see `set_context`), the neighbors of a pair used for the
+        first time are searched directly until the next `update`.
+
+        Note that the neighbors may include particles outside the kernel
+        support, the kernels are zero there but equations that do not use
+        the kernel will see these extra neighbors.  The lists are always
+        rebuilt for serial periodic domains since the ghost particles are
+        added on every update.  In parallel runs, the `ParallelManager` calls
+        `force_rebuild` when it re-distributes the particles, the lists are
+        reused while only the remote data is refreshed.
+
+        Parameters
+        ----------
+
+        skin : double
+            Skin as a fraction of the kernel radius, e.g. 0.1.
+        """
+        if skin < 0:
+            raise ValueError('Skin must be non-negative, got %s.'%skin)
+        self.skin = skin
+        self.radius_scale = self._kernel_radius_scale*(1.0 + skin)
+        self.radius_scale2 = self.radius_scale*self.radius_scale
+        self.domain.set_radius_scale(self.radius_scale)
+        if skin > 0:
+            self.use_cache = True
+        self._rebuild = True
+        self.update_domain()
+        self.update()
+
+    cpdef set_context(self, int src_index, int dst_index):
+        NNPSBase.set_context(self, src_index, dst_index)
+        cdef NeighborCache cache = self.current_cache
+        if self.skin > 0 and not cache.used:
+            # The Verlet lists are only built for the pairs that are used,
+            # this pair is searched directly until the next update.
+            cache.used = True
+            self._rebuild = True
+
+    cpdef spatially_order_particles(self, int pa_index):
+        NNPSBase.spatially_order_particles(self, pa_index)
+        # The particle indices have changed.
+        self._rebuild = True
+
+    cpdef force_rebuild(self):
+        """Rebuild the neighbor lists on the next `update` even if the
+        particles have moved less than the skin.  This must be called when
+        particles are re-ordered, added or removed.
+        """
+        self._rebuild = True
+
+    cpdef get_z_ordered_indices(self, int pa_index, LongArray indices):
+        """Find the permutation that orders the local particles of the given
+        array along a Z-order (Morton) curve of the NNPS cells.
+
+        Non-local (remote and ghost) particles are placed after the local
+        ones, in their current order.
+
+        Parameters
+        ----------
+
+        pa_index: int: the index of the particle array.
+        indices: LongArray: populated with the new order of the particles.
+        """
+        cdef NNPSParticleArrayWrapper pa_wrapper = self.pa_wrappers[pa_index]
+        cdef long i, n = pa_wrapper.get_number_of_particles()
+        cdef double* x = pa_wrapper.x.data
+        cdef double* y = pa_wrapper.y.data
+        cdef double* z = pa_wrapper.z.data
+        cdef int* tag = pa_wrapper.tag.data
+        cdef double xmin = 1e100, ymin = 1e100, zmin = 1e100
+        cdef double cell_size = self.cell_size
+        cdef uint64_t max_key = ~(<uint64_t>0)
+        if cell_size <= 0:
+            cell_size = self.domain.cell_size
+
+        for i in range(n):
+            if tag[i] == Local:
+                xmin = fmin(xmin, x[i])
+                ymin = fmin(ymin, y[i])
+                zmin = fmin(zmin, z[i])
+
+        cdef np.ndarray[np.uint64_t, ndim=1] keys = np.empty(n, dtype=np.uint64)
+        for i in range(n):
+            if tag[i] == Local:
+                keys[i] = get_key(
+                    <uint64_t>((x[i] - xmin)/cell_size),
+                    <uint64_t>((y[i] - ymin)/cell_size),
+                    <uint64_t>((z[i] - zmin)/cell_size)
+                )
+            else:
+                keys[i] = max_key
+
+        # A stable sort keeps the non-local particles in their order.
+        cdef np.ndarray[np.int64_t, ndim=1] order = np.argsort(
+            keys, kind='mergesort'
+        ).astype(np.int64)
+        indices.resize(n)
+        for i in range(n):
+            indices.data[i] = order[i]
+
+    cpdef reorder_particles(self):
+        """Reorder the local particles of all the arrays along a Z-order
+        curve so that particles close in space are also close in memory.
+
+        All the properties are permuted so the global ids stay with their
+        particles.  The NNPS is updated for the new order.
+        """
+        cdef int i
+        cdef LongArray indices = LongArray()
+        cdef BaseArray arr
+        cdef ParticleArray pa
+        for i in range(self.narrays):
+            pa = self.pa_wrappers[i].pa
+            self.get_z_ordered_indices(i, indices)
+            for arr in pa.properties.values():
+                arr.c_align_array(indices)
+
+        self._rebuild = True
+        self.update()
+
     cpdef update(self):
         """Update the local data after particles have moved.
 
@@ -1110,33 +1435,58 @@ cdef class NNPS(NNPSBase):
         particles have moved.
 
         """
-        cdef int i, num_particles
+        cdef int i, j, num_particles, src_index, dst_index
         cdef ParticleArray pa
         cdef UIntArray indices
+        cdef NeighborCache cache
 
         cdef DomainManager domain = self.domain
 
-        # use cell sizes computed by the domain.
-        self.cell_size = domain.cell_size
+        if self.skin > 0 and not self._needs_rebuild():
+            return
+
         self.hmin = domain.hmin
 
-        # compute bounds and refresh the data structure
-        self._compute_bounds()
-        self._refresh()
+        if not self._update_incrementally():
+            # use cell sizes computed by the domain.
+            self.cell_size = domain.cell_size
 
-        # indices on which to bin. We bin all local particles
-        for i in range(self.narrays):
-            pa = self.particles[i]
-            num_particles = pa.get_number_of_particles()
-            indices = arange_uint(num_particles)
+            # compute bounds and refresh the data structure
+            self._compute_bounds()
+            self._refresh()
 
-            # bin the particles
-            self._bin( pa_index=i, indices=indices )
+            # indices on which to bin. We bin all local particles
+            for i in range(self.narrays):
+                pa = self.particles[i]
+                num_particles = pa.get_number_of_particles()
+                indices = arange_uint(num_particles)
+
+                # bin the particles
+                self._bin( pa_index=i, indices=indices )
+
+        self._update_images()
 
         if self.use_cache:
             for cache in self.cache:
                 cache.update()
 
+        if self.skin > 0:
+            # Find all the neighbors of the pairs that have been used now as
+            # the lists are only valid for the current positions.
+            src_index, dst_index = self.src_index, self.dst_index
+            for i in range(self.narrays):
+                for j in range(self.narrays):
+                    cache = self.cache[i*self.narrays + j]
+                    if cache.used:
+                        self.set_context(j, i)
+                        cache.find_all_neighbors()
+            # Restore the context without marking the pair as used.
+            self.src_index, self.dst_index = src_index, dst_index
+            self.current_cache = self.cache[dst_index*self.narrays + src_index]
+            self._save_verlet_state()
+
+        self.n_rebuilds += 1
+
     cdef void get_nearest_neighbors(self, size_t d_idx, UIntArray nbrs) nogil:
         if self.use_cache:
             self.current_cache.get_neighbors_raw(d_idx, nbrs)
@@ -1144,6 +1494,11 @@ cdef class NNPS(NNPSBase):
             nbrs.c_reset()
             self.find_nearest_neighbors(d_idx, nbrs)
 
+    cdef void get_cell_neighbors(self, size_t d_idx, UIntArray dst_indices,
+                                 UIntArray candidates, DoubleArray coords,
+                                 UIntArray nbrs) nogil:
+        self.get_nearest_neighbors(d_idx, nbrs)
+
     #### Private protocol ################################################
 
     cdef void _sort_neighbors(self, unsigned int* nbrs, size_t length,
@@ -1178,6 +1533,71 @@ cdef class NNPS(NNPSBase):
             for i in range(length):
                 nbrs[i] = _data[i].first
 
+    cdef bint _needs_rebuild(self):
+        cdef DomainManager domain = self.domain
+        cdef NNPSParticleArrayWrapper pa_wrapper
+        cdef DoubleArray x0, y0, z0, h0
+        cdef double* x
+        cdef double* y
+        cdef double* z
+        cdef double* h
+        cdef double dx, dy, dz, dr2, dh
+        cdef double dr2_max = 0.0, dh_max = 0.0
+        cdef int i, j, np
+
+        # In parallel, the periodic ghosts are remote particles which are
+        # handled by the ParallelManager.
+        if self._rebuild or (domain.is_periodic and not domain.in_parallel):
+            return True
+
+        for i in range(self.narrays):
+            pa_wrapper = self.pa_wrappers[i]
+            np = pa_wrapper.get_number_of_particles()
+            x0 = self._x0[i]; y0 = self._y0[i]
+            z0 = self._z0[i]; h0 = self._h0[i]
+            if np != x0.length:
+                return True
+            x = pa_wrapper.x.data; y = pa_wrapper.y.data
+            z = pa_wrapper.z.data; h = pa_wrapper.h.data
+            for j in range(np):
+                dx = x[j] - x0.data[j]
+                dy = y[j] - y0.data[j]
+                dz = z[j] - z0.data[j]
+                dr2 = dx*dx + dy*dy + dz*dz
+                dh = fabs(h[j] - h0.data[j])
+                dr2_max = fmax(dr2, dr2_max)
+                dh_max = fmax(dh, dh_max)
+
+        # A pair that was not a neighbor at the last rebuild can only come
+        # within the kernel radius when the combined displacement and
+        # change in the kernel radius exceeds the skin.
+        return (2.0*sqrt(dr2_max) + self._kernel_radius_scale*dh_max >=
+                self._kernel_radius_scale*self.skin*self._hmin0)
+
+    cdef _save_verlet_state(self):
+        cdef NNPSParticleArrayWrapper pa_wrapper
+        cdef double hmin = 1e100
+        cdef int i
+        for i in range(self.narrays):
+            pa_wrapper = self.pa_wrappers[i]
+            _copy_double_array(pa_wrapper.x, self._x0[i])
+            _copy_double_array(pa_wrapper.y, self._y0[i])
+            _copy_double_array(pa_wrapper.z, self._z0[i])
+            _copy_double_array(pa_wrapper.h, self._h0[i])
+            if pa_wrapper.h.length > 0:
+                pa_wrapper.h.update_min_max()
+                hmin = fmin(hmin, pa_wrapper.h.minimum)
+        self._hmin0 = hmin
+        self._rebuild = False
+
+    cdef bint _update_incrementally(self):
+        """Update the existing binning for the particles that have moved.
+
+        Returns False if the particles are to be binned again from scratch,
+        which is all that is done by default.
+        """
+        return False
+
     cpdef _bin(self, int pa_index, UIntArray indices):
         raise NotImplementedError("NNPS :: _bin called")
 
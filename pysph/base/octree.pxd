@@ -29,14 +29,18 @@ cdef struct cOctreeNode:
     int level
 
     int start_index
-    cOctreeNode* children[8]
-    cOctreeNode* parent
+
+    # Indices of the children and the parent in the flat node array of the
+    # tree, -1 if absent.
+    int children[8]
+    int parent
 
 cdef class OctreeNode:
     ##########################################################################
     # Data Attributes
     ##########################################################################
     cdef cOctreeNode* _node
+    cdef Octree _tree
 
     cdef public bint is_leaf
     cdef public double length
@@ -49,7 +53,7 @@ cdef class OctreeNode:
     # Member functions
     ##########################################################################
 
-    cdef void wrap_node(self, cOctreeNode* node)
+    cdef void wrap_node(self, Octree tree, cOctreeNode* node)
 
     cpdef OctreeNode get_parent(self)
 
@@ -64,10 +68,14 @@ cdef class Octree:
     # Data Attributes
     ##########################################################################
     cdef cOctreeNode* root
+    cdef vector[cOctreeNode]* nodes
     cdef vector[cOctreeNode*]* leaf_cells
     cdef u_int* pids
 
-    cdef int _next_pid
+    # scratch space used while building the tree
+    cdef int* _oct_ids
+    cdef u_int* _tmp_pids
+
     cdef public int num_particles
 
     cdef public int leaf_max_particles
@@ -88,15 +96,26 @@ cdef class Octree:
 
     cdef inline void _calculate_domain(self, NNPSParticleArrayWrapper pa)
 
-    cdef inline cOctreeNode* _new_node(self, double* xmin, double length,
-            double hmax = *, int level = *, cOctreeNode* parent = *,
-            int num_particles = *, bint is_leaf = *) nogil
+    cdef inline int _new_node(self, vector[cOctreeNode]* nodes,
+            double* xmin, double length, double hmax = *, int level = *,
+            int parent = *, int num_particles = *, bint is_leaf = *) nogil
+
+    cdef void _compute_oct_ids(self, NNPSParticleArrayWrapper pa, int start,
+            int end, double* xmin, double length, bint use_threads) nogil
+
+    cdef void _sort_by_oct_ids(self, NNPSParticleArrayWrapper pa, int start,
+            int end, int* offsets, double* hmax) nogil
 
-    cdef inline void _delete_tree(self, cOctreeNode* node)
+    cdef bint _c_is_leaf(self, cOctreeNode* node, int num_particles) nogil
+
+    cdef void _c_get_child_domain(self, NNPSParticleArrayWrapper pa,
+            cOctreeNode* node, int oct_id, int start, int end,
+            double* xmin_new, double* length_new) nogil
 
     cdef int _c_build_tree(self, NNPSParticleArrayWrapper pa,
-            vector[u_int]* indices, double* xmin, double length,
-            cOctreeNode* node, int level) nogil
+            vector[cOctreeNode]* nodes, int node_id, int start, int end) nogil
+
+    cdef void _append_nodes(self, vector[cOctreeNode]* nodes, int oct_id)
 
     cdef void _plot_tree(self, OctreeNode node, ax)
 
@@ -130,8 +149,10 @@ cdef class CompressedOctree(Octree):
     # Member functions
     ##########################################################################
 
-    cdef int _c_build_tree(self, NNPSParticleArrayWrapper pa,
-            vector[u_int]* indices, double* xmin, double length,
-            cOctreeNode* node, int level) nogil
+    cdef bint _c_is_leaf(self, cOctreeNode* node, int num_particles) nogil
+
+    cdef void _c_get_child_domain(self, NNPSParticleArrayWrapper pa,
+            cOctreeNode* node, int oct_id, int start, int end,
+            double* xmin_new, double* length_new) nogil
 
 
@@ -3,10 +3,12 @@
 from nnps_base cimport *
 
 from libc.stdlib cimport malloc, free
+from libc.string cimport memcpy
 from libcpp.vector cimport vector
 
 cimport cython
 from cython.operator cimport dereference as deref, preincrement as inc
+from cython.parallel import parallel, prange
 
 import numpy as np
 cimport numpy as np
@@ -64,8 +66,9 @@ cdef class OctreeNode:
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    cdef void wrap_node(self, cOctreeNode* node):
+    cdef void wrap_node(self, Octree tree, cOctreeNode* node):
         self._node = node
+        self._tree = tree
         self.hmax = node.hmax
         self.length = node.length
         self.is_leaf = node.is_leaf
@@ -85,10 +88,10 @@ cdef class OctreeNode:
         parent : OctreeNode
 
         """
-        if self._node.parent == NULL:
+        if self._node.parent == -1:
             return None
         cdef OctreeNode parent = OctreeNode()
-        parent.wrap_node(self._node.parent)
+        parent.wrap_node(self._tree, self._tree.root + self._node.parent)
         return parent
 
     cpdef UIntArray get_indices(self, Octree tree):
@@ -125,9 +128,11 @@ cdef class OctreeNode:
         cdef list py_children = [None for i in range(8)]
         cdef OctreeNode py_node
         for i from 0<=i<8:
-            if self._node.children[i] != NULL:
+            if self._node.children[i] != -1:
                 py_node = OctreeNode()
-                py_node.wrap_node(self._node.children[i])
+                py_node.wrap_node(
+                    self._tree, self._tree.root + self._node.children[i]
+                )
                 py_children[i] = py_node
         return py_children
 
@@ -176,17 +181,26 @@ cdef class OctreeNode:
                 ax.plot(ax_points[:], [y,y], zs=[z,z], color=color)
 
 cdef class Octree:
+    """Octree of the particles of a particle array.
+
+    The nodes are stored contiguously in a flat array (children and parent
+    refer to nodes by index) and the particle indices are sorted in place so
+    that the particles of every node are contiguous, i.e. in the Morton
+    order of the tree.  The subtrees of the root are built in parallel.
+    """
     def __init__(self, int leaf_max_particles):
         self.leaf_max_particles = leaf_max_particles
         self.depth = 0
         self.root = NULL
+        self.nodes = new vector[cOctreeNode]()
         self.leaf_cells = NULL
         self.machine_eps = 16*np.finfo(float).eps
         self.pids = NULL
+        self._oct_ids = NULL
+        self._tmp_pids = NULL
 
     def __dealloc__(self):
-        if self.root != NULL:
-            self._delete_tree(self.root)
+        del self.nodes
         if self.pids != NULL:
             free(self.pids)
         if self.leaf_cells != NULL:
@@ -229,11 +243,12 @@ cdef class Octree:
 
         self.length *= (1 + 2*eps)
 
-    cdef inline cOctreeNode* _new_node(self, double* xmin, double length,
-            double hmax = 0, int level = 0, cOctreeNode* parent = NULL,
-            int num_particles = 0, bint is_leaf = False) nogil:
-        """Create a new cOctreeNode"""
-        cdef cOctreeNode* node = <cOctreeNode*> malloc(sizeof(cOctreeNode))
+    cdef inline int _new_node(self, vector[cOctreeNode]* nodes,
+            double* xmin, double length, double hmax = 0, int level = 0,
+            int parent = -1, int num_particles = 0,
+            bint is_leaf = False) nogil:
+        """Append a new cOctreeNode to the nodes and return its index"""
+        cdef cOctreeNode node
 
         node.xmin[0] = xmin[0]
         node.xmin[1] = xmin[1]
@@ -251,109 +266,164 @@ cdef class Octree:
         cdef int i
 
         for i from 0<=i<8:
-            node.children[i] = NULL
-
-        return node
+            node.children[i] = -1
 
-    cdef inline void _delete_tree(self, cOctreeNode* node):
-        """Delete octree"""
-        cdef int i
-        cdef cOctreeNode* temp[8]
-
-        for i from 0<=i<8:
-            temp[i] = node.children[i]
-
-        free(node)
-
-        for i from 0<=i<8:
-            if temp[i] == NULL:
-                continue
-            self._delete_tree(temp[i])
+        nodes.push_back(node)
+        return nodes.size() - 1
 
     @cython.cdivision(True)
-    cdef int _c_build_tree(self, NNPSParticleArrayWrapper pa,
-            vector[u_int]* indices, double* xmin, double length,
-            cOctreeNode* node, int level) nogil:
+    cdef void _compute_oct_ids(self, NNPSParticleArrayWrapper pa, int start,
+            int end, double* xmin, double length, bint use_threads) nogil:
+        """Find the octant of the node (with the given xmin and length) of
+        each of the particles pids[start:end].
+        """
         cdef double* src_x_ptr = pa.x.data
         cdef double* src_y_ptr = pa.y.data
         cdef double* src_z_ptr = pa.z.data
+
+        cdef int p, i, j, k
+        cdef u_int q
+
+        if use_threads:
+            for p in prange(start, end):
+                q = self.pids[p]
+                self._oct_ids[p] = (
+                    real_to_int(src_z_ptr[q] - xmin[2], length/2) +
+                    2*real_to_int(src_y_ptr[q] - xmin[1], length/2) +
+                    4*real_to_int(src_x_ptr[q] - xmin[0], length/2)
+                )
+        else:
+            for p from start<=p<end:
+                q = self.pids[p]
+                find_cell_id_raw(
+                        src_x_ptr[q] - xmin[0],
+                        src_y_ptr[q] - xmin[1],
+                        src_z_ptr[q] - xmin[2],
+                        length/2,
+                        &i, &j, &k
+                        )
+                self._oct_ids[p] = k+2*j+4*i
+
+    cdef void _sort_by_oct_ids(self, NNPSParticleArrayWrapper pa, int start,
+            int end, int* offsets, double* hmax) nogil:
+        """Stable counting sort of pids[start:end] on the octants found by
+        `_compute_oct_ids`.  The particles of octant i are then
+        pids[offsets[i]:offsets[i+1]] and their maximum h is hmax[i].
+        """
         cdef double* src_h_ptr = pa.h.data
+        cdef int counts[8]
+        cdef int p, oct_id
+        cdef u_int q
 
-        cdef double xmin_new[3]
-        cdef double hmax_children[8]
-        cdef int depth_child = 0
-        cdef int depth_max = 0
+        for oct_id from 0<=oct_id<8:
+            counts[oct_id] = 0
+            hmax[oct_id] = 0
 
-        cdef int i, j, k
-        cdef u_int p, q
+        for p from start<=p<end:
+            oct_id = self._oct_ids[p]
+            counts[oct_id] += 1
+            hmax[oct_id] = fmax(hmax[oct_id], src_h_ptr[self.pids[p]])
 
-        for i from 0<=i<8:
-            hmax_children[i] = 0
+        offsets[0] = start
+        for oct_id from 0<=oct_id<8:
+            offsets[oct_id + 1] = offsets[oct_id] + counts[oct_id]
+            counts[oct_id] = offsets[oct_id]
 
-        cdef int oct_id
+        for p from start<=p<end:
+            oct_id = self._oct_ids[p]
+            self._tmp_pids[counts[oct_id]] = self.pids[p]
+            counts[oct_id] += 1
 
+        memcpy(self.pids + start, self._tmp_pids + start,
+               (end - start)*sizeof(u_int))
+
+    cdef bint _c_is_leaf(self, cOctreeNode* node, int num_particles) nogil:
         # This is required to fix floating point errors. One such case
         # is mentioned in pysph.base.tests.test_octree
-        cdef double eps = 2*self._get_eps(length, xmin)
-
-        if (indices.size() < self.leaf_max_particles) or (eps > EPS_MAX):
-            copy(indices.begin(), indices.end(), self.pids + self._next_pid)
-            node.start_index = self._next_pid
-            self._next_pid += indices.size()
-            node.num_particles = indices.size()
-            del indices
-            node.is_leaf = True
-            return 1
+        cdef double eps = 2*self._get_eps(node.length, node.xmin)
+        return (num_particles < self.leaf_max_particles) or (eps > EPS_MAX)
 
-        cdef vector[u_int]* new_indices[8]
-        for i from 0<=i<8:
-            new_indices[i] = new vector[u_int]()
+    @cython.cdivision(True)
+    cdef void _c_get_child_domain(self, NNPSParticleArrayWrapper pa,
+            cOctreeNode* node, int oct_id, int start, int end,
+            double* xmin_new, double* length_new) nogil:
+        """Find the xmin and length of the given octant of the node which
+        has the particles pids[start:end].
+        """
+        cdef double length = node.length
+        cdef double eps = 2*self._get_eps(length, node.xmin)
+        cdef int i = oct_id/4
+        cdef int j = (oct_id/2)%2
+        cdef int k = oct_id%2
 
-        for p from 0<=p<indices.size():
-            q = deref(indices)[p]
+        xmin_new[0] = node.xmin[0] + (i - eps)*length/2
+        xmin_new[1] = node.xmin[1] + (j - eps)*length/2
+        xmin_new[2] = node.xmin[2] + (k - eps)*length/2
 
-            find_cell_id_raw(
-                    src_x_ptr[q] - xmin[0],
-                    src_y_ptr[q] - xmin[1],
-                    src_z_ptr[q] - xmin[2],
-                    length/2,
-                    &i, &j, &k
-                    )
+        length_new[0] = (length/2)*(1 + 2*eps)
 
-            oct_id = k+2*j+4*i
+    cdef int _c_build_tree(self, NNPSParticleArrayWrapper pa,
+            vector[cOctreeNode]* nodes, int node_id, int start, int end) nogil:
+        """Build the subtree of the node nodes[node_id] which has the
+        particles pids[start:end] and return its depth.
+        """
+        cdef cOctreeNode* node = &deref(nodes)[node_id]
+        cdef int level = node.level
 
-            (new_indices[oct_id]).push_back(q)
-            hmax_children[oct_id] = fmax(hmax_children[oct_id], src_h_ptr[q])
+        cdef double xmin_new[3]
+        cdef double length_new = 0
+        cdef double hmax_children[8]
+        cdef int offsets[9]
+        cdef int depth_child = 0
+        cdef int depth_max = 0
+        cdef int oct_id, child_id
 
-        cdef double length_padded = (length/2)*(1 + 2*eps)
+        if self._c_is_leaf(node, end - start):
+            node.start_index = start
+            node.num_particles = end - start
+            node.is_leaf = True
+            return 1
 
-        del indices
+        self._compute_oct_ids(pa, start, end, node.xmin, node.length, False)
+        self._sort_by_oct_ids(pa, start, end, offsets, hmax_children)
 
-        for i from 0<=i<2:
-            for j from 0<=j<2:
-                for k from 0<=k<2:
+        for oct_id from 0<=oct_id<8:
+            if offsets[oct_id] == offsets[oct_id + 1]:
+                continue
 
-                    oct_id = k+2*j+4*i
+            # The node may move when a new node is added to the array.
+            self._c_get_child_domain(pa, &deref(nodes)[node_id], oct_id,
+                    offsets[oct_id], offsets[oct_id + 1], xmin_new,
+                    &length_new)
 
-                    if new_indices[oct_id].empty():
-                        del new_indices[oct_id]
-                        continue
+            child_id = self._new_node(nodes, xmin_new, length_new,
+                    hmax=hmax_children[oct_id], level=level+1, parent=node_id)
+            deref(nodes)[node_id].children[oct_id] = child_id
 
-                    xmin_new[0] = xmin[0] + (i - eps)*length/2
-                    xmin_new[1] = xmin[1] + (j - eps)*length/2
-                    xmin_new[2] = xmin[2] + (k - eps)*length/2
+            depth_child = self._c_build_tree(pa, nodes, child_id,
+                    offsets[oct_id], offsets[oct_id + 1])
 
-                    eps_new = 2*self._get_eps(length_padded, xmin_new)
+            depth_max = <int>fmax(depth_max, depth_child)
 
-                    node.children[oct_id] = self._new_node(xmin_new, length_padded,
-                            hmax=hmax_children[oct_id], level=level+1, parent=node)
+        return 1 + depth_max
 
-                    depth_child = self._c_build_tree(pa, new_indices[oct_id],
-                            xmin_new, length_padded, node.children[oct_id], level+1)
+    cdef void _append_nodes(self, vector[cOctreeNode]* nodes, int oct_id):
+        """Append the subtree of the given octant of the root, built
+        separately with its root at nodes[0], to the nodes of the tree.
+        """
+        cdef int offset = self.nodes.size()
+        cdef int i, n
+        cdef cOctreeNode node
 
-                    depth_max = <int>fmax(depth_max, depth_child)
+        for n from 0<=n<nodes.size():
+            node = deref(nodes)[n]
+            for i from 0<=i<8:
+                if node.children[i] != -1:
+                    node.children[i] += offset
+            node.parent = 0 if node.parent == -1 else node.parent + offset
+            self.nodes.push_back(node)
 
-        return 1 + depth_max
+        deref(self.nodes)[0].children[oct_id] = offset
 
     cdef void _plot_tree(self, OctreeNode node, ax):
         node.plot(ax)
@@ -373,8 +443,8 @@ cdef class Octree:
 
         cdef int i
         for i from 0<=i<8:
-            if node.children[i] != NULL:
-                self._c_get_leaf_cells(node.children[i])
+            if node.children[i] != -1:
+                self._c_get_leaf_cells(self.root + node.children[i])
 
 
     #### Public protocol ################################################
@@ -384,29 +454,78 @@ cdef class Octree:
         self._calculate_domain(pa_wrapper)
 
         cdef int num_particles = pa_wrapper.get_number_of_particles()
-        cdef vector[u_int]* indices_ptr = new vector[u_int]()
+        cdef vector[cOctreeNode]* octant_nodes[8]
+        cdef double xmin_new[3]
+        cdef double length_new = 0
+        cdef double hmax_children[8]
+        cdef int offsets[9]
+        cdef int depths[8]
+        cdef int i, oct_id
 
         self.num_particles = num_particles
 
-        cdef int i
-        for i from 0<=i<num_particles:
-            indices_ptr.push_back(i)
-
-        if self.root != NULL:
-            self._delete_tree(self.root)
         if self.pids != NULL:
             free(self.pids)
         if self.leaf_cells != NULL:
             del self.leaf_cells
+            self.leaf_cells = NULL
 
         self.pids = <u_int*> malloc(num_particles*sizeof(u_int))
-        self._next_pid = 0
+        for i from 0<=i<num_particles:
+            self.pids[i] = i
 
-        self.root = self._new_node(self.xmin, self.length,
+        self.nodes.clear()
+        self._new_node(self.nodes, self.xmin, self.length,
                 hmax=self.hmax, level=0)
+        self.root = &deref(self.nodes)[0]
+
+        if self._c_is_leaf(self.root, num_particles):
+            self.depth = self._c_build_tree(pa_wrapper, self.nodes, 0, 0,
+                    num_particles)
+            return self.depth
+
+        self._oct_ids = <int*> malloc(num_particles*sizeof(int))
+        self._tmp_pids = <u_int*> malloc(num_particles*sizeof(u_int))
+
+        # Split the root into its octants and build their subtrees in
+        # parallel, each into its own array of nodes.
+        with nogil:
+            self._compute_oct_ids(pa_wrapper, 0, num_particles,
+                    self.root.xmin, self.root.length, True)
+        self._sort_by_oct_ids(pa_wrapper, 0, num_particles, offsets,
+                hmax_children)
+
+        for oct_id from 0<=oct_id<8:
+            depths[oct_id] = 0
+            octant_nodes[oct_id] = new vector[cOctreeNode]()
+            if offsets[oct_id] == offsets[oct_id + 1]:
+                continue
+            self._c_get_child_domain(pa_wrapper, self.root, oct_id,
+                    offsets[oct_id], offsets[oct_id + 1], xmin_new,
+                    &length_new)
+            self._new_node(octant_nodes[oct_id], xmin_new, length_new,
+                    hmax=hmax_children[oct_id], level=1)
+
+        with nogil, parallel():
+            for oct_id in prange(8, schedule='dynamic', chunksize=1):
+                if offsets[oct_id] < offsets[oct_id + 1]:
+                    depths[oct_id] = self._c_build_tree(pa_wrapper,
+                            octant_nodes[oct_id], 0, offsets[oct_id],
+                            offsets[oct_id + 1])
+
+        self.depth = 0
+        for oct_id from 0<=oct_id<8:
+            if not octant_nodes[oct_id].empty():
+                self._append_nodes(octant_nodes[oct_id], oct_id)
+            del octant_nodes[oct_id]
+            self.depth = max(self.depth, 1 + depths[oct_id])
+
+        self.root = &deref(self.nodes)[0]
 
-        self.depth = self._c_build_tree(pa_wrapper, indices_ptr, self.root.xmin,
-                self.root.length, self.root, 0)
+        free(self._oct_ids)
+        free(self._tmp_pids)
+        self._oct_ids = NULL
+        self._tmp_pids = NULL
 
         return self.depth
 
@@ -421,9 +540,11 @@ cdef class Octree:
     cdef cOctreeNode* c_find_point(self, double x, double y, double z):
         cdef cOctreeNode* node = self.root
         cdef cOctreeNode* prev = self.root
+        cdef int node_id = 0
 
         cdef int i, j, k, oct_id
-        while node != NULL:
+        while node_id != -1:
+            node = self.root + node_id
             find_cell_id_raw(
                     x - node.xmin[0],
                     y - node.xmin[1],
@@ -434,7 +555,7 @@ cdef class Octree:
 
             oct_id = k+2*j+4*i
             prev = node
-            node = node.children[oct_id]
+            node_id = node.children[oct_id]
 
         return prev
 
@@ -460,8 +581,7 @@ cdef class Octree:
 
     cpdef delete_tree(self):
         """ Delete tree"""
-        if self.root != NULL:
-            self._delete_tree(self.root)
+        self.nodes.clear()
         if self.leaf_cells != NULL:
             del self.leaf_cells
         self.root = NULL
@@ -478,7 +598,7 @@ cdef class Octree:
 
         """
         cdef OctreeNode py_node = OctreeNode()
-        py_node.wrap_node(self.root)
+        py_node.wrap_node(self, self.root)
         return py_node
 
     cpdef list get_leaf_cells(self):
@@ -495,7 +615,8 @@ cdef class Octree:
         cdef int i
         cdef list py_leaf_cells = [OctreeNode() for i in range(self.leaf_cells.size())]
         for i from 0<=i<self.leaf_cells.size():
-            (<OctreeNode>py_leaf_cells[i]).wrap_node(deref(self.leaf_cells)[i])
+            (<OctreeNode>py_leaf_cells[i]).wrap_node(self,
+                    deref(self.leaf_cells)[i])
         return py_leaf_cells
 
     cpdef OctreeNode find_point(self, double x, double y, double z):
@@ -516,7 +637,7 @@ cdef class Octree:
         """
         cdef cOctreeNode* node = self.c_find_point(x, y, z)
         cdef OctreeNode py_node = OctreeNode()
-        py_node.wrap_node(node)
+        py_node.wrap_node(self, node)
         return py_node
 
     cpdef plot(self, ax):
@@ -537,113 +658,45 @@ cdef class CompressedOctree(Octree):
         Octree.__init__(self, leaf_max_particles)
         self.dbl_max = np.finfo(float).max
 
-    @cython.cdivision(True)
-    cdef int _c_build_tree(self, NNPSParticleArrayWrapper pa,
-            vector[u_int]* indices, double* xmin, double length,
-            cOctreeNode* node, int level) nogil:
+    cdef bint _c_is_leaf(self, cOctreeNode* node, int num_particles) nogil:
+        return num_particles < self.leaf_max_particles
+
+    cdef void _c_get_child_domain(self, NNPSParticleArrayWrapper pa,
+            cOctreeNode* node, int oct_id, int start, int end,
+            double* xmin_new, double* length_new) nogil:
+        """The child is the bounding box of its particles pids[start:end]."""
         cdef double* src_x_ptr = pa.x.data
         cdef double* src_y_ptr = pa.y.data
         cdef double* src_z_ptr = pa.z.data
-        cdef double* src_h_ptr = pa.h.data
-
-        cdef double xmin_new[8][3]
-        cdef double xmax_new[8][3]
-        cdef double length_new = 0
-        cdef double hmax_children[8]
-
-        cdef int depth_child = 0
-        cdef int depth_max = 0
-
-        cdef int i, j, k
-        cdef u_int p, q
-
-        for i from 0<=i<8:
-            hmax_children[i] = 0
-            for j from 0<=j<3:
-                xmin_new[i][j] = self.dbl_max
-                xmax_new[i][j] = -self.dbl_max
-
-        cdef int oct_id
-
-        if (indices.size() < self.leaf_max_particles):
-            copy(indices.begin(), indices.end(), self.pids + self._next_pid)
-            node.start_index = self._next_pid
-            self._next_pid += indices.size()
-            node.num_particles = indices.size()
-            del indices
-            node.is_leaf = True
-            return 1
 
-        cdef vector[u_int]* new_indices[8]
-        for i from 0<=i<8:
-            new_indices[i] = new vector[u_int]()
-
-        cdef double* xmin_current
-        cdef double* xmax_current
-
-        for p from 0<=p<indices.size():
-            q = deref(indices)[p]
-
-            find_cell_id_raw(
-                    src_x_ptr[q] - xmin[0],
-                    src_y_ptr[q] - xmin[1],
-                    src_z_ptr[q] - xmin[2],
-                    length/2,
-                    &i, &j, &k
-                    )
-
-            oct_id = k+2*j+4*i
-
-            (new_indices[oct_id]).push_back(q)
-
-            xmin_current = xmin_new[oct_id]
-            xmax_current = xmax_new[oct_id]
-
-            hmax_children[oct_id] = fmax(hmax_children[oct_id], src_h_ptr[q])
-            xmin_current[0] = fmin(xmin_current[0], src_x_ptr[q])
-            xmin_current[1] = fmin(xmin_current[1], src_y_ptr[q])
-            xmin_current[2] = fmin(xmin_current[2], src_z_ptr[q])
+        cdef double xmax_new[3]
+        cdef int j, p
+        cdef u_int q
 
-            xmax_current[0] = fmax(xmax_current[0], src_x_ptr[q])
-            xmax_current[1] = fmax(xmax_current[1], src_y_ptr[q])
-            xmax_current[2] = fmax(xmax_current[2], src_z_ptr[q])
+        for j from 0<=j<3:
+            xmin_new[j] = self.dbl_max
+            xmax_new[j] = -self.dbl_max
 
-        cdef double x_length, y_length, z_length
-        cdef double length_padded
-        cdef double eps
+        for p from start<=p<end:
+            q = self.pids[p]
+            xmin_new[0] = fmin(xmin_new[0], src_x_ptr[q])
+            xmin_new[1] = fmin(xmin_new[1], src_y_ptr[q])
+            xmin_new[2] = fmin(xmin_new[2], src_z_ptr[q])
 
-        del indices
+            xmax_new[0] = fmax(xmax_new[0], src_x_ptr[q])
+            xmax_new[1] = fmax(xmax_new[1], src_y_ptr[q])
+            xmax_new[2] = fmax(xmax_new[2], src_z_ptr[q])
 
-        for i from 0<=i<8:
-            if new_indices[i].empty():
-                del new_indices[i]
-                continue
-
-            xmin_current = xmin_new[i]
-            xmax_current = xmax_new[i]
-
-            x_length = xmax_current[0] - xmin_current[0]
-            y_length = xmax_current[1] - xmin_current[1]
-            z_length = xmax_current[2] - xmin_current[2]
-
-            length_new = fmax(x_length, fmax(y_length, z_length))
-
-            eps = self._get_eps(length_new, xmin_current)
+        cdef double x_length = xmax_new[0] - xmin_new[0]
+        cdef double y_length = xmax_new[1] - xmin_new[1]
+        cdef double z_length = xmax_new[2] - xmin_new[2]
 
-            length_padded = length_new*(1 + 2*eps)
+        cdef double length = fmax(x_length, fmax(y_length, z_length))
 
-            xmin_current[0] -= length_new*eps
-            xmin_current[1] -= length_new*eps
-            xmin_current[2] -= length_new*eps
-
-            node.children[i] = self._new_node(xmin_current, length_padded,
-                    hmax=hmax_children[i], level=level+1, parent=node)
-
-            depth_child = self._c_build_tree(pa, new_indices[i],
-                    xmin_current, length_padded, node.children[i], level+1)
-
-            depth_max = <int>fmax(depth_max, depth_child)
-
-        return 1 + depth_max
+        cdef double eps = self._get_eps(length, xmin_new)
 
+        length_new[0] = length*(1 + 2*eps)
 
+        xmin_new[0] -= length*eps
+        xmin_new[1] -= length*eps
+        xmin_new[2] -= length*eps
@@ -24,7 +24,6 @@ cdef class OctreeNNPS(NNPS):
     cdef cOctreeNode* current_tree
     cdef u_int* current_pids
 
-    cdef double radius_scale2
     cdef NNPSParticleArrayWrapper dst, src
     cdef int leaf_max_particles
 
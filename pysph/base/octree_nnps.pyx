@@ -138,11 +138,11 @@ cdef class OctreeNNPS(NNPS):
             return
 
         for i from 0<=i<8:
-            if node.children[i] == NULL:
+            if node.children[i] == -1:
                 continue
             self._get_neighbors(q_x, q_y, q_z, q_h,
                     src_x_ptr, src_y_ptr, src_z_ptr, src_h_ptr,
-                    nbrs, node.children[i])
+                    nbrs, self.current_tree + node.children[i])
 
     cpdef get_spatially_ordered_indices(self, int pa_index, LongArray indices):
         indices.reset()
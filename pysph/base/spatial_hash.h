@@ -40,6 +40,11 @@ public:
         return this->key;
     }
 
+    inline void set_key(long long int key)
+    {
+        this->key = key;
+    }
+
     inline vector <unsigned int> *get_indices()
     {
         return &this->indices;
@@ -52,18 +57,27 @@ public:
     }
 };
 
+// A hash table of cells with separate chaining.  The table grows (and all
+// the cells are rehashed) when the number of cells per bucket exceeds
+// max_load_factor, a non-positive max_load_factor keeps the size fixed.
 class HashTable
 {
 private:
     HashEntry** hashtable;
 public:
     long long int table_size;
-    
-    HashTable(long long int table_size)
+    long long int n_entries;
+    int n_resizes;
+    double max_load_factor;
+
+    HashTable(long long int table_size, double max_load_factor=1.0)
     {
         this->table_size = table_size;
+        this->n_entries = 0;
+        this->n_resizes = 0;
+        this->max_load_factor = max_load_factor;
         this->hashtable = new HashEntry*[table_size];
-        for(int i=0; i<table_size; i++)
+        for(long long int i=0; i<table_size; i++)
         {
             this->hashtable[i] = NULL;
         }
@@ -95,7 +109,48 @@ public:
                 this->hashtable[key] = entry;
             else
                 prev->next = entry;
+            this->n_entries++;
+            if(this->max_load_factor > 0 &&
+               this->n_entries > this->max_load_factor*this->table_size)
+                this->resize(2*this->table_size);
+        }
+    }
+
+    // Change the number of buckets and rehash all the cells.  The order of
+    // the cells in a chain is preserved.
+    void resize(long long int table_size)
+    {
+        HashEntry** old_table = this->hashtable;
+        long long int old_size = this->table_size;
+        HashEntry** tails = new HashEntry*[table_size];
+        this->table_size = table_size;
+        this->hashtable = new HashEntry*[table_size];
+        for(long long int i=0; i<table_size; i++)
+        {
+            this->hashtable[i] = NULL;
+            tails[i] = NULL;
+        }
+        for(long long int i=0; i<old_size; i++)
+        {
+            HashEntry* entry = old_table[i];
+            while(entry!=NULL)
+            {
+                HashEntry* next = entry->next;
+                long long int key = this->hash(entry->c_x, entry->c_y,
+                                               entry->c_z);
+                entry->set_key(key);
+                entry->next = NULL;
+                if(tails[key]==NULL)
+                    this->hashtable[key] = entry;
+                else
+                    tails[key]->next = entry;
+                tails[key] = entry;
+                entry = next;
+            }
         }
+        delete[] tails;
+        delete[] old_table;
+        this->n_resizes++;
     }
 
     HashEntry* get(int i, int j, int k)
@@ -115,7 +170,7 @@ public:
     {
         HashEntry* curr = NULL;
         int num_particles = 0;
-        for(int i=0; i<this->table_size; i++)
+        for(long long int i=0; i<this->table_size; i++)
         {
             curr = this->hashtable[i];
             while(curr!=NULL)
@@ -127,9 +182,37 @@ public:
         return num_particles;
     }
 
+    long long int number_of_used_buckets()
+    {
+        long long int n_used = 0;
+        for(long long int i=0; i<this->table_size; i++)
+        {
+            if(this->hashtable[i]!=NULL)
+                n_used++;
+        }
+        return n_used;
+    }
+
+    int max_chain_length()
+    {
+        int max_length = 0;
+        for(long long int i=0; i<this->table_size; i++)
+        {
+            int length = 0;
+            HashEntry* curr = this->hashtable[i];
+            while(curr!=NULL)
+            {
+                length++;
+                curr = curr->next;
+            }
+            max_length = max(max_length, length);
+        }
+        return max_length;
+    }
+
     ~HashTable()
     {
-        for(int i=0; i<this->table_size; i++)
+        for(long long int i=0; i<this->table_size; i++)
         {
             HashEntry* entry = this->hashtable[i];
             while(entry!=NULL)
@@ -10,9 +10,17 @@ cdef extern from "spatial_hash.h":
         vector[unsigned int] *get_indices() nogil
 
     cdef cppclass HashTable:
-        HashTable(long long int) nogil except +
+        long long int table_size
+        long long int n_entries
+        int n_resizes
+
+        HashTable(long long int, double) nogil except +
         void add(int, int, int, int, double) nogil
         HashEntry* get(int, int, int) nogil
+        long long int number_of_used_buckets() nogil
+        int max_chain_length() nogil
+
+cdef dict get_hash_table_statistics(HashTable* table)
 
 # NNPS using Spatial Hashing algorithm
 cdef class SpatialHashNNPS(NNPS):
@@ -20,7 +28,7 @@ cdef class SpatialHashNNPS(NNPS):
     # Data Attributes
     ############################################################################
     cdef long long int table_size               # Size of hashtable
-    cdef double radius_scale2
+    cdef public double max_load_factor          # Cells per bucket to resize
 
     cdef HashTable** hashtable
     cdef HashTable* current_hash
@@ -41,6 +49,8 @@ cdef class SpatialHashNNPS(NNPS):
     cdef inline int _neighbor_boxes(self, int i, int j, int k,
             int* x, int* y, int* z) nogil
 
+    cpdef dict get_hash_statistics(self, int pa_index)
+
     cpdef _refresh(self)
 
     cpdef _bin(self, int pa_index, UIntArray indices)
@@ -51,7 +61,7 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
     # Data Attributes
     ############################################################################
     cdef long long int table_size               # Size of hashtable
-    cdef double radius_scale2
+    cdef public double max_load_factor          # Cells per bucket to resize
 
     cdef HashTable** hashtable
     cdef HashTable* current_hash
@@ -80,6 +90,8 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
     cdef inline void _add_to_hashtable(self, int hash_id, unsigned int pid, double h,
             int i, int j, int k) nogil
 
+    cpdef dict get_hash_statistics(self, int pa_index)
+
     cpdef _refresh(self)
 
     cpdef _bin(self, int pa_index, UIntArray indices)
@@ -14,12 +14,36 @@ IF UNAME_SYSNAME == "Windows":
         return x if x > y else y
 
 
+cdef dict get_hash_table_statistics(HashTable* table):
+    """Return the occupancy of the given hash table as a dictionary.
+
+    The keys are the ``table_size`` (number of buckets), ``n_cells`` (the
+    number of cells stored), ``load_factor`` (cells per bucket),
+    ``n_collisions`` (the cells not first in their bucket),
+    ``max_chain_length``, ``mean_chain_length`` (over the used buckets) and
+    ``n_resizes``.
+    """
+    cdef long long int n_used = table.number_of_used_buckets()
+    cdef long long int n_cells = table.n_entries
+    return dict(
+        table_size=table.table_size, n_cells=n_cells,
+        load_factor=float(n_cells)/table.table_size,
+        n_collisions=n_cells - n_used,
+        max_chain_length=table.max_chain_length(),
+        mean_chain_length=float(n_cells)/n_used if n_used > 0 else 0.0,
+        n_resizes=table.n_resizes
+    )
+
+
 #############################################################################
 cdef class SpatialHashNNPS(NNPS):
 
     """Nearest neighbor particle search using Spatial Hashing algorithm
 
     Uses a hashtable to store particles according to cell it belongs to.
+    The table is enlarged when the number of cells per bucket exceeds
+    `max_load_factor` (a non-positive value keeps `table_size` fixed), see
+    `get_hash_statistics`.
 
     Ref. http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.105.6732&rep=rep1&type=pdf
     """
@@ -27,7 +51,8 @@ cdef class SpatialHashNNPS(NNPS):
     def __init__(self, int dim, list particles, double radius_scale = 2.0,
             int ghost_layers = 1, domain=None,
             bint fixed_h = False, bint cache = False,
-            bint sort_gids = False, long long int table_size = 131072):
+            bint sort_gids = False, long long int table_size = 131072,
+            double max_load_factor = 1.0):
         #Initialize base class
         NNPS.__init__(
             self, dim, particles, radius_scale, ghost_layers, domain,
@@ -43,18 +68,20 @@ cdef class SpatialHashNNPS(NNPS):
     def __cinit__(self, int dim, list particles, double radius_scale = 2.0,
             int ghost_layers = 1, domain=None,
             bint fixed_h = False, bint cache = False,
-            bint sort_gids = False, long long int table_size = 131072):
+            bint sort_gids = False, long long int table_size = 131072,
+            double max_load_factor = 1.0):
 
         cdef int narrays = len(particles)
 
         self.table_size = table_size
+        self.max_load_factor = max_load_factor
         self.radius_scale2 = radius_scale*radius_scale
 
         self.hashtable = <HashTable**> malloc(narrays*sizeof(HashTable*))
 
         cdef int i
         for i from 0<=i<narrays:
-            self.hashtable[i] = new HashTable(table_size)
+            self.hashtable[i] = new HashTable(table_size, max_load_factor)
 
         self.current_hash = NULL
 
@@ -159,6 +186,12 @@ cdef class SpatialHashNNPS(NNPS):
             )
 
 
+    cpdef dict get_hash_statistics(self, int pa_index):
+        """Return the occupancy and collision statistics of the hash table
+        of the given particle array, see `get_hash_table_statistics`.
+        """
+        return get_hash_table_statistics(self.hashtable[pa_index])
+
     #### Private protocol ################################################
 
     cdef inline void _add_to_hashtable(self, int hash_id, unsigned int pid, double h,
@@ -180,10 +213,13 @@ cdef class SpatialHashNNPS(NNPS):
         return length
 
     cpdef _refresh(self):
+        # Start from the size the table grew to so it is not resized again.
         cdef int i
+        cdef long long int table_size
         for i from 0<=i<self.narrays:
+            table_size = self.hashtable[i].table_size
             del self.hashtable[i]
-            self.hashtable[i] = new HashTable(self.table_size)
+            self.hashtable[i] = new HashTable(table_size, self.max_load_factor)
         self.current_hash = self.hashtable[self.src_index]
 
     cpdef _bin(self, int pa_index, UIntArray indices):
@@ -225,13 +261,16 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
     the cell of the query particle is greater than search radius, the entire cell
     is ignored.
 
+    The hash table is resized as for the SpatialHashNNPS.
+
     Ref. http://citeseerx.ist.psu.edu/viewdoc/download?doi=10.1.1.105.6732&rep=rep1&type=pdf
     """
 
     def __init__(self, int dim, list particles, double radius_scale = 2.0,
             int H = 3, int ghost_layers = 1, domain=None, bint fixed_h = False,
             bint cache = False, bint sort_gids = False,
-            long long int table_size = 131072, bint approximate = False):
+            long long int table_size = 131072, bint approximate = False,
+            double max_load_factor = 1.0):
         NNPS.__init__(
             self, dim, particles, radius_scale, ghost_layers, domain,
             cache, sort_gids
@@ -249,18 +288,20 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
     def __cinit__(self, int dim, list particles, double radius_scale = 2.0,
             int H = 3, int ghost_layers = 1, domain=None, bint fixed_h = False,
             bint cache = False, bint sort_gids = False,
-            long long int table_size = 131072, bint approximate = False):
+            long long int table_size = 131072, bint approximate = False,
+            double max_load_factor = 1.0):
 
         cdef int narrays = len(particles)
 
         self.table_size = table_size
+        self.max_load_factor = max_load_factor
         self.radius_scale2 = radius_scale*radius_scale
 
         self.hashtable = <HashTable**> malloc(narrays*sizeof(HashTable*))
 
         cdef int i
         for i from 0<=i<narrays:
-            self.hashtable[i] = new HashTable(table_size)
+            self.hashtable[i] = new HashTable(table_size, max_load_factor)
 
         self.current_hash = NULL
 
@@ -372,6 +413,12 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
             )
 
 
+    cpdef dict get_hash_statistics(self, int pa_index):
+        """Return the occupancy and collision statistics of the hash table
+        of the given particle array, see `get_hash_table_statistics`.
+        """
+        return get_hash_table_statistics(self.hashtable[pa_index])
+
     #### Private protocol ################################################
 
     cdef inline void _add_to_hashtable(self, int hash_id, unsigned int pid, double h,
@@ -459,10 +506,13 @@ cdef class ExtendedSpatialHashNNPS(NNPS):
         return length
 
     cpdef _refresh(self):
+        # Start from the size the table grew to so it is not resized again.
         cdef int i
+        cdef long long int table_size
         for i from 0<=i<self.narrays:
+            table_size = self.hashtable[i].table_size
             del self.hashtable[i]
-            self.hashtable[i] = new HashTable(self.table_size)
+            self.hashtable[i] = new HashTable(table_size, self.max_load_factor)
         self.current_hash = self.hashtable[self.src_index]
 
     @cython.cdivision(True)
@@ -279,14 +279,18 @@ cdef class StratifiedHashNNPS(NNPS):
         self.interval_size = (self.cell_size - self.hmin)/self.num_levels + EPS
 
         cdef HashTable** current_hash
+        cdef long long int table_size
         cdef int i, j
         for i from 0<=i<self.narrays:
             current_hash = self.hashtable[i]
             current_cells = self.cell_sizes[i]
             for j from 0<=j<self.num_levels:
+                # Keep the size the table grew to.
+                table_size = self.table_size
                 if current_hash[j] != NULL:
+                    table_size = current_hash[j].table_size
                     del current_hash[j]
-                current_hash[j] = new HashTable(self.table_size)
+                current_hash[j] = new HashTable(table_size)
                 current_cells[j] = 0
         self.current_hash = self.hashtable[self.src_index]
         self.current_cells = self.cell_sizes[self.src_index]
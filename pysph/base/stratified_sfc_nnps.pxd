@@ -35,7 +35,6 @@ cdef class StratifiedSFCNNPS(NNPS):
     ############################################################################
     # Data Attributes
     ############################################################################
-    cdef double radius_scale2
 
     cdef public int num_levels
 
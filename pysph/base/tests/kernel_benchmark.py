@@ -0,0 +1,98 @@
+"""Benchmark the accuracy and speed of the tabulated kernels.
+
+For each kernel, the ``TabulatedKernel`` with linear and cubic interpolation
+is compared with the analytic kernel.  The largest errors of the kernel and
+its gradient (relative to the largest value of each) are found at random
+distances and the time to evaluate the summation density and the continuity
+equation on a perturbed 2D lattice is measured with the generated code.
+Run it as::
+
+    $ python kernel_benchmark.py --n 4096 --nx 200
+
+"""
+from argparse import ArgumentParser
+import time
+
+import numpy as np
+
+from pysph.base import kernels
+from pysph.base.kernels import TabulatedKernel
+from pysph.base.utils import get_particle_array
+from pysph.sph.basic_equations import ContinuityEquation, SummationDensity
+from pysph.tools.sph_evaluator import SPHEvaluator
+
+
+KERNELS = ['CubicSpline', 'WendlandQuintic', 'QuinticSpline', 'Gaussian',
+           'SuperGaussian']
+
+
+def get_errors(kernel, base, nsamples=2000):
+    np.random.seed(123)
+    rij = np.random.random(nsamples)*base.radius_scale
+    grad, grad_base = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+    w, w_base, dw, dw_base = [], [], [], []
+    for r in rij:
+        xij = [r, 0.0, 0.0]
+        w.append(kernel.kernel(xij, r, 1.0))
+        w_base.append(base.kernel(xij, r, 1.0))
+        kernel.gradient(xij, r, 1.0, grad)
+        base.gradient(xij, r, 1.0, grad_base)
+        dw.append(grad[0])
+        dw_base.append(grad_base[0])
+    w, w_base = np.asarray(w), np.asarray(w_base)
+    dw, dw_base = np.asarray(dw), np.asarray(dw_base)
+    return (np.abs(w - w_base).max()/np.abs(w_base).max(),
+            np.abs(dw - dw_base).max()/np.abs(dw_base).max())
+
+
+def get_time(kernel, nx, repeat):
+    np.random.seed(123)
+    dx = 1.0/nx
+    x, y = np.mgrid[0:1:dx, 0:1:dx]
+    x = x.ravel() + (np.random.random(x.size) - 0.5)*0.2*dx
+    y = y.ravel() + (np.random.random(y.size) - 0.5)*0.2*dx
+    n = x.size
+    pa = get_particle_array(
+        name='fluid', x=x, y=y, u=np.sin(np.pi*x), v=np.cos(np.pi*y),
+        h=np.ones(n)*1.2*dx, m=np.ones(n)*dx*dx, rho=np.ones(n)
+    )
+    pa.add_property('arho')
+    equations = [SummationDensity(dest='fluid', sources=['fluid']),
+                 ContinuityEquation(dest='fluid', sources=['fluid'])]
+    sph_eval = SPHEvaluator([pa], equations, dim=2, kernel=kernel)
+    sph_eval.evaluate()
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        sph_eval.evaluate()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--n", action="store", type=int, dest="n",
+                        default=4096, help="Number of intervals in tables.")
+    parser.add_argument("--nx", action="store", type=int, dest="nx",
+                        default=200, help="Number of particles per side.")
+    parser.add_argument("--repeat", action="store", type=int, dest="repeat",
+                        default=5, help="Number of evaluations to time.")
+    options = parser.parse_args()
+
+    fmt = '%-16s %-10s %10s %10s %10s'
+    print(fmt % ('kernel', 'mode', 'err(W)', 'err(DW)', 'time (s)'))
+    for name in KERNELS:
+        base = getattr(kernels, name)(dim=2)
+        t = get_time(base, options.nx, options.repeat)
+        print(fmt % (name, 'analytic', '-', '-', '%.4f' % t))
+        for cubic in (False, True):
+            kernel = TabulatedKernel(base, n=options.n, cubic=cubic)
+            err_w, err_dw = get_errors(kernel, base)
+            t = get_time(kernel, options.nx, options.repeat)
+            mode = 'cubic' if cubic else 'linear'
+            print(fmt % (name, mode, '%.2e' % err_w, '%.2e' % err_dw,
+                         '%.4f' % t))
+
+
+if __name__ == '__main__':
+    main()
@@ -31,6 +31,66 @@ class ConfigTestCase(TestCase):
         # Then
         self.assertEqual(config.use_openmp, 10)
 
+    def test_use_symmetric_loop_config_default(self):
+        # Given
+        config = self.config
+        # When
+        # Then
+        self.assertFalse(config.use_symmetric_loop)
+
+    def test_set_get_use_symmetric_loop_config(self):
+        # Given
+        config = self.config
+        # When
+        config.use_symmetric_loop = True
+        # Then
+        self.assertTrue(config.use_symmetric_loop)
+
+    def test_use_cell_loop_config_default(self):
+        # Given
+        config = self.config
+        # When
+        # Then
+        self.assertFalse(config.use_cell_loop)
+
+    def test_set_get_use_cell_loop_config(self):
+        # Given
+        config = self.config
+        # When
+        config.use_cell_loop = True
+        # Then
+        self.assertTrue(config.use_cell_loop)
+
+    def test_use_profiling_config_default(self):
+        # Given
+        config = self.config
+        # When
+        # Then
+        self.assertFalse(config.use_profiling)
+
+    def test_set_get_use_profiling_config(self):
+        # Given
+        config = self.config
+        # When
+        config.use_profiling = True
+        # Then
+        self.assertTrue(config.use_profiling)
+
+    def test_use_double_config_default(self):
+        # Given
+        config = self.config
+        # When
+        # Then
+        self.assertTrue(config.use_double)
+
+    def test_set_get_use_double_config(self):
+        # Given
+        config = self.config
+        # When
+        config.use_double = False
+        # Then
+        self.assertFalse(config.use_double)
+
     def test_default_global_config_is_really_global(self):
         # Given.
         config = get_config()
@@ -54,6 +114,21 @@ class ConfigTestCase(TestCase):
         # Then.
         self.assertEqual(config.use_openmp, 200)
 
+    def test_max_cache_size_config_default(self):
+        # Given
+        config = self.config
+        # When
+        # Then
+        self.assertEqual(config.max_cache_size, 1024)
+
+    def test_set_get_max_cache_size_config(self):
+        # Given
+        config = self.config
+        # When
+        config.max_cache_size = 10
+        # Then
+        self.assertEqual(config.max_cache_size, 10)
+
 
 if __name__ == '__main__':
     main()
@@ -4,9 +4,12 @@ import unittest
 from textwrap import dedent
 from math import pi, sin
 
+import cython
+import numpy as np
+
 from pysph.base.config import get_config, set_config
 from pysph.base.cython_generator import (CythonGenerator, CythonClassHelper,
-    KnownType, all_numeric)
+    CodeGenerationError, KnownType, all_numeric)
 
 def declare(*args):
     pass
@@ -44,6 +47,11 @@ class EqWithDeclare:
         index = declare('unsigned int')
         index = d_idx
 
+class EqWithDirectives:
+    @cython.boundscheck(False)
+    def func(self, d_idx, d_x=[0.0, 0.0]):
+        d_x[d_idx] = 0.0
+
 
 def func_with_return(d_idx, d_x, x=0.0):
     x += 1
@@ -84,6 +92,8 @@ class TestMiscUtils(TestBase):
                  (('y', [0.0, 1]), 'double*'),
                  (('y', [0, 1, 0]), 'double*'),
                  (('y', None), 'object'),
+                 (('y', np.zeros(3)), 'double[::1]'),
+                 (('y', np.zeros(3, dtype=int)), 'object'),
                 ]
         cg = CythonGenerator()
         for args, expect in cases:
@@ -109,6 +119,19 @@ class TestMiscUtils(TestBase):
         """)
         self.assert_code_equal(c.generate().strip(), expect.strip())
 
+    def test_final_cython_class_helper(self):
+        c = CythonClassHelper(name='A', public_vars={'x': 'double'},
+                              final=True)
+        expect = dedent("""
+        @cython.final
+        cdef class A:
+            cdef public double x
+            def __init__(self, **kwargs):
+                for key, value in kwargs.items():
+                    setattr(self, key, value)
+        """)
+        self.assert_code_equal(c.generate().strip(), expect.strip())
+
 
 class TestCythonCodeGenerator(TestBase):
     def setUp(self):
@@ -172,6 +195,29 @@ class TestCythonCodeGenerator(TestBase):
         """)
         self.assert_code_equal(cg.get_code().strip(), expect.strip())
 
+    def test_honors_use_double_setting(self):
+        # When
+        get_config().use_double = False
+        # Then
+        cg = CythonGenerator()
+        cg.parse(EqWithReturn())
+        expect = dedent("""
+        cdef class EqWithReturn:
+            cdef public list _hidden
+            cdef public float c
+            cdef public float rho
+            def __init__(self, **kwargs):
+                for key, value in kwargs.items():
+                    setattr(self, key, value)
+
+            cdef inline float func(self, long d_idx, double* d_x):
+                return d_x[d_idx]
+        """)
+        self.assert_code_equal(cg.get_code().strip(), expect.strip())
+
+        cg.parse(EqWithMethod())
+        self.assertTrue('cdef float tmp' in cg.get_code())
+
     def test_python_methods(self):
         cg = CythonGenerator(python_methods=True)
         cg.parse(EqWithMethod())
@@ -275,6 +321,21 @@ class TestCythonCodeGenerator(TestBase):
         """)
         self.assert_code_equal(cg.get_code().strip(), expect.strip())
 
+    def test_method_with_cython_directives(self):
+        cg = CythonGenerator()
+        cg.parse(EqWithDirectives())
+        expect = dedent("""
+        cdef class EqWithDirectives:
+            def __init__(self, **kwargs):
+                for key, value in kwargs.items():
+                    setattr(self, key, value)
+
+            @cython.boundscheck(False)
+            cdef inline void func(self, long d_idx, double* d_x):
+                d_x[d_idx] = 0.0
+        """)
+        self.assert_code_equal(cg.get_code().strip(), expect.strip())
+
     def test_method_with_known_types(self):
         cg = CythonGenerator(
             known_types={'WIJ':0.0, 'DWIJ':[0.0, 0.0, 0.0],
@@ -295,6 +356,23 @@ class TestCythonCodeGenerator(TestBase):
         """)
         self.assert_code_equal(cg.get_code().strip(), expect.strip())
 
+    def test_specialized_method(self):
+        cg = CythonGenerator()
+        cg.parse_specialized(EqWithMethod(rho=2.0, c=-0.5))
+        expect = dedent("""
+        cdef inline void EqWithMethod_func(long d_idx, double* d_x):
+                cdef double tmp
+                tmp = abs(2.0*(-0.5))*sin(pi*(-0.5))
+                d_x[d_idx] = d_x[d_idx]*tmp
+        """)
+        self.assert_code_equal(cg.get_code().strip(), expect.strip())
+
+    def test_specialized_method_with_unknown_attribute(self):
+        eq = EqWithMethod()
+        del eq.rho
+        cg = CythonGenerator()
+        self.assertRaises(CodeGenerationError, cg.parse_specialized, eq)
+
     def test_wrap_function(self):
         cg = CythonGenerator()
         cg.parse(func_with_return)
@@ -7,14 +7,16 @@ import sys
 import tempfile
 from textwrap import dedent
 from multiprocessing import Pool
-from unittest import TestCase, main
+from unittest import TestCase, main, skipIf
 
 try:
     from unittest import mock
 except ImportError:
     import mock
 
-from pysph.base.ext_module import get_md5, ExtModule
+from pysph.base.config import get_config
+from pysph.base.ext_module import get_md5, CacheIndex, ExtModule, \
+    _background_builds
 
 
 def _check_write_source(root):
@@ -102,6 +104,46 @@ class TestExtModule(TestCase):
         self.assertEqual(mod.f(), "hello world")
         self.assertTrue(exists(s.ext_path))
 
+    def test_build_in_background(self):
+        # Given
+        data = self.data
+        s = ExtModule(data, root=self.root)
+
+        # When
+        s.build_in_background()
+
+        # Then
+        self.assertTrue(s.ext_path in _background_builds)
+
+        # When
+        s1 = ExtModule(data, root=self.root)
+        with mock.patch('shutil.copy') as m:
+            mod = s1.load()
+
+        # Then
+        self.assertFalse(m.called)
+        self.assertFalse(s.ext_path in _background_builds)
+        self.assertEqual(mod.f(), "hello world")
+
+        # When
+        s.build_in_background()
+
+        # Then
+        self.assertFalse(s.ext_path in _background_builds)
+
+    def test_build_in_background_is_disabled_in_parallel(self):
+        # Given
+        s = ExtModule(self.data, root=self.root)
+        s.num_procs = 2
+
+        # When
+        with mock.patch('subprocess.Popen') as m:
+            s.build_in_background()
+
+        # Then
+        self.assertFalse(m.called)
+        self.assertFalse(s.ext_path in _background_builds)
+
     def _create_dummy_module(self):
         code = "def hello(): return 'hello'"
         modname = 'test_rebuild.py'
@@ -182,5 +224,98 @@ class TestExtModule(TestCase):
         self.assertEqual(sum(result), 1)
 
 
+class TestCacheIndex(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _make_module(self, code, size=1000):
+        s = ExtModule(code, root=self.root)
+        # Mimic a compiled extension of the given size.
+        with open(s.ext_path, 'w') as fp:
+            fp.write('x'*size)
+        return s
+
+    def test_index_tracks_modules_and_usage(self):
+        # Given
+        s1 = self._make_module("a = 1")
+        s2 = self._make_module("a = 2")
+        index = CacheIndex(self.root)
+
+        # When
+        index.touch(s1.name)
+        modules = index.get_modules()
+
+        # Then
+        self.assertEqual(sorted(modules.keys()), sorted([s1.name, s2.name]))
+        self.assertTrue(modules[s1.name][0] >= modules[s2.name][0])
+        self.assertEqual(sorted(modules[s1.name][1]),
+                         sorted([s1.src_path, s1.ext_path]))
+        self.assertTrue(index.get_size() > 2000)
+
+    def test_index_skips_files_removed_by_another_process(self):
+        # Given
+        s1 = self._make_module("a = 1")
+        s2 = self._make_module("a = 2")
+        index = CacheIndex(self.root)
+        files = index._get_files()
+
+        # When
+        # Mimic another process evicting s2 after the files were listed.
+        os.remove(s2.src_path)
+        os.remove(s2.ext_path)
+        with mock.patch.object(index, '_get_files', return_value=files):
+            modules = index.get_modules()
+            size = index.get_size()
+
+        # Then
+        self.assertEqual(list(modules.keys()), [s1.name])
+        self.assertTrue(1000 < size < 2000)
+
+    def test_evict_removes_least_recently_used_modules(self):
+        # Given
+        mods = [self._make_module("a = %d" % i) for i in range(4)]
+        index = CacheIndex(self.root)
+        for i, s in enumerate(mods):
+            index.touch(s.name)
+        # Use the first module again, so the second is the oldest.
+        index.touch(mods[0].name)
+
+        # When
+        removed = index.evict(max_size=2500, keep=[mods[1].name])
+
+        # Then
+        self.assertEqual(removed, [mods[2].name, mods[3].name])
+        self.assertTrue(index.get_size() <= 2500)
+        for s in mods[2:]:
+            self.assertFalse(exists(s.src_path))
+            self.assertFalse(exists(s.ext_path))
+        for s in mods[:2]:
+            self.assertTrue(exists(s.ext_path))
+        self.assertEqual(sorted(index.get_modules().keys()),
+                         sorted([mods[0].name, mods[1].name]))
+
+    def test_build_evicts_old_modules_when_cache_is_too_large(self):
+        # Given
+        old = self._make_module("a = 1", size=2*1024*1024)
+        config = get_config()
+        orig_size = config.max_cache_size
+        config.max_cache_size = 1
+
+        # When
+        try:
+            s = ExtModule("def f():\n    return 1\n", root=self.root)
+            mod = s.load()
+        finally:
+            config.max_cache_size = orig_size
+
+        # Then
+        self.assertEqual(mod.f(), 1)
+        self.assertFalse(exists(old.ext_path))
+        self.assertTrue(exists(s.ext_path))
+
+
 if __name__ == '__main__':
     main()
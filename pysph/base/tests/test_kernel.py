@@ -9,7 +9,8 @@ from pysph.base.kernels import (CubicSpline, Gaussian, QuinticSpline,
                                 SuperGaussian, WendlandQuintic,
                                 WendlandQuinticC4, WendlandQuinticC6,
                                 WendlandQuinticC2_1D, WendlandQuinticC4_1D,
-                                WendlandQuinticC6_1D, get_compiled_kernel)
+                                WendlandQuinticC6_1D, TabulatedKernel,
+                                get_compiled_kernel)
 
 
 ###############################################################################
@@ -499,5 +500,66 @@ class TestWendlandQuinticC6_1D(TestCubicSpline1D):
         self.check_kernel_at_origin(55.0 / 64.0)
 
 
+###############################################################################
+# Tabulated kernel
+class TestTabulatedKernel(TestCase):
+    def _get_errors(self, kernel, base, h=0.7):
+        np.random.seed(123)
+        rij = np.random.random(200)*base.radius_scale*h
+        grad, grad_base = [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]
+        errors = np.zeros(3)
+        for r in rij:
+            xij = [0.6*r, 0.8*r, 0.0]
+            errors[0] = max(errors[0], abs(kernel.kernel(xij, r, h) -
+                                           base.kernel(xij, r, h)))
+            kernel.gradient(xij, r, h, grad)
+            base.gradient(xij, r, h, grad_base)
+            errors[1] = max(errors[1], abs(grad[0] - grad_base[0]),
+                            abs(grad[1] - grad_base[1]))
+            errors[2] = max(errors[2], abs(kernel.gradient_h(xij, r, h) -
+                                           base.gradient_h(xij, r, h)))
+        return errors
+
+    def test_should_interpolate_the_kernel(self):
+        for base in (CubicSpline(dim=1), QuinticSpline(dim=2),
+                     Gaussian(dim=3)):
+            # Given
+            kernel = TabulatedKernel(base, n=1000)
+
+            # When
+            errors = self._get_errors(kernel, base)
+
+            # Then
+            self.assertTrue(np.all(errors < 1e-4), (base, errors))
+            self.assertEqual(kernel.radius_scale, base.radius_scale)
+            self.assertEqual(kernel.get_deltap(), base.get_deltap())
+
+    def test_cubic_interpolation_should_be_more_accurate(self):
+        # Given
+        base = QuinticSpline(dim=2)
+        linear = TabulatedKernel(base, n=100)
+        cubic = TabulatedKernel(base, n=100, cubic=True)
+
+        # When
+        err_linear = self._get_errors(linear, base)[0]
+        err_cubic = self._get_errors(cubic, base)[0]
+
+        # Then
+        self.assertTrue(err_cubic < 1e-2*err_linear)
+
+    def test_should_be_zero_outside_the_support(self):
+        # Given
+        kernel = TabulatedKernel(CubicSpline(dim=2), n=100)
+        grad = [1.0, 1.0, 1.0]
+
+        # When
+        kernel.gradient([2.0, 0.0, 0.0], 2.0, 1.0, grad)
+
+        # Then
+        self.assertEqual(kernel.kernel([2.0, 0.0, 0.0], 2.0, 1.0), 0.0)
+        self.assertEqual(grad, [0.0, 0.0, 0.0])
+        self.assertEqual(kernel.gradient_h([3.0, 0.0, 0.0], 3.0, 1.0), 0.0)
+
+
 if __name__ == '__main__':
     main()
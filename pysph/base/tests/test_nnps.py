@@ -250,6 +250,54 @@ class SpatialHashNNPSTestCase(DictBoxSortNNPSTestCase):
             dim=3, particles=self.particles, radius_scale=2.0
         )
 
+class SpatialHashNNPSResizeTestCase(DictBoxSortNNPSTestCase):
+    """Test for Spatial Hash algorithm with a table that must grow"""
+    def setUp(self):
+        NNPSTestCase.setUp(self)
+        self.nps = nnps.SpatialHashNNPS(
+            dim=3, particles=self.particles, radius_scale=2.0, table_size=16
+        )
+
+    def test_table_should_grow_with_the_number_of_cells(self):
+        # When
+        stats = self.nps.get_hash_statistics(1)
+
+        # Then
+        self.assertTrue(stats['n_resizes'] > 0)
+        self.assertTrue(stats['table_size'] > 16)
+        self.assertTrue(stats['load_factor'] <= 1.0)
+        self.assertAlmostEqual(
+            stats['n_collisions'],
+            stats['n_cells'] - stats['n_cells']/stats['mean_chain_length']
+        )
+        self.assertTrue(stats['max_chain_length'] >= 1)
+
+    def test_table_size_should_be_kept_when_updating(self):
+        # Given
+        table_size = self.nps.get_hash_statistics(0)['table_size']
+
+        # When
+        self.nps.update()
+
+        # Then
+        stats = self.nps.get_hash_statistics(0)
+        self.assertEqual(stats['table_size'], table_size)
+        self.assertEqual(stats['n_resizes'], 0)
+
+    def test_table_size_should_be_fixed_without_load_factor(self):
+        # When
+        nps = nnps.ExtendedSpatialHashNNPS(
+            dim=3, particles=self.particles, radius_scale=2.0, table_size=16,
+            max_load_factor=0.0
+        )
+
+        # Then
+        stats = nps.get_hash_statistics(0)
+        self.assertEqual(stats['table_size'], 16)
+        self.assertEqual(stats['n_resizes'], 0)
+        self.assertTrue(stats['load_factor'] > 1.0)
+
+
 class SingleLevelStratifiedHashNNPSTestCase(DictBoxSortNNPSTestCase):
     """Test for Stratified hash algorithm with num_levels = 1"""
     def setUp(self):
@@ -375,6 +423,31 @@ class LinkedListNNPSTestCase(DictBoxSortNNPSTestCase):
             self.assertTrue(cid.y > -1)
             self.assertTrue(cid.z > -1)
 
+    def test_vectorized_filter_should_give_the_same_neighbors(self):
+        # Given
+        pa1, pa2 = self.particles
+        pa2.h[:] *= 0.5 + random.random(self.numPoints2)
+        nps = nnps.LinkedListNNPS(
+            dim=3, particles=self.particles, radius_scale=2.0
+        )
+        self.assertTrue(nps.vectorize)
+        nbrs1 = UIntArray()
+        nbrs2 = UIntArray()
+
+        for src_index, dst_index in ((0, 1), (1, 0), (1, 1)):
+            nps.set_context(src_index, dst_index)
+            n_dst = self.particles[dst_index].get_number_of_particles()
+            for i in range(n_dst):
+                # When
+                nps.vectorize = True
+                nps.get_nearest_particles(src_index, dst_index, i, nbrs1)
+                nps.vectorize = False
+                nps.get_nearest_particles(src_index, dst_index, i, nbrs2)
+
+                # Then
+                self.assertEqual(list(nbrs1.get_npy_array()),
+                                 list(nbrs2.get_npy_array()))
+
 
 class TestNNPSOnLargeDomain(unittest.TestCase):
     def _make_particles(self, nx=20):
@@ -561,6 +634,377 @@ class TestMultipleLevelsStratifiedSFCNNPSWithSorting(TestLinkedListNNPSWithSorti
         return pa, nps
 
 
+class TestVerletNNPS(unittest.TestCase):
+    def _make_particles(self, nx=20):
+        x, y = numpy.mgrid[0:1:nx*1j, 0:1:nx*1j]
+        x, y = x.ravel(), y.ravel()
+        h = numpy.ones_like(x)*1.2/(nx-1)
+
+        pa = get_particle_array(name='fluid', x=x, y=y, h=h)
+        nps = nnps.LinkedListNNPS(dim=2, particles=[pa], radius_scale=2.0)
+        return pa, nps
+
+    def _assert_has_all_neighbors(self, pa, nps):
+        nbrs = UIntArray()
+        nps.set_context(0, 0)
+        for i in range(pa.get_number_of_particles()):
+            nps.get_nearest_particles(0, 0, i, nbrs)
+            nb = set(nbrs.get_npy_array())
+            r = numpy.sqrt((pa.x - pa.x[i])**2 + (pa.y - pa.y[i])**2)
+            expect = set(numpy.where(r < 2.0*pa.h)[0])
+            self.assertTrue(expect <= nb)
+
+    def test_should_not_rebuild_for_small_displacements(self):
+        # Given
+        pa, nps = self._make_particles()
+        nps.set_skin(0.2)
+        n_rebuilds = nps.n_rebuilds
+
+        # When
+        pa.x += 0.1*0.2*2.0*pa.h
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds)
+        self._assert_has_all_neighbors(pa, nps)
+
+    def test_should_rebuild_for_large_displacements(self):
+        # Given
+        pa, nps = self._make_particles()
+        nps.set_skin(0.2)
+        n_rebuilds = nps.n_rebuilds
+
+        # When
+        pa.x[0] += 0.5*pa.h[0]
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds + 1)
+        self._assert_has_all_neighbors(pa, nps)
+
+    def test_should_rebuild_when_h_changes(self):
+        # Given
+        pa, nps = self._make_particles()
+        nps.set_skin(0.2)
+        n_rebuilds = nps.n_rebuilds
+
+        # When
+        pa.h *= 1.3
+        nps.update_domain()
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds + 1)
+        self._assert_has_all_neighbors(pa, nps)
+
+    def test_should_only_build_lists_of_used_pairs(self):
+        # Given
+        pa, nps = self._make_particles()
+        pb = get_particle_array(name='solid', x=pa.x, y=pa.y, h=pa.h)
+        nps = nnps.LinkedListNNPS(dim=2, particles=[pa, pb], radius_scale=2.0)
+        nps.set_skin(0.2)
+        nbrs = UIntArray()
+        counts = UIntArray()
+
+        # When
+        nps.set_context(0, 0)
+        nps.get_nearest_particles(0, 0, 0, nbrs)
+        n_rebuilds = nps.n_rebuilds
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds + 1)
+        nps.get_neighbor_counts(0, counts)
+        self.assertTrue(numpy.all(counts.get_npy_array() > 0))
+        nps.get_neighbor_counts(1, counts)
+        self.assertTrue(numpy.all(counts.get_npy_array() == 0))
+
+        # When
+        n_rebuilds = nps.n_rebuilds
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds)
+        self._assert_has_all_neighbors(pa, nps)
+
+    def test_should_rebuild_when_forced(self):
+        # Given
+        pa, nps = self._make_particles()
+        nps.set_skin(0.2)
+        n_rebuilds = nps.n_rebuilds
+
+        # When
+        nps.force_rebuild()
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds + 1)
+
+    def test_zero_skin_rebuilds_on_every_update(self):
+        # Given
+        pa, nps = self._make_particles()
+        n_rebuilds = nps.n_rebuilds
+
+        # When
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_rebuilds, n_rebuilds + 1)
+
+    def test_negative_skin_is_invalid(self):
+        pa, nps = self._make_particles()
+        self.assertRaises(ValueError, nps.set_skin, -0.1)
+
+
+class TestNeighborCounts(unittest.TestCase):
+    def _make_particles(self, cache, nx=10):
+        x, y = numpy.mgrid[0:1:nx*1j, 0:1:nx*1j]
+        x, y = x.ravel(), y.ravel()
+        h = numpy.ones_like(x)*1.2/(nx-1)
+
+        pa = get_particle_array(name='fluid', x=x, y=y, h=h)
+        nps = nnps.LinkedListNNPS(
+            dim=2, particles=[pa], radius_scale=2.0, cache=cache
+        )
+        return pa, nps
+
+    def _expected_counts(self, pa):
+        counts = []
+        for i in range(pa.get_number_of_particles()):
+            r = numpy.sqrt((pa.x - pa.x[i])**2 + (pa.y - pa.y[i])**2)
+            counts.append(numpy.sum(r < 2.0*pa.h))
+        return counts
+
+    def test_should_not_search_neighbors_without_cache(self):
+        # Given
+        pa, nps = self._make_particles(cache=False)
+        counts = UIntArray()
+
+        # When
+        available = nps.get_neighbor_counts(0, counts)
+
+        # Then
+        self.assertFalse(available)
+        self.assertListEqual(list(counts.get_npy_array()), [0]*100)
+
+    def test_should_count_only_the_cached_neighbors(self):
+        # Given
+        pa, nps = self._make_particles(cache=True)
+        counts = UIntArray()
+        nbrs = UIntArray()
+        nps.set_context(0, 0)
+        for i in range(10):
+            nps.get_nearest_particles(0, 0, i, nbrs)
+
+        # When
+        available = nps.get_neighbor_counts(0, counts)
+
+        # Then
+        self.assertTrue(available)
+        expect = self._expected_counts(pa)[:10] + [0]*90
+        self.assertListEqual(list(counts.get_npy_array()), expect)
+
+
+class TestLinkedListIncrementalUpdate(unittest.TestCase):
+    def _make_particles(self, nx=20):
+        x, y = numpy.mgrid[0:1:nx*1j, 0:1:nx*1j]
+        x, y = x.ravel(), y.ravel()
+        h = numpy.ones_like(x)*1.2/(nx-1)
+
+        pa = get_particle_array(name='fluid', x=x, y=y, h=h)
+        nps = nnps.LinkedListNNPS(dim=2, particles=[pa], radius_scale=2.0)
+        return pa, nps
+
+    def _assert_neighbors_are_correct(self, pa, nps):
+        nbrs = UIntArray()
+        for i in range(pa.get_number_of_particles()):
+            nps.get_nearest_particles(0, 0, i, nbrs)
+            r = numpy.sqrt((pa.x - pa.x[i])**2 + (pa.y - pa.y[i])**2)
+            expect = set(numpy.where(r < 2.0*pa.h)[0])
+            self.assertEqual(set(nbrs.get_npy_array()), expect)
+
+    def test_should_only_relink_particles_changing_cells(self):
+        # Given
+        pa, nps = self._make_particles()
+        n_cells = nps.n_cells
+
+        # When
+        pa.x[:5] += 0.1
+        nps.update_domain()
+        nps.update()
+
+        # Then
+        self.assertEqual(nps.n_cells, n_cells)
+        self.assertTrue(0 < nps.n_relinked <= 5)
+        self._assert_neighbors_are_correct(pa, nps)
+
+    def test_should_not_relink_for_small_displacements(self):
+        # Given
+        pa, nps = self._make_particles()
+        numpy.random.seed(1)
+
+        # When
+        for i in range(5):
+            pa.x += (numpy.random.random(len(pa.x)) - 0.5)*1e-3
+            pa.y += (numpy.random.random(len(pa.y)) - 0.5)*1e-3
+            nps.update_domain()
+            nps.update()
+
+            # Then
+            self.assertTrue(nps.n_relinked < len(pa.x)//2)
+            self._assert_neighbors_are_correct(pa, nps)
+
+    def test_should_rebuild_when_particles_leave_the_cells(self):
+        # Given
+        pa, nps = self._make_particles()
+        xmax = nps.xmax[0]
+
+        # When
+        pa.x[0] = 2.0
+        nps.update_domain()
+        nps.update()
+
+        # Then
+        self.assertTrue(nps.xmax[0] > xmax)
+        self._assert_neighbors_are_correct(pa, nps)
+
+    def test_should_rebuild_when_particles_are_added(self):
+        # Given
+        pa, nps = self._make_particles()
+        n = pa.get_number_of_particles()
+
+        # When
+        pa.add_particles(x=[0.5], y=[0.5], h=[pa.h[0]])
+        nps.update_domain()
+        nps.update()
+
+        # Then
+        self.assertEqual(pa.get_number_of_particles(), n + 1)
+        self._assert_neighbors_are_correct(pa, nps)
+
+
+class TestReorderParticles(unittest.TestCase):
+    def _make_particles(self, n=400):
+        numpy.random.seed(123)
+        x, y = numpy.random.random((2, n))
+        h = numpy.ones_like(x)*0.05
+        gid = numpy.arange(n, dtype=numpy.uint32)
+        pa = get_particle_array(name='fluid', x=x, y=y, h=h, gid=gid)
+        nps = nnps.LinkedListNNPS(dim=2, particles=[pa], radius_scale=2.0)
+        return pa, nps
+
+    def test_reorder_should_permute_all_properties(self):
+        # Given
+        pa, nps = self._make_particles()
+        orig = dict((g, (x, y)) for g, x, y in zip(pa.gid, pa.x, pa.y))
+
+        # When
+        nps.reorder_particles()
+
+        # Then
+        self.assertEqual(sorted(pa.gid), sorted(orig.keys()))
+        for g, x, y in zip(pa.gid, pa.x, pa.y):
+            self.assertEqual(orig[g], (x, y))
+
+    def test_reorder_should_improve_locality(self):
+        # Given
+        pa, nps = self._make_particles()
+
+        def mean_jump(pa):
+            return numpy.mean(numpy.sqrt(numpy.diff(pa.x)**2 +
+                                         numpy.diff(pa.y)**2))
+        before = mean_jump(pa)
+
+        # When
+        nps.reorder_particles()
+
+        # Then
+        self.assertTrue(mean_jump(pa) < 0.5*before)
+
+    def test_reorder_should_update_neighbors(self):
+        # Given
+        pa, nps = self._make_particles()
+
+        # When
+        nps.reorder_particles()
+
+        # Then
+        nbrs = UIntArray()
+        for i in range(pa.get_number_of_particles()):
+            nps.get_nearest_particles(0, 0, i, nbrs)
+            r = numpy.sqrt((pa.x - pa.x[i])**2 + (pa.y - pa.y[i])**2)
+            expect = set(numpy.where(r < 2.0*pa.h)[0])
+            self.assertEqual(set(nbrs.get_npy_array()), expect)
+
+    def test_reorder_should_keep_non_local_particles_at_the_end(self):
+        # Given
+        pa, nps = self._make_particles()
+        pa.tag[-10:] = 1
+        remote_gids = list(pa.gid[-10:])
+
+        # When
+        nps.reorder_particles()
+
+        # Then
+        self.assertEqual(list(pa.gid[-10:]), remote_gids)
+        self.assertTrue(numpy.all(pa.tag[:-10] == 0))
+
+
+class TestVirtualPeriodicImages(unittest.TestCase):
+    def _make_nnps(self, cls=nnps.LinkedListNNPS, n=500, **kw):
+        numpy.random.seed(123)
+        x, y = numpy.random.random((2, n))
+        h = numpy.ones_like(x)*0.05
+        pa = get_particle_array(name='fluid', x=x, y=y, h=h)
+        domain = nnps.DomainManager(
+            xmin=0.0, xmax=1.0, ymin=0.0, ymax=1.0, periodic_in_x=True,
+            periodic_in_y=True, virtual_images=True
+        )
+        nps = cls(dim=2, particles=[pa], radius_scale=2.0, domain=domain,
+                  **kw)
+        return pa, nps
+
+    def _check_neighbors(self, pa, nps):
+        nbrs = UIntArray()
+        for i in range(pa.get_number_of_particles()):
+            nps.get_nearest_particles(0, 0, i, nbrs)
+            xij = pa.x[i] - pa.x
+            yij = pa.y[i] - pa.y
+            xij -= numpy.round(xij)
+            yij -= numpy.round(yij)
+            r = numpy.sqrt(xij**2 + yij**2)
+            expect = numpy.where(r < 2.0*pa.h)[0]
+            self.assertEqual(sorted(nbrs.get_npy_array()), list(expect))
+
+    def test_linked_list_should_find_neighbors_across_boundaries(self):
+        # Given
+        pa, nps = self._make_nnps(cache=False)
+
+        # Then
+        self.assertEqual(pa.get_number_of_particles(), 500)
+        self._check_neighbors(pa, nps)
+
+    def test_cached_neighbors_should_include_images(self):
+        # Given
+        pa, nps = self._make_nnps(cache=True)
+        nps.set_context(0, 0)
+
+        # Then
+        self._check_neighbors(pa, nps)
+
+    def test_box_sort_should_find_neighbors_across_boundaries(self):
+        # Given
+        pa, nps = self._make_nnps(cls=nnps.BoxSortNNPS, cache=False)
+
+        # Then
+        self._check_neighbors(pa, nps)
+
+    def test_unsupported_nnps_should_raise_error(self):
+        self.assertRaises(
+            ValueError, self._make_nnps, cls=nnps.SpatialHashNNPS
+        )
+
+
 def test_large_number_of_neighbors_linked_list():
     x = numpy.random.random(1 << 14)*0.1
     y = x.copy()
@@ -147,6 +147,30 @@ class SimpleOctreeTestCase(unittest.TestCase):
         self.assertTrue(pa.get_number_of_particles() == sum_indices[0])
         self.tree.delete_tree()
 
+    def test_leaf_indices_are_a_permutation_of_the_particles(self):
+        pa = get_particle_array(x=self.x, y=self.y, z=self.z, h=self.h)
+        self.tree.build_tree(pa)
+        leaves = self.tree.get_leaf_cells()
+        indices = np.concatenate(
+            [leaf.get_indices(self.tree).get_npy_array() for leaf in leaves]
+        )
+        # Test that every particle is in exactly one leaf
+        np.testing.assert_array_equal(
+            np.sort(indices), np.arange(pa.get_number_of_particles())
+        )
+
+        # Test that rebuilding the tree gives the same leaves
+        depth = self.tree.depth
+        self.assertEqual(self.tree.build_tree(pa), depth)
+        new_leaves = self.tree.get_leaf_cells()
+        self.assertEqual(len(new_leaves), len(leaves))
+        new_indices = np.concatenate(
+            [leaf.get_indices(self.tree).get_npy_array()
+             for leaf in new_leaves]
+        )
+        np.testing.assert_array_equal(new_indices, indices)
+        self.tree.delete_tree()
+
     def test_plot_root(self):
         pa = get_particle_array(x=self.x, y=self.y, z=self.z, h=self.h)
         self.tree.build_tree(pa)
@@ -701,6 +701,23 @@ class ParticleArrayUtils(unittest.TestCase):
         self.assertEqual(dummy.name, 'f')
         self.assertTrue('x' in dummy.properties)
 
+    def test_convert_to_single_precision(self):
+        # Given.
+        p = utils.get_particle_array(name='f', x=[1.0, 2.0], rho=[1.5, 2.5])
+        p.set_output_arrays(['x', 'rho'])
+
+        # When.
+        utils.convert_to_single_precision(p)
+
+        # Then.
+        self.assertEqual(p.properties['x'].get_c_type(), 'double')
+        self.assertEqual(p.properties['h'].get_c_type(), 'double')
+        self.assertEqual(p.properties['rho'].get_c_type(), 'float')
+        self.assertEqual(p.properties['tag'].get_c_type(), 'int')
+        self.assertTrue(check_array(p.rho, [1.5, 2.5]))
+        self.assertEqual(p.output_property_arrays, ['x', 'rho'])
+        self.assertEqual(p.get_number_of_particles(), 2)
+
 
 if __name__ == '__main__':
     import logging
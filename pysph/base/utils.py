@@ -7,7 +7,7 @@ import numpy
 from .particle_array import ParticleArray, \
     get_local_tag, get_remote_tag, get_ghost_tag
 
-from pyzoltan.core.carray import LongArray
+from pyzoltan.core.carray import DoubleArray, LongArray
 
 UINT_MAX = (1<<32) - 1
 
@@ -382,6 +382,30 @@ def get_particle_array_gasd(constants=None, **props):
 
     return pa
 
+def convert_to_single_precision(pa, keep_double=('x', 'y', 'z', 'h')):
+    """Convert the double precision properties of a particle array to single
+    precision (float) in place.
+
+    Parameters
+    ----------
+
+    pa : ParticleArray
+        The particle array to convert.
+    keep_double : sequence
+        Properties left in double precision.  The NNPS requires the
+        positions and smoothing lengths to be doubles, this also lets the
+        positions be accumulated in double precision.
+    """
+    output_arrays = list(pa.output_property_arrays)
+    for name, arr in list(pa.properties.items()):
+        if name in keep_double or not isinstance(arr, DoubleArray):
+            continue
+        default = pa.default_values[name]
+        data = arr.get_npy_array().astype(numpy.float32)
+        pa.remove_property(name)
+        pa.add_property(name, type='float', default=default, data=data)
+    pa.set_output_arrays(output_arrays)
+
 def get_particles_info(particles):
     """Return the array information for a list of particles.
 
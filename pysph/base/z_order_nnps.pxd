@@ -31,7 +31,6 @@ cdef class ZOrderNNPS(NNPS):
     cdef key_to_idx_t** pid_indices
     cdef key_to_idx_t* current_indices
 
-    cdef double radius_scale2
     cdef NNPSParticleArrayWrapper dst, src
 
     ##########################################################################
@@ -47,6 +47,19 @@ cdef class ParticleArrayExchange:
     cdef public list lb_props
     cdef public int nprops
 
+    # list of props sent for remote particles
+    cdef public list remote_props
+
+    # exchange all the props in a single packed message
+    cdef public bint packed
+    # reusable send and receive buffers for the packed exchange
+    cdef np.ndarray _sendbuf, _recvbuf
+    # plan of the last remote exchange, reused to refresh the remotes
+    cdef ZComm _remote_zcomm
+    # props and record size of a posted refresh of the remotes
+    cdef list _posted_props
+    cdef int _posted_nbytes
+
     # Import/Export lists for particles
     cdef public UIntArray exportParticleGlobalids
     cdef public UIntArray exportParticleLocalids
@@ -62,7 +75,19 @@ cdef class ParticleArrayExchange:
     # Member functions
     ############################################################################
     # exchange data given send and receive lists
-    cdef exchange_data(self, ZComm zcomm, dict sendbufs, int count)
+    cdef exchange_data(self, ZComm zcomm, dict sendbufs, int count,
+                       list props)
+
+    # pack the props of the exported particles into the send buffer
+    cdef int pack_sendbuf(self, UIntArray exportIndices, list props)
+
+    # exchange the packed send buffer and unpack the received data
+    cdef exchange_packed_data(self, ZComm zcomm, int record_nbytes, int count,
+                              list props)
+
+    # unpack the records in the receive buffer into the props
+    cdef unpack_recvbuf(self, int record_nbytes, int count, list props,
+                        long n)
 
 # base class for all parallel managers
 cdef class ParallelManager:
@@ -80,12 +105,26 @@ cdef class ParallelManager:
     cdef public int lb_freq              # load balancing frequency
     cdef public int lb_count             # counter for current lb step
 
+    # load balance when the imbalance exceeds this (if positive)
+    cdef public double lb_imbalance
+    cdef public double imbalance         # last measured imbalance
+    cdef public str lb_weight            # 'particles' or 'neighbors'
+    cdef public object nnps              # NNPS used for the neighbor counts
+    cdef public list particle_weights    # work of each particle per array
+
     cdef public int ncells_local         # number of local cells
     cdef public int ncells_remote        # number of remote cells
     cdef public int ncells_total         # total number of cells
-    cdef public list cell_list           # list of cells
 
-    cdef public dict cell_map            # index structure
+    # The binning: the sorted keys of the cells and for each array, the
+    # cell keys of the particles, the local and global indices of the
+    # particles sorted on them and the offsets of the cells into these.
+    cdef public np.ndarray cell_keys
+    cdef public list particle_keys
+    cdef public list cell_lindices
+    cdef public list cell_gindices
+    cdef public list cell_offsets
+
     cdef public int ghost_layers         # BOunding box size
     cdef public double cell_size         # cell size used for binning
 
@@ -100,6 +139,12 @@ cdef class ParallelManager:
     cdef public list num_global
 
     cdef public double radius_scale      # Radius scale for kernel
+    cdef public int dim                  # Dimension of the problem
+
+    # local particles with (boundary) and without (interior) any remote
+    # particles nearby for each array name
+    cdef public dict boundary_particles
+    cdef public dict interior_particles
 
     cdef public bint initial_update
     cdef public bint update_cell_sizes
@@ -142,6 +187,21 @@ cdef class ParallelManager:
     # assumed to be of type unsigned int and local to the NNPS object
     cdef _bin(self, int pa_index, UIntArray indices)
 
+    # remove all the particles from the cells
+    cdef _clear_cells(self)
+
+    # find the cells and their offsets after binning the particles
+    cdef _update_cells(self)
+
+    # keys of the cells with local (or remote) particles
+    cdef np.ndarray _get_occupied_cells(self, bint remote)
+
+    # positions of the particles of the given cells in the sorted particles
+    cdef tuple _get_cell_particles(self, int pa_index, np.ndarray cells)
+
+    # export the particles of the given cells to the given processors
+    cdef _set_export_lists(self, np.ndarray cells, np.ndarray procs)
+
     # Compute the cell size across processors. The cell size is taken
     # as max(h)*radius_scale
     cpdef compute_cell_size(self)
@@ -151,6 +211,9 @@ cdef class ParallelManager:
     # the maximum smoothing length needed for parallel binning.
     cdef _compute_bounds(self)
 
+    # the weight of a particle, one unless the particle_weights are set
+    cdef double _get_particle_weight(self, int pa_index, size_t i)
+
     # nearest neighbor search routines taking into account multiple
     # particle arrays
     cpdef get_nearest_particles(self, int src_index, int dst_index,
@@ -166,4 +229,5 @@ cdef class ZoltanParallelManager(ParallelManager):
 
 # Class of geometric load balancers
 cdef class ZoltanParallelManagerGeometric(ZoltanParallelManager):
-    pass
+    # the sum of the weights of the particles in each cell
+    cdef np.ndarray _get_cell_weights(self)
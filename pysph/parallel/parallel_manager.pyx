@@ -7,7 +7,8 @@ cimport numpy as np
 # MPI4PY
 import mpi4py.MPI as mpi
 
-from cpython.list cimport PyList_Append, PyList_GET_SIZE
+from cython.parallel import parallel, prange
+from libc.string cimport memcpy
 
 # PyZoltan
 from pyzoltan.czoltan cimport czoltan
@@ -15,7 +16,8 @@ from pyzoltan.czoltan.czoltan cimport Zoltan_Struct
 from pyzoltan.core import zoltan_utils
 
 # PySPH imports
-from pysph.base.nnps_base cimport DomainManager, Cell, find_cell_id, arange_uint
+from pysph.base.nnps_base cimport (DomainManager, find_cell_id,
+    find_cell_id_raw, arange_uint)
 from pysph.base.utils import ParticleTAGS
 
 cdef int Local = ParticleTAGS.Local
@@ -30,6 +32,45 @@ cdef extern from 'limits.h':
     cdef int INT_MAX
     cdef unsigned int UINT_MAX
 
+# The three indices of a cell are packed into an unsigned 64 bit key with
+# KEY_BITS bits each, the cells are sorted and searched on these keys.
+cdef int KEY_BITS = 21
+cdef long KEY_OFFSET = 1 << (KEY_BITS - 1)
+
+cpdef np.ndarray get_cell_keys(np.ndarray cx, np.ndarray cy, np.ndarray cz):
+    """Pack the indices of the cells into their keys."""
+    cdef np.ndarray keys = np.zeros(cx.shape[0], dtype=np.uint64)
+    cdef np.ndarray cid
+    for cid in (cx, cy, cz):
+        if cid.shape[0] > 0 and (cid.min() < -KEY_OFFSET or
+                                 cid.max() >= KEY_OFFSET):
+            raise RuntimeError('Too many cells to bin the particles')
+        keys = (keys << np.uint64(KEY_BITS)) | \
+            (cid.astype(np.int64) + KEY_OFFSET).astype(np.uint64)
+    return keys
+
+cpdef tuple get_cell_ids(np.ndarray keys):
+    """Unpack the indices of the cells from their keys, see
+    `get_cell_keys`.
+    """
+    mask = np.uint64((1 << KEY_BITS) - 1)
+    bits = np.uint64(KEY_BITS)
+    cz = (keys & mask).astype(np.int64) - KEY_OFFSET
+    cy = ((keys >> bits) & mask).astype(np.int64) - KEY_OFFSET
+    cx = (keys >> (bits + bits)).astype(np.int64) - KEY_OFFSET
+    return cx, cy, cz
+
+cdef _extend_array(object arr, np.ndarray values):
+    """Append the values to a carray."""
+    cdef long n = arr.length
+    arr.resize(n + values.shape[0])
+    arr.get_npy_array()[n:] = values
+
+cdef UIntArray _get_uint_array(np.ndarray values):
+    cdef UIntArray arr = UIntArray(values.shape[0])
+    arr.get_npy_array()[:] = values
+    return arr
+
 ################################################################
 # ParticleArrayExchange
 ################################################################w
@@ -76,10 +117,25 @@ cdef class ParticleArrayExchange:
         self.lb_props = lb_props
         self.nprops = len( lb_props )
 
+        # props sent for remote (ghost) particles, all of them by default
+        self.remote_props = list( lb_props )
+
         # exchange flags
         self.lb_exchange = True
         self.remote_exchange = True
 
+        # send all the props of a particle in one record and exchange them
+        # in a single communication instead of one per property.
+        self.packed = True
+        self._sendbuf = np.empty(0, dtype=np.uint8)
+        self._recvbuf = np.empty(0, dtype=np.uint8)
+
+        # communication plan of the last remote exchange
+        self._remote_zcomm = None
+        # props being refreshed by a posted (non-blocking) exchange
+        self._posted_props = None
+        self._posted_nbytes = 0
+
     def lb_exchange_data(self):
         """Share particle info after Zoltan_LB_Balance
 
@@ -112,7 +168,12 @@ cdef class ParticleArrayExchange:
         numImport = zcomm.nreturn
 
         # extract particles to be exported
-        cdef dict sendbufs = self.get_sendbufs( exportLocalids )
+        cdef dict sendbufs = None
+        cdef int record_nbytes = 0
+        if self.packed:
+            record_nbytes = self.pack_sendbuf( exportLocalids, self.lb_props )
+        else:
+            sendbufs = self.get_sendbufs( exportLocalids, self.lb_props )
 
         # remove particles to be exported
         pa.remove_particles(exportLocalids)
@@ -127,7 +188,12 @@ cdef class ParticleArrayExchange:
         pa.resize( newsize )
 
         # exchange data
-        self.exchange_data(zcomm, sendbufs, count)
+        if self.packed:
+            self.exchange_packed_data(
+                zcomm, record_nbytes, count, self.lb_props
+            )
+        else:
+            self.exchange_data(zcomm, sendbufs, count, self.lb_props)
 
         # set all particle tags to local
         self.set_tag(count, newsize, Local)
@@ -174,11 +240,23 @@ cdef class ParticleArrayExchange:
         newsize = current_size + numImport
 
         # copy particles to be exported
-        cdef dict sendbufs = self.get_sendbufs( exportLocalids )
+        cdef dict sendbufs = None
+        cdef int record_nbytes = 0
+        if self.packed:
+            record_nbytes = self.pack_sendbuf(
+                exportLocalids, self.remote_props
+            )
+        else:
+            sendbufs = self.get_sendbufs( exportLocalids, self.remote_props )
 
         # update the size of the array
         pa.resize( newsize )
-        self.exchange_data(zcomm, sendbufs, count)
+        if self.packed:
+            self.exchange_packed_data(
+                zcomm, record_nbytes, count, self.remote_props
+            )
+        else:
+            self.exchange_data(zcomm, sendbufs, count, self.remote_props)
 
         # set tags for all received particles as Remote
         self.set_tag(count, newsize, Remote)
@@ -187,15 +265,101 @@ cdef class ParticleArrayExchange:
         # store the number of remote particles
         self.num_remote = newsize - current_size
 
-    cdef exchange_data(self, ZComm zcomm, dict sendbufs, int count):
+        # save the plan to refresh the remote particles
+        self._remote_zcomm = zcomm
+
+    def refresh_remote_data(self):
+        """Re-send the current values of the remote particles.
+
+        The remote particles and the communication plan of the last call
+        to `remote_exchange_data` are reused, so the particles must not
+        have been added, removed or re-ordered since.  Only the
+        `remote_props` that can change (i.e. not the indexing properties
+        'gid', 'pid' and 'tag') are sent.
+
+        """
+        self.post_refresh_remote_data()
+        self.wait_refresh_remote_data()
+
+    def particles_changed(self):
+        """Return True if particles were added or removed since the last
+        `remote_exchange_data`, in which case the remote data cannot be
+        refreshed.
+        """
+        return self.pa.get_number_of_particles() != \
+            self.num_local + self.num_remote
+
+    def post_refresh_remote_data(self):
+        """Start refreshing the remote particles without waiting for the
+        data to arrive, see `refresh_remote_data`.
+
+        The remote particles may only be used after a call to
+        `wait_refresh_remote_data`.  The exchange is blocking if the
+        props are not `packed`.  Check `particles_changed` first, a
+        RuntimeError is raised if the particles have changed.
+
+        """
+        cdef ParticleArray pa = self.pa
+        cdef UIntArray exportLocalids = self.exportParticleLocalids
+        cdef ZComm zcomm = self._remote_zcomm
+        cdef int count = self.num_local
+        cdef dict sendbufs = None
+        cdef int record_nbytes = 0
+        cdef long n
+        cdef list props = [x for x in self.remote_props
+                           if x not in ('gid', 'pid', 'tag')]
+
+        if zcomm is None:
+            raise RuntimeError(
+                'remote_exchange_data must be called before refreshing'
+            )
+        if self.particles_changed():
+            raise RuntimeError('Particles changed since the remote exchange')
+
+        if not self.packed:
+            sendbufs = self.get_sendbufs( exportLocalids, props )
+            self.exchange_data(zcomm, sendbufs, count, props)
+            return
+
+        record_nbytes = self.pack_sendbuf( exportLocalids, props )
+        n = zcomm.nreturn
+        if self._recvbuf.shape[0] < n*record_nbytes:
+            self._recvbuf = np.empty(n*record_nbytes, dtype=np.uint8)
+
+        # use the unique tag of the array as exchanges of the other arrays
+        # may be posted at the same time.
+        zcomm.set_nbytes( record_nbytes )
+        zcomm.set_tag( self.data_tag_remote )
+        zcomm.Comm_Do_Post( self._sendbuf, self._recvbuf )
+
+        self._posted_props = props
+        self._posted_nbytes = record_nbytes
+
+    def wait_refresh_remote_data(self):
+        """Wait for the data posted by `post_refresh_remote_data` and copy
+        it to the remote particles.  Does nothing if nothing was posted.
+        """
+        cdef ZComm zcomm = self._remote_zcomm
+        cdef list props = self._posted_props
+        if props is None:
+            return
+
+        zcomm.Comm_Do_Wait( self._sendbuf, self._recvbuf )
+        self.unpack_recvbuf(
+            self._posted_nbytes, self.num_local, props, zcomm.nreturn
+        )
+
+        self._posted_props = None
+        self._posted_nbytes = 0
+
+    cdef exchange_data(self, ZComm zcomm, dict sendbufs, int count,
+                       list props):
         cdef ParticleArray pa = self.pa
         cdef str prop
-        cdef int prop_tag, nbytes, i, nprops = self.nprops
+        cdef int prop_tag, nbytes, i, nprops = len(props)
 
         cdef np.ndarray prop_arr, sendbuf, recvbuf
 
-        cdef list props = self.lb_props
-
         for i in range(nprops):
             prop = props[i]
 
@@ -216,6 +380,79 @@ cdef class ParticleArrayExchange:
             # exchange the data
             zcomm.Comm_Do( sendbuf, recvbuf )
 
+    cdef int pack_sendbuf(self, UIntArray exportIndices, list props):
+        """Copy the given props of the particles to be exported into the
+        (reusable) send buffer.
+
+        Each particle is packed into a record with the value of the property
+        ``props[i]`` at the byte offset given by the sum of the item sizes
+        of the previous properties.  Returns the size of a record in bytes.
+        """
+        cdef ParticleArray pa = self.pa
+        cdef int i, nbytes, offset, record_nbytes = 0, nprops = len(props)
+        cdef long j, n = exportIndices.length
+        cdef np.ndarray prop_arr
+        cdef char* src
+        cdef char* dst
+
+        for i in range(nprops):
+            prop_arr = pa.properties[props[i]].get_npy_array()
+            record_nbytes += prop_arr.dtype.itemsize
+
+        if self._sendbuf.shape[0] < n*record_nbytes:
+            self._sendbuf = np.empty(n*record_nbytes, dtype=np.uint8)
+        dst = self._sendbuf.data
+
+        offset = 0
+        for i in range(nprops):
+            prop_arr = pa.properties[props[i]].get_npy_array()
+            nbytes = prop_arr.dtype.itemsize
+            src = prop_arr.data
+            for j in range(n):
+                memcpy(dst + j*record_nbytes + offset,
+                       src + <long>exportIndices.data[j]*nbytes, nbytes)
+            offset += nbytes
+
+        return record_nbytes
+
+    cdef exchange_packed_data(self, ZComm zcomm, int record_nbytes,
+                              int count, list props):
+        """Exchange the send buffer packed by `pack_sendbuf` in a single
+        communication and unpack the received records into the props
+        starting at the index `count`.
+        """
+        cdef long n = zcomm.nreturn
+
+        if self._recvbuf.shape[0] < n*record_nbytes:
+            self._recvbuf = np.empty(n*record_nbytes, dtype=np.uint8)
+
+        zcomm.set_nbytes( record_nbytes )
+        zcomm.set_tag( 0 )
+        zcomm.Comm_Do( self._sendbuf, self._recvbuf )
+
+        self.unpack_recvbuf(record_nbytes, count, props, n)
+
+    cdef unpack_recvbuf(self, int record_nbytes, int count, list props,
+                        long n):
+        """Copy the `n` records in the receive buffer to the props starting
+        at the index `count`.
+        """
+        cdef ParticleArray pa = self.pa
+        cdef int i, nbytes, offset, nprops = len(props)
+        cdef long j
+        cdef np.ndarray prop_arr
+        cdef char* src = self._recvbuf.data
+        cdef char* dst
+
+        offset = 0
+        for i in range(nprops):
+            prop_arr = pa.properties[props[i]].get_npy_array()
+            nbytes = prop_arr.dtype.itemsize
+            dst = prop_arr.data + count*nbytes
+            for j in range(n):
+                memcpy(dst + j*nbytes, src + j*record_nbytes + offset, nbytes)
+            offset += nbytes
+
     def remove_remote_particles(self):
         self.num_local = self.pa.get_number_of_particles(real=True)
         cdef int num_local = self.num_local
@@ -287,14 +524,15 @@ cdef class ParticleArrayExchange:
     def extend(self, int currentsize, int newsize):
         self.pa.resize( newsize )
 
-    def get_sendbufs(self, UIntArray exportIndices):
+    def get_sendbufs(self, UIntArray exportIndices, list props):
+        """Copy the given properties of the exported particles."""
         cdef ParticleArray pa = self.pa
         cdef dict sendbufs = {}
         cdef str prop
 
         cdef np.ndarray indices = exportIndices.get_npy_array()
 
-        for prop in pa.properties:
+        for prop in props:
             prop_arr = pa.properties[prop].get_npy_array()
             sendbufs[prop] = prop_arr[ indices ]
 
@@ -336,6 +574,7 @@ cdef class ParallelManager:
         # number of arrays and a reference to the particle list
         self.narrays = len(particles)
         self.particles = particles
+        self.dim = dim
 
         # particle array exchange instances
         self.pa_exchanges = [ParticleArrayExchange(i, pa, comm) \
@@ -382,15 +621,12 @@ cdef class ParallelManager:
         self.in_parallel = True
         if self.size == 1: self.in_parallel = False
 
-        # The cell_map dictionary, radius scale for binning and ghost
-        # layers for remote neighbors.
-        self.cell_map = {}
-        self.cell_list = []
+        # The binning of the particles into cells.
+        self._clear_cells()
 
         # number of loca/remote cells
         self.ncells_local = 0
         self.ncells_remote = 0
-        self.ncells_total = 0
 
         # radius scale and ghost layers
         self.radius_scale = radius_scale
@@ -411,9 +647,19 @@ cdef class ParallelManager:
         self.lb_count = 0
         self.lb_freq = 1
 
+        # adaptive load balancing and the measure of the work
+        self.lb_imbalance = 0.0
+        self.imbalance = 0.0
+        self.lb_weight = 'particles'
+        self.nnps = None
+        self.particle_weights = None
+
         # array for global reduction of time steps
         self.dt_sendbuf = np.array( [1.0], dtype=np.float64 )
 
+        # interior and boundary particles
+        self.compute_boundary_particles()
+
     def update_time_steps(self, double local_dt):
         """Peform a reduction to compute the globally stable time steps"""
         cdef np.ndarray dt_sendbuf = self.dt_sendbuf
@@ -427,6 +673,119 @@ cdef class ParallelManager:
 
         return dt_recvbuf[0]
 
+    def refresh_halo(self):
+        """Update the remote particles with the current values of the
+        particles they were copied from.
+
+        This is a cheaper alternative to `update` between the stages of an
+        integrator since the partition, the cell map and the remote
+        particle lists of the last `update` are reused and only the data is
+        re-sent.  The halo membership therefore stays fixed for the rest of
+        the time step: particles moving out of the partition are not
+        migrated and particles moving near another partition are not sent
+        to it, so `update` should still be called once every time step.
+        If particles were added or removed on any processor since the last
+        `update`, a full `update` is done instead.
+        """
+        self.start_refresh_halo()
+        self.finish_refresh_halo()
+
+    def start_refresh_halo(self):
+        """Start a `refresh_halo` without waiting for the data.
+
+        The `interior_particles` may be computed until `finish_refresh_halo`
+        is called, after which the remote particles are up to date.
+        Returns False if a full `update` was done instead because the
+        particles changed, the halo is then already up to date.
+        """
+        cdef bint changed = False
+        if self.in_parallel:
+            for i in range(self.narrays):
+                if self.pa_exchanges[i].particles_changed():
+                    changed = True
+            if self.comm.allreduce(changed, op=mpi.LOR):
+                self.update()
+                return False
+            for i in range(self.narrays):
+                self.pa_exchanges[i].post_refresh_remote_data()
+        return True
+
+    def finish_refresh_halo(self):
+        """Wait for the data of a `start_refresh_halo`.  Calling this when
+        no refresh was started does nothing.
+        """
+        if self.in_parallel:
+            for i in range(self.narrays):
+                self.pa_exchanges[i].wait_refresh_remote_data()
+
+    def compute_boundary_particles(self, int layers=2):
+        """Split the local particles of each array into the
+        `boundary_particles` that are within `layers` cells of a cell with
+        remote particles and the remaining `interior_particles`.
+
+        As the cell size is at least the kernel radius, one layer covers
+        the neighbors and the others allow for the motion of the particles
+        in a time step.  The interior particles do not need the remote
+        particles and can be computed while the halo is being refreshed.
+        """
+        cdef int i, ix, iy, iz
+        cdef int lx = layers
+        cdef int ly = layers if self.dim > 1 else 0
+        cdef int lz = layers if self.dim > 2 else 0
+        cdef list near = []
+        cdef np.ndarray lindices, local, boundary
+
+        cx, cy, cz = get_cell_ids(self._get_occupied_cells(True))
+        for ix in range(-lx, lx + 1):
+            for iy in range(-ly, ly + 1):
+                for iz in range(-lz, lz + 1):
+                    near.append(get_cell_keys(cx + ix, cy + iy, cz + iz))
+        cdef np.ndarray near_remote = np.unique(np.concatenate(near))
+
+        self.boundary_particles = {}
+        self.interior_particles = {}
+        for i in range(self.narrays):
+            name = self.particles[i].name
+            lindices = self.cell_lindices[i]
+            local = lindices < self.num_local[i]
+            boundary = np.in1d(self.particle_keys[i], near_remote)
+            self.boundary_particles[name] = _get_uint_array(
+                lindices[local & boundary]
+            )
+            self.interior_particles[name] = _get_uint_array(
+                lindices[local & ~boundary]
+            )
+
+    def set_remote_props(self, dict props):
+        """Set the properties sent for the remote particles of each array.
+
+        Parameters
+        ----------
+
+        props : dict
+            Mapping from the name of an array to the properties of the
+            array that are read from its remote particles.  Arrays not
+            in the mapping send all their properties.
+
+        The coordinates, smoothing length and the particle indexing
+        properties are always sent as they are needed by the parallel
+        manager and the NNPS.  The load balancing exchange always sends
+        all the properties.  The other properties of the remote particles
+        are not updated, so this should not be used when the remote
+        particles are saved.
+        """
+        cdef ParticleArrayExchange pa_exchange
+        required = set(['x', 'y', 'z', 'h', 'gid', 'pid', 'tag'])
+        for pa_exchange in self.pa_exchanges:
+            name = pa_exchange.pa.name
+            if name not in props:
+                pa_exchange.remote_props = list(pa_exchange.lb_props)
+            else:
+                names = required.union(props[name])
+                pa_exchange.remote_props = [
+                    x for x in pa_exchange.lb_props if x in names
+                ]
+
     cpdef compute_cell_size(self):
         """Compute the cell size for the binning.
 
@@ -449,7 +808,7 @@ cdef class ParallelManager:
         self.cell_size = cell_size
 
     def update_cell_gids(self):
-        """Update global indices for the cell_map dictionary.
+        """Update global indices for the cells.
 
         The objects to be partitioned in this class are the cells and
         we need to number them uniquely across processors. The
@@ -460,7 +819,7 @@ cdef class ParallelManager:
         # update the cell gids
         cdef PyZoltan pz = self.pz
 
-        pz.num_local_objects = PyList_GET_SIZE( self.cell_list )
+        pz.num_local_objects = self.ncells_total
         pz._update_gid( self.cell_gid )
 
     def update_particle_gids(self):
@@ -475,19 +834,37 @@ cdef class ParallelManager:
     def update(self):
         cdef int lb_freq = self.lb_freq
         cdef int lb_count = self.lb_count
+        cdef bint rebalance
 
         lb_count += 1
 
+        # the work of the particles since the previous update is only
+        # needed to check the imbalance or to re-partition.
+        if self.lb_imbalance > 0:
+            self.compute_particle_weights()
+            rebalance = self.compute_imbalance() > self.lb_imbalance
+        else:
+            rebalance = ( lb_count == lb_freq )
+            if rebalance:
+                self.compute_particle_weights()
+
         # remove remote particles from a previous step
         self.remove_remote_particles()
 
-        if ( lb_count == lb_freq ):
+        if rebalance:
             self.update_partition()
             self.lb_count = 0
         else:
             self.migrate_partition()
             self.lb_count = lb_count
 
+        self.compute_boundary_particles()
+
+        # the particles have been re-ordered so the neighbors must be found
+        # again.
+        if self.nnps is not None:
+            self.nnps.force_rebuild()
+
     def update_partition(self):
         """Update the partition.
 
@@ -610,14 +987,11 @@ cdef class ParallelManager:
         a given list of particles to deal with.
 
         """
-        cdef dict cell_map = self.cell_map
         cdef int num_particles
         cdef UIntArray indices
 
-        # clear the indices for the cell_map.
-        self.cell_map.clear()
-        self.cell_list = []
-        self.ncells_total = 0
+        # remove the particles from the cells.
+        self._clear_cells()
 
         # compute the cell size
         if self.initial_update or self.update_cell_sizes:
@@ -642,12 +1016,20 @@ cdef class ParallelManager:
             indices = arange_uint(num_particles)
             self._bin( i, indices )
 
+        self._update_cells()
+
         # local number of cells at this point are the total number of cells
         self.ncells_local = self.ncells_total
 
     cdef _bin(self, int pa_index, UIntArray indices):
         """Bin a given particle array with indices.
 
+        The cell index of each particle is computed in parallel and
+        packed into a key (see `get_cell_keys`).  The particles are then
+        merged with the particles of the array binned before and sorted on
+        their keys, `_update_cells` must be called once all the particles
+        are binned.  No objects are created for the cells.
+
         Parameters
         ----------
 
@@ -659,63 +1041,139 @@ cdef class ParallelManager:
 
         """
         cdef NNPSParticleArrayWrapper pa_wrapper = self.pa_wrappers[ pa_index ]
-        cdef DoubleArray x = pa_wrapper.x
-        cdef DoubleArray y = pa_wrapper.y
-        cdef DoubleArray z = pa_wrapper.z
-        cdef UIntArray gid = pa_wrapper.gid
+        cdef double* x = pa_wrapper.x.data
+        cdef double* y = pa_wrapper.y.data
+        cdef double* z = pa_wrapper.z.data
+        cdef unsigned int* _indices = indices.data
 
-        cdef dict cell_map = self.cell_map
-        cdef list cell_list = self.cell_list
         cdef double cell_size = self.cell_size
+        cdef long num_particles = indices.length
+        cdef long j
+        cdef unsigned int i
 
-        cdef UIntArray lindices, gindices
-        cdef size_t num_particles, indexi
-        cdef ZOLTAN_ID_TYPE i
-
-        cdef Cell cell
-        cdef cIntPoint _cid
-        cdef IntPoint cid = IntPoint()
-        cdef cPoint pnt
-
-        cdef int ncells_total = 0
-        cdef int narrays = self.narrays
-        cdef int layers = self.ghost_layers
-
-        # now bin the particles
-        num_particles = indices.length
-        for indexi in range(num_particles):
-            i = indices.data[indexi]
-
-            pnt = cPoint_new( x.data[i], y.data[i], z.data[i] )
-            _cid = find_cell_id( pnt, cell_size )
+        if num_particles == 0:
+            return
 
-            cid = IntPoint_from_cIntPoint(_cid)
-
-            if not cell_map.has_key( cid ):
-                cell = Cell(cid=cid, cell_size=cell_size,
-                            narrays=self.narrays, layers=layers)
+        # the cell index of each particle
+        cdef np.ndarray[np.int32_t, ndim=1] cx = np.empty(
+            num_particles, dtype=np.int32
+        )
+        cdef np.ndarray[np.int32_t, ndim=1] cy = np.empty_like(cx)
+        cdef np.ndarray[np.int32_t, ndim=1] cz = np.empty_like(cx)
+        cdef int* _cx = <int*>cx.data
+        cdef int* _cy = <int*>cy.data
+        cdef int* _cz = <int*>cz.data
+
+        with nogil, parallel():
+            for j in prange(num_particles):
+                i = _indices[j]
+                find_cell_id_raw(
+                    x[i], y[i], z[i], cell_size, &_cx[j], &_cy[j], &_cz[j]
+                )
+
+        # sort the particles on the cell keys, the sort is stable so the
+        # particles in a cell remain in the order they were binned.
+        cdef np.ndarray keys = np.concatenate(
+            (self.particle_keys[pa_index], get_cell_keys(cx, cy, cz))
+        )
+        cdef np.ndarray lindices = np.concatenate(
+            (self.cell_lindices[pa_index], indices.get_npy_array())
+        )
+        order = np.argsort(keys, kind='mergesort')
+        lindices = lindices[order]
 
-                # store this cell in the cells list and cell map
-                PyList_Append( cell_list, cell )
-                cell_map[ cid ] = cell
+        self.particle_keys[pa_index] = keys[order]
+        self.cell_lindices[pa_index] = lindices
+        self.cell_gindices[pa_index] = pa_wrapper.gid.get_npy_array()[lindices]
 
-                ncells_total = ncells_total + 1
+    cdef _clear_cells(self):
+        cdef int i
+        self.cell_keys = np.empty(0, dtype=np.uint64)
+        self.particle_keys = [
+            np.empty(0, dtype=np.uint64) for i in range(self.narrays)
+        ]
+        self.cell_lindices = [
+            np.empty(0, dtype=np.uint32) for i in range(self.narrays)
+        ]
+        self.cell_gindices = [
+            np.empty(0, dtype=np.uint32) for i in range(self.narrays)
+        ]
+        self.cell_offsets = [
+            np.zeros(1, dtype=np.int64) for i in range(self.narrays)
+        ]
+        self.ncells_total = 0
 
-            # add this particle to the list of indicies
-            cell = cell_map[ cid ]
+    cdef _update_cells(self):
+        """Find the sorted keys of the cells with any particles and the
+        offsets of the cells into the sorted particles of each array, the
+        particles of cell `i` in array `j` are at
+        `cell_offsets[j][i]:cell_offsets[j][i+1]`.
+        """
+        cdef np.ndarray keys, offsets
+        cdef np.ndarray cell_keys = np.unique(
+            np.concatenate(self.particle_keys)
+        )
 
-            lindices = cell.lindices[pa_index]
-            gindices = cell.gindices[pa_index]
+        self.cell_offsets = []
+        for keys in self.particle_keys:
+            offsets = np.empty(cell_keys.shape[0] + 1, dtype=np.int64)
+            offsets[:-1] = np.searchsorted(keys, cell_keys)
+            offsets[-1] = keys.shape[0]
+            self.cell_offsets.append(offsets)
 
-            lindices.append( i )
-            gindices.append( gid.data[i] )
+        self.cell_keys = cell_keys
+        self.ncells_total = cell_keys.shape[0]
 
-            # increment the size of the cells to reflect the added
-            # particle. The size will be used to set the weights.
-            cell.size += 1
+    cdef np.ndarray _get_occupied_cells(self, bint remote):
+        cdef int i
+        cdef np.ndarray lindices
+        cdef list keys = []
+        for i in range(self.narrays):
+            lindices = self.cell_lindices[i]
+            if remote:
+                mask = lindices >= self.num_local[i]
+            else:
+                mask = lindices < self.num_local[i]
+            keys.append(self.particle_keys[i][mask])
+        return np.unique(np.concatenate(keys))
+
+    cdef tuple _get_cell_particles(self, int pa_index, np.ndarray cells):
+        """Return the positions of the particles of the given cells, cell
+        by cell, in the sorted particles of the array and the number of
+        particles of each cell.
+        """
+        cdef np.ndarray offsets = self.cell_offsets[pa_index]
+        cdef np.ndarray starts = offsets[cells]
+        cdef np.ndarray counts = offsets[cells + 1] - starts
+        cdef np.ndarray ends = np.cumsum(counts)
+        positions = np.repeat(starts - ends + counts, counts) + \
+            np.arange(ends[-1] if ends.shape[0] > 0 else 0)
+        return positions, counts
+
+    cdef _set_export_lists(self, np.ndarray cells, np.ndarray procs):
+        """Export the particles of each of the given local cells to the
+        corresponding processor.
+        """
+        cdef int pa_index
+        cdef ParticleArrayExchange pa_exchange
+        for pa_index in range(self.narrays):
+            pa_exchange = self.pa_exchanges[pa_index]
+            pa_exchange.reset_lists()
 
-        # update the total number of cells
-        self.ncells_total = self.ncells_total + ncells_total
+            positions, counts = self._get_cell_particles(pa_index, cells)
+            _extend_array(
+                pa_exchange.exportParticleLocalids,
+                self.cell_lindices[pa_index][positions]
+            )
+            _extend_array(
+                pa_exchange.exportParticleGlobalids,
+                self.cell_gindices[pa_index][positions]
+            )
+            _extend_array(
+                pa_exchange.exportParticleProcs, np.repeat(procs, counts)
+            )
+            pa_exchange.numParticleExport = \
+                pa_exchange.exportParticleProcs.length
 
     def update_local_data(self):
         """Update the cell map after load balance.
@@ -729,10 +1187,8 @@ cdef class ParallelManager:
         cdef int num_particles, i
         cdef UIntArray indices
 
-        # clear the local cell_map dict
-        self.cell_map.clear()
-        self.cell_list = []
-        self.ncells_total = 0
+        # remove the particles from the cells
+        self._clear_cells()
 
         for i in range(self.narrays):
             pa_exchange = self.pa_exchanges[i]
@@ -746,6 +1202,7 @@ cdef class ParallelManager:
             indices = arange_uint( num_particles )
             self._bin(i, indices)
 
+        self._update_cells()
         self.ncells_local = self.ncells_total
 
     def update_remote_data(self):
@@ -774,30 +1231,27 @@ cdef class ParallelManager:
             indices = arange_uint( num_local, num_local + num_remote )
             self._bin( i, indices )
 
+        self._update_cells()
+
         # compute the number of remote cells added
+        self.ncells_local = self._get_occupied_cells(False).shape[0]
         self.ncells_remote = self.ncells_total - self.ncells_local
 
     def save_partition(self, fname, count=0):
         """Collect cell data from processors and save"""
         # get the global number of cells
-        cdef cPoint centroid
         cdef int ncells_total = self.ncells_total
-        cdef int ncells_local = self.ncells_local
+        cdef double cell_size = self.cell_size
 
         # cell centroid arrays
-        cdef double[:] x = np.zeros( shape=ncells_total, dtype=np.float64 )
-        cdef double[:] y = np.zeros( shape=ncells_total, dtype=np.float64 )
-        cdef int[:] lid = np.zeros( shape=ncells_total, dtype=np.int32 )
-
-        for i in range( ncells_total ):
-            cell = self.cell_list[i]; centroid = cell.centroid
-            x[i] = centroid.x; y[i] = centroid.y
-            lid[i] = i
-
-        cdef int[:] tag = np.zeros(shape=(ncells_total,), dtype=np.int32)
-        tag[ncells_local:] = 1
+        cx, cy, cz = get_cell_ids(self.cell_keys)
+        x = (cx + 0.5)*cell_size
+        y = (cy + 0.5)*cell_size
+        lid = np.arange(ncells_total, dtype=np.int32)
 
-        cdef double cell_size = self.cell_size
+        # the cells without local particles are tagged
+        local = np.in1d(self.cell_keys, self._get_occupied_cells(False))
+        tag = np.logical_not(local).astype(np.int32)
 
         # save the partition locally
         fname = fname + '/partition%03d.%d'%(count, self.rank)
@@ -809,6 +1263,90 @@ cdef class ParallelManager:
     def set_lb_freq(self, int lb_freq):
         self.lb_freq = lb_freq
 
+    def set_lb_imbalance(self, double lb_imbalance):
+        """Load balance whenever the imbalance of the work (see
+        `compute_imbalance`) exceeds the given value instead of every
+        `lb_freq` updates.  A value of zero uses the `lb_freq`.
+        """
+        if lb_imbalance < 0:
+            raise ValueError('Invalid lb_imbalance %s'%lb_imbalance)
+        self.lb_imbalance = lb_imbalance
+
+    def set_lb_weight(self, str lb_weight):
+        """Set the measure of the work of the particles used to weigh the
+        cells when load balancing and to compute the imbalance.
+
+        'particles' uses the number of particles and 'neighbors' the number
+        of neighbors of each particle (plus one) found by the NNPS (see
+        `set_nnps`) in the previous time step.  The neighbors are counted
+        from the neighbor cache, which is turned on for the NNPS.
+        """
+        if lb_weight not in ('particles', 'neighbors'):
+            raise ValueError('Invalid lb_weight %s'%lb_weight)
+        self.lb_weight = lb_weight
+        self._setup_nnps_cache()
+
+    def set_nnps(self, nnps):
+        """Set the NNPS used for the computations, this is used to count the
+        neighbors of the particles and its neighbor lists are rebuilt after
+        every `update`.
+        """
+        self.nnps = nnps
+        self._setup_nnps_cache()
+
+    def _setup_nnps_cache(self):
+        # The neighbor counts are only available from the neighbor cache.
+        if self.lb_weight == 'neighbors' and self.nnps is not None:
+            self.nnps.use_cache = True
+
+    def compute_particle_weights(self):
+        """Update the `particle_weights` with the neighbor counts from the
+        neighbor cache of the NNPS if the `lb_weight` is 'neighbors'.
+        Otherwise (or when no NNPS is set) they are None and every particle
+        has the same weight.
+        """
+        cdef UIntArray counts
+        cdef list weights = []
+        self.particle_weights = None
+        if self.lb_weight != 'neighbors' or self.nnps is None:
+            return
+
+        for i in range(self.narrays):
+            counts = UIntArray()
+            if not self.nnps.get_neighbor_counts(i, counts):
+                return
+            weights.append(counts)
+        self.particle_weights = weights
+
+    cdef double _get_particle_weight(self, int pa_index, size_t i):
+        cdef UIntArray weights
+        if self.particle_weights is None:
+            return 1.0
+        weights = self.particle_weights[pa_index]
+        if i < weights.length:
+            return weights.data[i] + 1.0
+        return 1.0
+
+    def compute_imbalance(self):
+        """Compute the imbalance of the work of the local particles across
+        the processors, i.e. the maximum work over the average work minus
+        one, and store it in `imbalance`.
+        """
+        cdef double work = 0.0
+        cdef size_t i
+        cdef int pa_index
+        for pa_index in range(self.narrays):
+            for i in range(self.num_local[pa_index]):
+                work += self._get_particle_weight(pa_index, i)
+
+        cdef double max_work = self.comm.allreduce(work, op=mpi.MAX)
+        cdef double total_work = self.comm.allreduce(work, op=mpi.SUM)
+        if total_work > 0:
+            self.imbalance = max_work*self.size/total_work - 1.0
+        else:
+            self.imbalance = 0.0
+        return self.imbalance
+
     def load_balance(self):
         raise NotImplementedError("ParallelManager::load_balance")
 
@@ -927,8 +1465,10 @@ cdef class ParallelManager:
             Neighbors for the requested particle are stored here.
 
         """
-        cdef dict cell_map = self.cell_map
-        cdef Cell cell
+        cdef np.ndarray cell_keys = self.cell_keys
+        cdef long[:] offsets = self.cell_offsets[src_index]
+        cdef unsigned int[:] lindices = self.cell_lindices[src_index]
+        cdef long k, ncells = cell_keys.shape[0]
 
         cdef NNPSParticleArrayWrapper src = self.pa_wrappers[ src_index ]
         cdef NNPSParticleArrayWrapper dst = self.pa_wrappers[ dst_index ]
@@ -947,14 +1487,11 @@ cdef class ParallelManager:
 
         cdef double radius_scale = self.radius_scale
         cdef double cell_size = self.cell_size
-        cdef UIntArray lindices
-        cdef size_t indexj
+        cdef long indexj
         cdef ZOLTAN_ID_TYPE j
 
         cdef cPoint xi = cPoint_new(d_x.data[d_idx], d_y.data[d_idx], d_z.data[d_idx])
-        cdef cIntPoint _cid = find_cell_id( xi, cell_size )
-        cdef IntPoint cid = IntPoint_from_cIntPoint( _cid )
-        cdef IntPoint cellid = IntPoint(0, 0, 0)
+        cdef cIntPoint cid = find_cell_id( xi, cell_size )
 
         cdef cPoint xj
         cdef double xij
@@ -965,17 +1502,17 @@ cdef class ParallelManager:
         cdef int nnbrs = 0
 
         cdef int ix, iy, iz
-        for ix in [cid.data.x -1, cid.data.x, cid.data.x + 1]:
-            for iy in [cid.data.y - 1, cid.data.y, cid.data.y + 1]:
-                for iz in [cid.data.z -1, cid.data.z, cid.data.z + 1]:
-                    cellid.data.x = ix; cellid.data.y = iy
-                    cellid.data.z = iz
-
-                    if cell_map.has_key( cellid ):
-                        cell = cell_map[ cellid ]
-                        lindices = cell.lindices[src_index]
-                        for indexj in range( lindices.length ):
-                            j = lindices.data[indexj]
+        for ix in [cid.x -1, cid.x, cid.x + 1]:
+            for iy in [cid.y - 1, cid.y, cid.y + 1]:
+                for iz in [cid.z -1, cid.z, cid.z + 1]:
+                    key = get_cell_keys(
+                        np.array([ix]), np.array([iy]), np.array([iz])
+                    )
+                    k = np.searchsorted(cell_keys, key)[0]
+
+                    if k < ncells and cell_keys[k] == key[0]:
+                        for indexj in range( offsets[k], offsets[k + 1] ):
+                            j = lindices[indexj]
 
                             xj = cPoint_new( s_x.data[j], s_y.data[j], s_z.data[j] )
                             xij = cPoint_distance( xi, xj )
@@ -997,10 +1534,10 @@ cdef class ZoltanParallelManager(ParallelManager):
     """Base class for Zoltan enabled parallel cell managers.
 
     To partition a list of arrays, we do an NNPS like box sort on all
-    arrays to create a global spatial indexing structure. The cell_map
-    are then used as 'objects' to be partitioned by Zoltan. The cell_map
-    dictionary (cell-map) need not be unique across processors. We are
-    responsible for assignning unique global ids for the cells.
+    arrays to create a global spatial indexing structure. The cells
+    are then used as 'objects' to be partitioned by Zoltan. The cells
+    need not be unique across processors. We are responsible for
+    assignning unique global ids for the cells.
 
     The Zoltan generated (cell) import/export lists are then used to
     construct particle import/export lists which are used to perform
@@ -1059,58 +1596,16 @@ cdef class ZoltanParallelManager(ParallelManager):
 
         """
         # these are the Zoltan generated lists that correspond to cells
-        cdef UIntArray exportCellLocalids = self.exportCellLocalids
-        cdef UIntArray exportCellGlobalids = self.exportCellGlobalids
-        cdef IntArray exportCellProcs = self.exportCellProcs
         cdef int numCellExport = self.numCellExport
+        cdef np.ndarray cells = self.exportCellLocalids.get_npy_array()[
+            :numCellExport
+        ].astype(np.int64)
+        cdef np.ndarray procs = self.exportCellProcs.get_npy_array()[
+            :numCellExport
+        ]
 
-        # the local cell map and cellids
-        cdef int narrays = self.narrays
-        cdef list cell_list = self.cell_list
-        cdef ParticleArrayExchange pa_exchange
-
-        cdef UIntArray exportLocalids, exportGlobalids
-        cdef IntArray exportProcs
-
-        cdef int indexi, i, j, export_proc, nindices, pa_index
-        cdef UIntArray lindices, gindices
-        cdef IntPoint cellid
-        cdef Cell cell
-
-        # initialize the particle export lists
-        for pa_index in range(self.narrays):
-            pa_exchange = self.pa_exchanges[pa_index]
-            pa_exchange.reset_lists()
-
-        # Iterate over the cells to be exported
-        for indexi in range(numCellExport):
-            i = <int>exportCellLocalids[indexi]            # local index for the cell to export
-            cell = cell_list[i]                            # local cell to export
-            export_proc = exportCellProcs.data[indexi]     # processor to export cell to
-
-            # populate the export lists for each array in this cell
-            for pa_index in range(self.narrays):
-                # the ParticleArrayExchange object for this array
-                pa_exchange = self.pa_exchanges[pa_index]
-
-                exportLocalids = pa_exchange.exportParticleLocalids
-                exportGlobalids = pa_exchange.exportParticleGlobalids
-                exportProcs = pa_exchange.exportParticleProcs
-
-                # local and global indices in this cell
-                lindices = cell.lindices[pa_index]
-                gindices = cell.gindices[pa_index]
-                nindices = lindices.length
-
-                for j in range( nindices ):
-                    exportLocalids.append( lindices.data[j] )
-                    exportGlobalids.append( gindices.data[j] )
-                    exportProcs.append( export_proc )
-
-        # save the number of particles
-        for pa_index in range(narrays):
-            pa_exchange = self.pa_exchanges[pa_index]
-            pa_exchange.numParticleExport = pa_exchange.exportParticleProcs.length
+        # populate the export lists for each array from the cells
+        self._set_export_lists(cells, procs)
 
     def compute_remote_particles(self):
         """Compute remote particles.
@@ -1122,81 +1617,45 @@ cdef class ZoltanParallelManager(ParallelManager):
         """
         # the PyZoltan object used to find intersections
         cdef PyZoltan pz = self.pz
-
-        cdef Cell cell
-        cdef cPoint boxmin, boxmax
-
-        cdef object comm = self.comm
-        cdef int rank = self.rank, narrays = self.narrays
-
-        cdef list cell_list = self.cell_list
-        cdef UIntArray lindices, gindices
+        cdef int rank = self.rank
 
         cdef np.ndarray nbrprocs
         cdef np.ndarray[ndim=1, dtype=np.int32_t] procs
+        cdef int nbrproc
+        cdef long i
 
-        cdef int nbrproc, num_particles, indexi, pa_index
-        cdef ZOLTAN_ID_TYPE i
-
-        cdef int numprocs = 0
-
-        cdef ParticleArrayExchange pa_exchange
-        cdef UIntArray exportGlobalids, exportLocalids
-        cdef IntArray exportProcs
-
-        # reset the export lists
-        for pa_index in range(narrays):
-            pa_exchange = self.pa_exchanges[pa_index]
-            pa_exchange.reset_lists()
-
-        # Chaeck for each cell
-        for cell in cell_list:
+        cdef list export_cells = []
+        cdef list export_procs = []
 
-            # get the bounding box for this cell
-            boxmin = cell.boxmin; boxmax = cell.boxmax
-
-            numprocs = pz.Zoltan_Box_PP_Assign(
-                boxmin.x, boxmin.y, boxmin.z,
-                boxmax.x, boxmax.y, boxmax.z)
+        # the bounding boxes of the cells cover the ghost layers
+        cdef double cell_size = self.cell_size
+        cdef double extent = (self.ghost_layers + 0.5)*cell_size
+        cx, cy, cz = get_cell_ids(self.cell_keys)
+        cdef double[:] xc = (cx + 0.5)*cell_size
+        cdef double[:] yc = (cy + 0.5)*cell_size
+        cdef double[:] zc = (cz + 0.5)*cell_size
+
+        # Check for each cell
+        for i in range(self.ncells_total):
+            pz.Zoltan_Box_PP_Assign(
+                xc[i] - extent, yc[i] - extent, zc[i] - extent,
+                xc[i] + extent, yc[i] + extent, zc[i] + extent
+            )
 
             # the array of processors that this box intersects with
             procs = pz.procs
 
             # array of neighboring processors
             nbrprocs = procs[np.where( (procs != -1) * (procs != rank) )[0]]
-
-            if nbrprocs.size > 0:
-                cell.is_boundary = True
-
-                # store the neighboring processors for this cell
-                cell.nbrprocs.resize( nbrprocs.size )
-                cell.nbrprocs.set_data( nbrprocs )
-
-                # populate the particle export lists for each array
-                for pa_index in range(narrays):
-                    pa_exchange = self.pa_exchanges[pa_index]
-
-                    exportGlobalids = pa_exchange.exportParticleGlobalids
-                    exportLocalids = pa_exchange.exportParticleLocalids
-                    exportProcs = pa_exchange.exportParticleProcs
-
-                    # local and global indices in this cell
-                    lindices = cell.lindices[pa_index]
-                    gindices = cell.gindices[pa_index]
-                    num_particles = lindices.length
-
-                    for nbrproc in nbrprocs:
-                        for indexi in range( num_particles ):
-                            i = lindices.data[indexi]
-
-                            exportLocalids.append( i )
-                            exportGlobalids.append( gindices.data[indexi] )
-                            exportProcs.append( nbrproc )
-
-        # set the numParticleExport for each array
-        for pa_index in range(narrays):
-            pa_exchange = self.pa_exchanges[pa_index]
-            pa_exchange.numParticleExport = pa_exchange.exportParticleProcs.length
+            for nbrproc in nbrprocs:
+                export_cells.append(i)
+                export_procs.append(nbrproc)
+
+        # populate the particle export lists for each array
+        self._set_export_lists(
+            np.asarray(export_cells, dtype=np.int64),
+            np.asarray(export_procs, dtype=np.int32)
+        )
 
     def load_balance(self):
         """Use Zoltan to generate import/export lists for the cells.
@@ -1309,11 +1768,10 @@ cdef class ZoltanParallelManagerGeometric(ZoltanParallelManager):
 
         """
         cdef ZoltanGeometricPartitioner pz = self.pz
-        cdef list cell_list = self.cell_list
 
         cdef int num_local_objects = pz.num_local_objects
         cdef double num_global_objects1 = 1.0/pz.num_global_objects
-        cdef double weight
+        cdef double cell_size = self.cell_size
 
         cdef DoubleArray x = self.cx
         cdef DoubleArray y = self.cy
@@ -1322,10 +1780,6 @@ cdef class ZoltanParallelManagerGeometric(ZoltanParallelManager):
         # the weights array for PyZoltan
         cdef DoubleArray weights = pz.weights
 
-        cdef int i
-        cdef Cell cell
-        cdef cPoint centroid
-
         # resize the coordinate and PyZoltan weight arrays
         x.resize( num_local_objects )
         y.resize( num_local_objects )
@@ -1333,17 +1787,35 @@ cdef class ZoltanParallelManagerGeometric(ZoltanParallelManager):
 
         weights.resize( num_local_objects )
 
-        # populate the arrays
-        for i in range( num_local_objects ):
-            cell = cell_list[ i ]
-            centroid = cell.centroid
-
-            # weights are defined as cell.size/num_total
-            weights.data[i] = num_global_objects1 * cell.size
-
-            x.data[i] = centroid.x
-            y.data[i] = centroid.y
-            z.data[i] = centroid.z
+        # populate the arrays with the cell centroids, the weights are
+        # defined as the work of the cell/num_total
+        cx, cy, cz = get_cell_ids(self.cell_keys[:num_local_objects])
+        x.get_npy_array()[:] = (cx + 0.5)*cell_size
+        y.get_npy_array()[:] = (cy + 0.5)*cell_size
+        z.get_npy_array()[:] = (cz + 0.5)*cell_size
+        weights.get_npy_array()[:] = num_global_objects1 * \
+            self._get_cell_weights()[:num_local_objects]
+
+    cdef np.ndarray _get_cell_weights(self):
+        """The sum of the weights of the particles in each cell."""
+        cdef int pa_index
+        cdef np.ndarray offsets, lindices, counts, valid, w, wsum
+        cdef np.ndarray weight = np.zeros(self.ncells_total)
+        for pa_index in range(self.narrays):
+            offsets = self.cell_offsets[pa_index]
+            if self.particle_weights is None:
+                weight += np.diff(offsets)
+                continue
+            # see _get_particle_weight
+            lindices = self.cell_lindices[pa_index]
+            counts = self.particle_weights[pa_index].get_npy_array()
+            valid = lindices < counts.shape[0]
+            w = np.ones(lindices.shape[0])
+            w[valid] = counts[lindices[valid]] + 1.0
+            wsum = np.zeros(w.shape[0] + 1)
+            wsum[1:] = np.cumsum(w)
+            weight += wsum[offsets[1:]] - wsum[offsets[:-1]]
+        return weight
 
     def migrate_particles(self):
         """Update an existing partition"""
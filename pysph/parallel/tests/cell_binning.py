@@ -0,0 +1,101 @@
+"""Check the binning of the particles into cells by the parallel manager.
+
+The local and remote particles of each array are checked to be in the
+cell of their position, the interior and boundary particles to split the
+local particles and the neighbors found with the cells to match a brute
+force search.
+"""
+import mpi4py.MPI as mpi
+
+import numpy as np
+from numpy import random
+
+from pyzoltan.core.carray import UIntArray
+
+from pysph.parallel.parallel_manager import (ZoltanParallelManagerGeometric,
+    get_cell_keys, get_cell_ids)
+from pysph.base.utils import get_particle_array_wcsph
+
+comm = mpi.COMM_WORLD
+rank = comm.Get_rank()
+size = comm.Get_size()
+
+numMyPoints = 1<<9
+dim = 2
+dx = np.power(1.0/(size*numMyPoints), 1.0/dim)
+hdx = 1.3
+
+random.seed(rank)
+particles = []
+for name in ('fluid', 'solid'):
+    x = random.random(numMyPoints); y = random.random(numMyPoints)
+    h = np.ones_like(x)*hdx*dx
+    particles.append(get_particle_array_wcsph(name=name, x=x, y=y, h=h))
+
+pm = ZoltanParallelManagerGeometric(dim=dim, particles=particles, comm=comm)
+pm.pz.set_lb_method("RCB")
+
+
+def check_binning(pm):
+    cell_size = pm.cell_size
+    cell_keys = pm.cell_keys
+    assert np.all(cell_keys[1:] > cell_keys[:-1])
+    assert pm.ncells_total == cell_keys.shape[0]
+    assert pm.ncells_local + pm.ncells_remote == pm.ncells_total
+
+    cx, cy, cz = get_cell_ids(cell_keys)
+    assert np.all(get_cell_keys(cx, cy, cz) == cell_keys)
+
+    for i, pa in enumerate(pm.particles):
+        n = pa.get_number_of_particles()
+        lindices = pm.cell_lindices[i]
+        assert np.array_equal(np.sort(lindices), np.arange(n))
+        assert np.all(pm.cell_gindices[i] == pa.gid[lindices])
+
+        # every particle is in the cell of its position
+        keys = get_cell_keys(
+            np.floor(pa.x[lindices]/cell_size).astype(np.int64),
+            np.floor(pa.y[lindices]/cell_size).astype(np.int64),
+            np.floor(pa.z[lindices]/cell_size).astype(np.int64)
+        )
+        assert np.all(keys == pm.particle_keys[i])
+
+        offsets = pm.cell_offsets[i]
+        assert offsets.shape[0] == pm.ncells_total + 1
+        assert offsets[-1] == n
+        counts = np.diff(offsets)
+        assert np.all(np.repeat(cell_keys, counts) == keys)
+
+        # the interior and boundary particles split the local particles
+        interior = pm.interior_particles[pa.name].get_npy_array()
+        boundary = pm.boundary_particles[pa.name].get_npy_array()
+        local = np.concatenate((interior, boundary))
+        assert np.array_equal(np.sort(local), np.arange(pm.num_local[i]))
+
+    # the neighbors match a brute force search
+    nbrs = UIntArray()
+    for src_index, src in enumerate(pm.particles):
+        for dst_index, dst in enumerate(pm.particles):
+            for d_idx in range(0, pm.num_local[dst_index], 17):
+                pm.get_nearest_particles(src_index, dst_index, d_idx, nbrs)
+                xij = np.sqrt(
+                    (src.x - dst.x[d_idx])**2 + (src.y - dst.y[d_idx])**2 +
+                    (src.z - dst.z[d_idx])**2
+                )
+                hi = pm.radius_scale*dst.h[d_idx]
+                hj = pm.radius_scale*src.h
+                expect = np.flatnonzero((xij < hi) | (xij < hj))
+                found = np.sort(nbrs.get_npy_array()[:nbrs.length])
+                assert np.array_equal(found, expect)
+
+
+# a full update with load balancing
+pm.update()
+check_binning(pm)
+
+# move the particles and update without load balancing
+pm.set_lb_freq(100)
+for pa in particles:
+    pa.x[:pa.num_real_particles] += 0.1*dx
+pm.update()
+check_binning(pm)
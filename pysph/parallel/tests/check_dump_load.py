@@ -7,6 +7,7 @@ from os.path import join
 import shutil
 from tempfile import mkdtemp
 
+from pysph import has_h5py
 from pysph.base.particle_array import ParticleArray
 from pysph.solver.utils import dump, load
 
@@ -15,11 +16,27 @@ def assert_lists_same(l1, l2):
     result = list(sorted(l2))
     assert l1 == l2, "Expected %s, got %s"%(l1, l2)
 
+def check_loaded_data(filename, pa, size):
+    data = load(filename)
+    pa1 = data["arrays"]["fluid"]
+
+    assert_lists_same(pa.properties.keys(), pa1.properties.keys())
+    assert_lists_same(pa.constants.keys(), pa1.constants.keys())
+
+    expect = np.ones(5*size)
+    for i in range(size):
+        expect[5*i:5*(i+1)] = i
+
+    assert np.allclose(pa1.x, expect, atol=1e-14), \
+        "Expected %s, got %s"%(expect, pa1.x)
+
 comm = mpi.COMM_WORLD
 rank = comm.Get_rank()
 size = comm.Get_size()
 
-root = mkdtemp()
+# The parallel writes need the same directory on all processors.
+root = mkdtemp() if rank == 0 else None
+root = comm.bcast(root, root=0)
 filename = join(root, 'test.npz')
 
 x = np.ones(5, dtype=float)*rank
@@ -28,17 +45,14 @@ pa = ParticleArray(name='fluid', constants={'c1': 0.0, 'c2': [0.0, 0.0]}, x=x)
 try:
     dump(filename, [pa], {}, mpi_comm=comm)
     if rank == 0:
-        data = load(filename)
-        pa1 = data["arrays"]["fluid"]
+        check_loaded_data(filename, pa, size)
 
-        assert_lists_same(pa.properties.keys(), pa1.properties.keys())
-        assert_lists_same(pa.constants.keys(), pa1.constants.keys())
-
-        expect = np.ones(5*size)
-        for i in range(size):
-            expect[5*i:5*(i+1)] = i
-
-        assert np.allclose(pa1.x, expect, atol=1e-14), \
-            "Expected %s, got %s"%(expect, pa1.x)
+    if has_h5py():
+        filename = join(root, 'test_parallel.hdf5')
+        dump(filename, [pa], {}, mpi_comm=comm, parallel=True)
+        if rank == 0:
+            check_loaded_data(filename, pa, size)
 finally:
-    shutil.rmtree(root)
+    comm.barrier()
+    if rank == 0:
+        shutil.rmtree(root)
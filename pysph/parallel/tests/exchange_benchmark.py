@@ -0,0 +1,94 @@
+"""Benchmark the packed and the per-property exchange of remote particles.
+
+Every processor creates a particle array with many properties and sends a
+fraction of its particles to the next processor as remote particles using
+``ParticleArrayExchange.remote_exchange_data``.  This is done with both the
+packed (single message) and the per-property exchange, the received data is
+checked to be the same and the time taken is printed.  Run it with any
+number of processors, for example::
+
+    $ mpirun -n 4 python exchange_benchmark.py --np 100000 --nprops 40
+
+"""
+from argparse import ArgumentParser
+
+import mpi4py.MPI as mpi
+import numpy as np
+
+from pysph.base.utils import get_particle_array
+from pysph.parallel.parallel_manager import ParticleArrayExchange
+
+
+def create_exchange(comm, n, nprops, packed):
+    rank = comm.Get_rank()
+    x = np.arange(n, dtype=np.float64) + rank*n
+    props = dict(('p%d' % i, x*(i + 1)) for i in range(nprops))
+    pa = get_particle_array(name='fluid', x=x, gid=x.astype(np.uint32),
+                            **props)
+    pae = ParticleArrayExchange(pa_index=0, pa=pa, comm=comm)
+    pae.packed = packed
+    return pae
+
+
+def set_export_lists(pae, comm, frac):
+    n = pae.num_local
+    num_export = int(n*frac)
+    pae.reset_lists()
+    pae.numParticleExport = num_export
+    pae.exportParticleLocalids.resize(num_export)
+    pae.exportParticleLocalids.set_data(
+        np.arange(n - num_export, n, dtype=np.uint32)
+    )
+    pae.exportParticleProcs.resize(num_export)
+    pae.exportParticleProcs.set_data(
+        np.ones(num_export, dtype=np.int32)*((comm.Get_rank() + 1) %
+                                             comm.Get_size())
+    )
+
+
+def run(comm, n, nprops, frac, repeat, packed):
+    pae = create_exchange(comm, n, nprops, packed)
+    set_export_lists(pae, comm, frac)
+    times = []
+    for i in range(repeat):
+        pae.remove_remote_particles()
+        comm.barrier()
+        start = mpi.Wtime()
+        pae.remote_exchange_data()
+        times.append(mpi.Wtime() - start)
+    elapsed = comm.allreduce(min(times), op=mpi.MAX)
+    return pae.pa, elapsed
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--np", action="store", type=int, dest="np",
+                        default=10000, help="Number of particles per rank.")
+    parser.add_argument("--nprops", action="store", type=int, dest="nprops",
+                        default=40, help="Number of extra properties.")
+    parser.add_argument("--frac", action="store", type=float, dest="frac",
+                        default=0.1, help="Fraction of particles sent.")
+    parser.add_argument("--repeat", action="store", type=int, dest="repeat",
+                        default=5, help="Number of exchanges to time.")
+    options = parser.parse_args()
+
+    comm = mpi.COMM_WORLD
+    args = (comm, options.np, options.nprops, options.frac, options.repeat)
+    pa_packed, t_packed = run(*args, packed=True)
+    pa_unpacked, t_unpacked = run(*args, packed=False)
+
+    n = pa_packed.get_number_of_particles()
+    assert n == pa_unpacked.get_number_of_particles()
+    for prop in pa_packed.properties:
+        expect = pa_unpacked.properties[prop].get_npy_array()
+        result = pa_packed.properties[prop].get_npy_array()
+        assert np.all(expect == result), "Property %s differs." % prop
+
+    if comm.Get_rank() == 0:
+        print("Per-property exchange: %.6g s" % t_unpacked)
+        print("Packed exchange: %.6g s" % t_packed)
+        print("Speedup: %.3g" % (t_unpacked/t_packed))
+
+
+if __name__ == '__main__':
+    main()
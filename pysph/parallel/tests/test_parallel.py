@@ -27,6 +27,26 @@ class ParticleArrayExchangeTestCase(unittest.TestCase):
     def test_remote_exchange(self):
         run_parallel_script.run(filename='remote_exchange.py', nprocs=4, path=path)
 
+    @mark.parallel
+    def test_packed_exchange_matches_per_property_exchange(self):
+        args = ['--np=1000', '--nprops=10', '--repeat=1']
+        run_parallel_script.run(
+            filename='exchange_benchmark.py', args=args, nprocs=4, path=path
+        )
+
+
+class CellBinningTestCase(unittest.TestCase):
+
+    @classmethod
+    def setup_class(cls):
+        importorskip("mpi4py.MPI")
+        importorskip("pyzoltan.core.zoltan")
+
+    @mark.parallel
+    def test_cell_binning(self):
+        run_parallel_script.run(filename='cell_binning.py', nprocs=4,
+                                path=path)
+
 
 class SummationDensityTestCase(unittest.TestCase):
 
@@ -44,6 +44,22 @@ class ParallelTests(ExampleTestCase):
             extra_parallel_kwargs=extra_parallel_kwargs
         )
 
+    @mark.parallel
+    def test_elliptical_drop_overlaps_halo_refresh(self):
+        # The second stage of the integrator computes the interior particles
+        # while the halo is refreshed, with and without the Verlet lists.
+        for skin in (0.0, 0.1):
+            serial_kwargs = dict(
+                sort_gids=None, kernel='CubicSpline', tf=0.0005,
+                nnps_skin=skin
+            )
+            extra_parallel_kwargs = dict(ghost_layers=1, lb_freq=5)
+            self.run_example(
+                'elliptical_drop.py', nprocs=2, atol=1e-11,
+                serial_kwargs=serial_kwargs,
+                extra_parallel_kwargs=extra_parallel_kwargs
+            )
+
     @mark.parallel
     def test_ldcavity_example(self):
         max_steps = 150
@@ -22,6 +22,8 @@ from pysph.base.nnps import LinkedListNNPS, BoxSortNNPS, SpatialHashNNPS, \
 from pysph.base import kernels
 from pysph.solver.controller import CommandManager
 from pysph.solver.utils import mkdir, load, get_files
+from pysph.sph.acceleration_eval import AccelerationEval
+from pysph.sph.sph_compiler import SPHCompiler
 
 # conditional parallel imports
 from pysph import has_mpi, has_zoltan, in_parallel
@@ -60,7 +62,39 @@ def is_using_ipython():
 def list_all_kernels():
     """Return list of available kernels.
     """
-    return [n for n in dir(kernels) if inspect.isclass(getattr(kernels, n))]
+    # The TabulatedKernel wraps another kernel, see --tabulate-kernel.
+    return [n for n in dir(kernels) if inspect.isclass(getattr(kernels, n))
+            and n != 'TabulatedKernel']
+
+
+def combine_profiles(profiles):
+    """Combine the profiles (see `AccelerationEval.get_profile_info`) of
+    several processors.
+
+    Each section has the maximum `time` over the processors, the
+    `mean_time` and the `rank_times` of each processor.  The result is
+    sorted by the maximum time in decreasing order.
+    """
+    nprocs = len(profiles)
+    combined = {}
+    for rank, profile in enumerate(profiles):
+        for info in profile:
+            name = info['name']
+            if name not in combined:
+                data = dict(info)
+                data['rank_times'] = [0.0]*nprocs
+                data['calls'] = 0
+                combined[name] = data
+            data = combined[name]
+            data['rank_times'][rank] = info['time']
+            data['calls'] = max(data['calls'], info['calls'])
+
+    result = list(combined.values())
+    for data in result:
+        data['time'] = max(data['rank_times'])
+        data['mean_time'] = sum(data['rank_times'])/nprocs
+    result.sort(key=lambda x: x['time'], reverse=True)
+    return result
 
 
 ##############################################################################
@@ -318,6 +352,14 @@ class Application(object):
             help="Compress generated output files."
         )
 
+        # --async-output
+        parser.add_argument(
+            "--async-output", action="store_true", dest="async_output",
+            default=False,
+            help="Write the output files in a background thread so the "
+            "simulation is not blocked while they are written."
+        )
+
         # --output-remote
         parser.add_argument("--output-dump-remote", action="store_true",
                           dest="output_dump_remote", default=False,
@@ -336,6 +378,60 @@ class Application(object):
                           default=None, help="Do not use OpenMP to run the "\
                             "simulation using multiple cores.")
 
+        # --symmetric-loop
+        parser.add_argument(
+            "--symmetric-loop", action="store_true", dest="symmetric_loop",
+            default=None, help="Evaluate symmetric equations once for each "
+            "pair of particles (only used when OpenMP is disabled)."
+        )
+
+        # --cell-loop
+        parser.add_argument(
+            "--cell-loop", action="store_true", dest="cell_loop",
+            default=None, help="Find the neighbors of the particles cell by "
+            "cell (only used when the neighbors are not cached)."
+        )
+
+        # --fuse-groups
+        parser.add_argument(
+            "--fuse-groups", action="store_true", dest="fuse_groups",
+            default=None, help="Merge consecutive groups of equations that "
+            "do not depend on each other."
+        )
+
+        # --precision
+        parser.add_argument(
+            "--precision", action="store", dest="precision", default=None,
+            choices=['single', 'double'],
+            help="Floating point precision of the particle properties and "
+            "the generated code, positions and smoothing lengths are always "
+            "stored in double precision."
+        )
+
+        # --profile-equations
+        parser.add_argument(
+            "--profile-equations", action="store_true",
+            dest="profile_equations", default=None,
+            help="Time each phase of every equation group and the NNPS "
+            "updates and write a report to the output directory."
+        )
+
+        # --background-compile
+        parser.add_argument(
+            "--background-compile", action="store_true",
+            dest="background_compile", default=False,
+            help="Compile the generated code in a separate process while the "
+            "particles are distributed and the NNPS is setup."
+        )
+
+        # --compile-only
+        parser.add_argument(
+            "--compile-only", action="store_true", dest="compile_only",
+            default=False,
+            help="Only generate and compile the code for the simulation and "
+            "exit, useful to populate the cache of compiled modules."
+        )
+
         # --kernel
         all_kernels = list_all_kernels()
         parser.add_argument(
@@ -344,6 +440,19 @@ class Application(object):
             help="Use specified kernel from %s"%all_kernels
         )
 
+        parser.add_argument(
+            "--tabulate-kernel", action="store", dest="tabulate_kernel",
+            type=int, default=0,
+            help="Look up the kernel in tables with the given number of "
+            "intervals (see TabulatedKernel), 0 evaluates it directly."
+        )
+
+        parser.add_argument(
+            "--tabulate-cubic", action="store_true", dest="tabulate_cubic",
+            default=False,
+            help="Interpolate the tabulated kernel with cubic polynomials."
+        )
+
         # Restart options
         restart = parser.add_argument_group("Restart options",
                                             "Restart options for PySPH")
@@ -400,6 +509,22 @@ class Application(object):
             help="Table size for SpatialHashNNPS and ExtendedSpatialHashNNPS"
         )
 
+        nnps_options.add_argument(
+            "--spatial-hash-load-factor", dest="max_load_factor",
+            type=float, default=1.0,
+            help="Number of cells per bucket at which the hash table of "
+            "SpatialHashNNPS and ExtendedSpatialHashNNPS is enlarged, use 0 "
+            "to keep the table size fixed."
+        )
+
+        nnps_options.add_argument(
+            "--virtual-images", action="store_true", dest="virtual_images",
+            default=False,
+            help="Find the neighbors across periodic boundaries with the "
+            "periodic images of the particles instead of copying them as "
+            "ghost particles (only supported by LinkedListNNPS)."
+        )
+
         nnps_options.add_argument(
             "--stratified-grid-num-levels", dest="num_levels",
             type=int, default=1,
@@ -426,6 +551,18 @@ class Application(object):
             help="Option to enable the use of neighbor caching."
         )
 
+        nnps_options.add_argument(
+            "--nnps-skin", dest="nnps_skin", type=float, default=0.0,
+            help="Use persistent (Verlet) neighbor lists with the given skin "
+            "as a fraction of the kernel radius (implies --cache-nnps)."
+        )
+
+        nnps_options.add_argument(
+            "--reorder-freq", dest="reorder_freq", type=int, default=0,
+            help="Spatially reorder the particles along a Z-order curve "
+            "every given number of iterations (0 disables reordering)."
+        )
+
         nnps_options.add_argument(
             "--sort-gids", dest="sort_gids", action="store_true",
             default=False, help="Sort neighbors by the GIDs to get " +
@@ -494,6 +631,23 @@ class Application(object):
             help=('The frequency for load balancing')
         )
 
+        zoltan.add_argument(
+            "--lb-imbalance", action='store', dest='lb_imbalance',
+            default=0.0, type=float,
+            help=('Load balance when the imbalance of the work, i.e. the '
+                  'maximum work over the average work minus one, exceeds '
+                  'this value instead of using the --lb-freq. Zero disables '
+                  'this.')
+        )
+
+        zoltan.add_argument(
+            "--lb-weight", action='store', dest='lb_weight',
+            default='particles', choices=['particles', 'neighbors'],
+            help=('Measure the work with the number of particles or the '
+                  'number of neighbors of each particle, the latter caches '
+                  'the neighbors (implies --cache-nnps).')
+        )
+
         zoltan.add_argument(
             "--zoltan-debug-level", action="store",
             dest="zoltan_debug_level", default="0",
@@ -521,9 +675,10 @@ class Application(object):
         parallel_options.add_argument(
             "--parallel-output-mode", action="store",
             dest="parallel_output_mode", default='collected',
-            choices=['collected', 'distributed'],
+            choices=['collected', 'distributed', 'parallel'],
             help="""Use 'collected' to dump one output at
-            root or 'distributed' for every processor. """
+            root, 'distributed' for every processor or 'parallel' to
+            write one HDF5 file from every processor. """
         )
 
         # solver interfaces
@@ -688,6 +843,10 @@ class Application(object):
             else:
                 self.particles = particle_factory(*args, **kw)
 
+            if options.precision == 'single':
+                for pa in self.particles:
+                    utils.convert_to_single_precision(pa)
+
             # get the array info which will be b'casted to other procs
             particles_info = utils.get_particles_info(self.particles)
 
@@ -707,6 +866,16 @@ class Application(object):
         # Setup configuration options.
         if options.with_openmp is not None:
             get_config().use_openmp = options.with_openmp
+        if options.symmetric_loop is not None:
+            get_config().use_symmetric_loop = options.symmetric_loop
+        if options.cell_loop is not None:
+            get_config().use_cell_loop = options.cell_loop
+        if options.fuse_groups is not None:
+            get_config().use_fused_groups = options.fuse_groups
+        if options.profile_equations is not None:
+            get_config().use_profiling = options.profile_equations
+        if options.precision is not None:
+            get_config().use_double = options.precision == 'double'
         # setup the solver using any options
         self.solver.setup_solver(options.__dict__)
 
@@ -719,6 +888,15 @@ class Application(object):
         if options.kernel is not None:
             kernel = getattr(kernels, options.kernel)(dim=solver.dim)
             solver.kernel = kernel
+        if options.tabulate_kernel > 0:
+            kernel = kernels.TabulatedKernel(
+                kernel, n=options.tabulate_kernel,
+                cubic=options.tabulate_cubic
+            )
+            solver.kernel = kernel
+
+        if options.background_compile:
+            self._compile_in_background(kernel)
 
         # This should be called before an NNPS is created as the particles are
         # changed after the initial load-balancing.
@@ -748,7 +926,8 @@ class Application(object):
                     dim=solver.dim, particles=self.particles,
                     radius_scale=kernel.radius_scale, domain=self.domain,
                     fixed_h=fixed_h, cache=cache, table_size=options.table_size,
-                    sort_gids=options.sort_gids
+                    sort_gids=options.sort_gids,
+                    max_load_factor=options.max_load_factor
                 )
 
             elif options.nnps == 'esh':
@@ -757,7 +936,8 @@ class Application(object):
                     radius_scale=kernel.radius_scale, domain=self.domain,
                     fixed_h=fixed_h, cache=cache, H=options.H,
                     table_size=options.table_size, sort_gids=options.sort_gids,
-                    approximate=options.approximate_nnps
+                    approximate=options.approximate_nnps,
+                    max_load_factor=options.max_load_factor
                 )
 
             elif options.nnps == 'strat_hash':
@@ -811,6 +991,9 @@ class Application(object):
             self.nnps = nnps
 
         nnps = self.nnps
+        if options.nnps_skin > 0:
+            nnps.set_skin(options.nnps_skin)
+
         # once the NNPS has been set-up, we set the default Solver
         # post-stage callback to the DomainManager.setup_domain
         # method. This method is responsible to computing the new cell
@@ -852,6 +1035,7 @@ class Application(object):
         solver.set_output_fname(fname)
 
         solver.set_compress_output(options.compress_output)
+        solver.set_async_output(options.async_output)
         # disable_output
         solver.set_disable_output(options.disable_output)
 
@@ -859,6 +1043,9 @@ class Application(object):
         if options.freq is not None:
             solver.set_print_freq(options.freq)
 
+        if options.reorder_freq > 0:
+            solver.set_reorder_freq(options.reorder_freq)
+
         # output printing level (default is not detailed)
         if options.detailed_output is not None:
             solver.set_output_printing_level(options.detailed_output)
@@ -934,6 +1121,18 @@ class Application(object):
                 logger.info('started multiprocessing interface on %s'%(
                              interface.address,))
 
+    def _compile_in_background(self, kernel):
+        """Start compiling the code for the simulation in a separate process,
+        the solver waits for this to finish when it is setup.  If the
+        particles change in the meantime the code is compiled again.
+        """
+        mode = 'mpi' if self.num_procs > 1 else 'serial'
+        a_eval = AccelerationEval(
+            self.particles, self.equations, kernel, mode, self.domain
+        )
+        compiler = SPHCompiler(a_eval, self.solver.integrator)
+        compiler.compile_in_background()
+
     def _setup_parallel_manager_and_initial_load_balance(self):
         """This will automatically distribute the particles among processors
         if this is a parallel run.
@@ -1007,6 +1206,8 @@ class Application(object):
             lb_freq = options.lb_freq
             if lb_freq < 1 : raise ValueError("Invalid lb_freq %d"%lb_freq)
             pm.set_lb_freq( lb_freq )
+            pm.set_lb_imbalance( options.lb_imbalance )
+            pm.set_lb_weight( options.lb_weight )
 
             # wait till the initial partition is done
             comm.barrier()
@@ -1048,6 +1249,41 @@ class Application(object):
         info.update(kw)
         json.dump(info, open(filename, 'w'))
 
+    def _write_profile(self, filename):
+        """Write the timings collected by the acceleration evaluator to the
+        given filename as JSON and print a short summary.
+
+        In parallel, the timings of all the processors are gathered on the
+        root which writes the maximum and the mean time of each section
+        along with the time taken on each processor.
+        """
+        profile = self.solver.acceleration_eval.get_profile_info()
+        if self.num_procs > 1:
+            profiles = self.comm.gather(profile, root=0)
+            if self.rank != 0:
+                return
+            profile = combine_profiles(profiles)
+
+        with open(filename, 'w') as f:
+            json.dump(profile, f, indent=2)
+
+        total = sum(x['time'] for x in profile)
+        lines = ['Profile of equations (%s):'%filename]
+        if self.num_procs > 1:
+            lines.append('  Maximum (mean) time over %d processors.'%(
+                self.num_procs
+            ))
+        for info in profile:
+            pct = 100.0*info['time']/total if total > 0 else 0.0
+            if 'mean_time' in info:
+                time = '%10.4f s (%.4f s)'%(info['time'], info['mean_time'])
+            else:
+                time = '%10.4f s'%info['time']
+            lines.append('  %-50s %s %6.2f%% %8d calls'%(
+                info['name'], time, pct, info['calls']
+            ))
+        self._message('\n'.join(lines))
+
     ######################################################################
     # Public interface.
     ######################################################################
@@ -1067,6 +1303,11 @@ class Application(object):
     def info_filename(self):
         return abspath(join(self.output_dir, self.fname + '.info'))
 
+    @property
+    def profile_filename(self):
+        fname = self.solver.fname + '_profile.json'
+        return abspath(join(self.output_dir, fname))
+
     def initialize(self):
         """Called on the constructor, set constants etc. up here if needed.
         """
@@ -1124,11 +1365,18 @@ class Application(object):
 
             if self.domain is None:
                 self.domain = self.create_domain()
+            if self.domain is not None and self.options.virtual_images:
+                self.domain.virtual_images = True
 
             self.nnps = self.create_nnps()
 
             self._configure()
 
+            if self.options.compile_only:
+                # Exit like --help does so scripts do not post-process.
+                self._message("Compiled code for %s, exiting." % self.fname)
+                sys.exit(0)
+
             self._setup_solver_callbacks(self)
             for tool in self.create_tools():
                 self.add_tool(tool)
@@ -1148,6 +1396,8 @@ class Application(object):
         self._write_info(
             self.info_filename, completed=True, cpu_time=run_duration
         )
+        if get_config().use_profiling:
+            self._write_profile(self.profile_filename)
 
     def set_args(self, args):
         self.args = args
@@ -4,6 +4,14 @@ An interface to output the data in various format
 
 import numpy
 import os
+from os.path import basename
+import struct
+import threading
+import zipfile
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from pysph.base.particle_array import ParticleArray
 from pysph.base.utils import get_particles_info, get_particle_array
@@ -22,24 +30,49 @@ class Output(object):
         self.mpi_comm = mpi_comm
 
     def dump(self, fname, particles, solver_data):
+        self._set_data(particles, solver_data)
+        if self.mpi_comm is None or self.mpi_comm.Get_rank() == 0:
+            self._dump(fname)
+
+    def load(self, fname, props=None, lazy=False):
+        return self._load(fname, props, lazy)
+
+    def _set_data(self, particles, solver_data, buffers=None):
+        """Setup the data to be written for the given particles.
+
+        If `buffers` (a dictionary) is given, the property arrays are copied
+        into the arrays stored in it, which are reused if they have the right
+        size.  This makes the data independent of the particles so it can be
+        written while the simulation proceeds.
+        """
         self.particle_data = dict(get_particles_info(particles))
         self.all_array_data = {}
+        mpi_comm = self.mpi_comm
         for array in particles:
-            self.all_array_data[array.name] = array.get_property_arrays(
+            arrays = array.get_property_arrays(
                 all=self.detailed_output,
                 only_real=self.only_real
                 )
-        mpi_comm = self.mpi_comm
+            # Gathering the data copies it anyway.
+            if buffers is not None and mpi_comm is None:
+                arrays = _copy_arrays(
+                    arrays, buffers.setdefault(array.name, {})
+                )
+            self.all_array_data[array.name] = arrays
+        if buffers is not None:
+            for info in self.particle_data.values():
+                info['constants'] = dict(
+                    (k, v.copy()) for k, v in info['constants'].items()
+                )
+                info['output_property_arrays'] = list(
+                    info['output_property_arrays']
+                )
+            solver_data = dict(solver_data)
         if mpi_comm is not None:
             self.all_array_data = self._gather_array_data(
                     self.all_array_data, mpi_comm
                     )
         self.solver_data = solver_data
-        if mpi_comm is None or mpi_comm.Get_rank() == 0:
-            self._dump(fname)
-
-    def load(self, fname):
-        return self._load(fname)
 
     def _gather_array_data(self, all_array_data, comm):
         """Given array_data from the current processor and an MPI
@@ -73,79 +106,342 @@ class Output(object):
         """ Implement the method for writing the output to a file here """
         raise NotImplementedError()
 
-    def _load(self, fname):
+    def _load(self, fname, props=None, lazy=False):
         """ Implement the method for loading from file here """
         raise NotImplementedError()
 
 
+class LazyParticleArray(object):
+    """The data of a particle array in an output file, which is only read
+    when it is needed.
+
+    The stored properties and the constants are available as attributes
+    (or with `get`) like those of a `ParticleArray`.  A property is read
+    from the file when it is first accessed, properties stored without
+    compression are memory mapped so only the parts that are used are
+    read.  These arrays should not be modified, use `get_particle_array` to
+    create a `ParticleArray` from the data.
+    """
+    def __init__(self, name, info, stored, reader, props=None):
+        """
+        Parameters
+        ----------
+
+        name: str: name of the particle array.
+        info: dict: the information on the properties and constants of the
+            particle array as returned by `get_particles_info`.
+        stored: list: names of the properties stored in the file.
+        reader: callable: returns the data of the given property.
+        props: list: the properties to use, all of them if None.
+        """
+        self.name = name
+        self.properties = dict(
+            (prop, prop_info) for prop, prop_info in info['properties'].items()
+            if props is None or prop in props
+        )
+        self.constants = info['constants']
+        self.output_property_arrays = [
+            prop for prop in info.get('output_property_arrays', [])
+            if prop in self.properties
+        ]
+        self.stored = [prop for prop in stored if prop in self.properties]
+        self._reader = reader
+        self._data = {}
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not found otherwise.
+        if name in self.stored:
+            return self.get(name)
+        elif name in self.constants:
+            return self.constants[name]
+        else:
+            msg = "LazyParticleArray %s has no stored property/constant %s."\
+                  %(self.name, name)
+            raise AttributeError(msg)
+
+    def get(self, *props):
+        """Return the data of the given properties (or constants), one array
+        if a single name is given and a tuple otherwise.
+        """
+        result = []
+        for prop in props:
+            if prop in self.constants:
+                result.append(self.constants[prop])
+            else:
+                if prop not in self.stored:
+                    msg = "Property %s is not stored for %s."%(prop, self.name)
+                    raise KeyError(msg)
+                if prop not in self._data:
+                    self._data[prop] = self._reader(prop)
+                result.append(self._data[prop])
+        return result[0] if len(result) == 1 else tuple(result)
+
+    def get_number_of_particles(self):
+        if len(self.stored) == 0:
+            return 0
+        return len(self.get(self.stored[0]))
+
+    def get_particle_array(self):
+        """Create a `ParticleArray` with the (selected) properties.
+        """
+        array = ParticleArray(str(self.name), constants=self.constants)
+        for prop in sorted(self.properties):
+            prop_info = self.properties[prop]
+            data = self.get(prop) if prop in self.stored else None
+            array.add_property(
+                str(prop), str(prop_info['type']), prop_info['default'], data
+            )
+        array.set_output_arrays(list(self.output_property_arrays))
+        return array
+
+
+def _get_arrays(arrays, lazy):
+    if lazy:
+        return arrays
+    return dict((name, array.get_particle_array())
+                for name, array in arrays.items())
+
+
+def _load_npz(fname):
+    try:
+        return numpy.load(fname, allow_pickle=True)
+    except TypeError:
+        # Older versions of numpy do not have allow_pickle.
+        return numpy.load(fname)
+
+
+def _read_npz(fname, key):
+    """Return the array stored with the given key in the npz file, which is
+    memory mapped if it is not compressed.
+    """
+    with zipfile.ZipFile(fname) as zf:
+        info = zf.getinfo(key + '.npy')
+        if info.compress_type == zipfile.ZIP_STORED:
+            with open(fname, 'rb') as fp:
+                # The data follows the local file header of the member whose
+                # name and extra field lengths are at offsets 26 and 28.
+                fp.seek(info.header_offset)
+                header = fp.read(30)
+                n_name, n_extra = struct.unpack('<HH', header[26:30])
+                fp.seek(info.header_offset + 30 + n_name + n_extra)
+                version = numpy.lib.format.read_magic(fp)
+                if version == (1, 0):
+                    header = numpy.lib.format.read_array_header_1_0(fp)
+                else:
+                    header = numpy.lib.format.read_array_header_2_0(fp)
+                shape, fortran_order, dtype = header
+                offset = fp.tell()
+            if not dtype.hasobject and numpy.prod(shape) > 0:
+                return numpy.memmap(
+                    fname, dtype=dtype, mode='r', shape=shape, offset=offset,
+                    order='F' if fortran_order else 'C'
+                )
+        return numpy.lib.format.read_array(zf.open(info))
+
+
 class NumpyOutput(Output):
+    """Output in the numpy npz format.
+
+    The information on the particle arrays and the solver data are pickled
+    and each property is stored as a separate array named
+    ``arrays/<array name>/<property>``, this is version 3 of the format.
+    """
 
     def _dump(self, filename):
         save_method = numpy.savez_compressed if self.compress else numpy.savez
         output_data = {"particles": self.particle_data,
                        "solver_data": self.solver_data}
         for name, arrays in self.all_array_data.items():
-            self.particle_data[name]["arrays"] = arrays
-        save_method(filename, version=2, **output_data)
+            for prop, data in arrays.items():
+                output_data["arrays/%s/%s"%(name, prop)] = data
+        save_method(filename, version=3, **output_data)
 
-    def _load(self, fname):
+    def _load(self, fname, props=None, lazy=False):
         def _get_dict_from_arrays(arrays):
             arrays.shape = (1,)
             return arrays[0]
-        data = numpy.load(fname)
+        data = _load_npz(fname)
+
+        try:
+            if 'version' not in data.files:
+                msg = "Wrong file type! No version number recorded."
+                raise RuntimeError(msg)
+            ret = {}
+            version = data['version']
+            solver_data = _get_dict_from_arrays(data["solver_data"])
+            ret["solver_data"] = solver_data
+
+            if version == 1:
+                particles = {}
+                arrays = _get_dict_from_arrays(data["arrays"])
+                for array_name in arrays:
+                    pa = get_particle_array(name=array_name,
+                                            **arrays[array_name])
+                    info = get_particles_info([pa])[array_name]
+                    particles[array_name] = LazyParticleArray(
+                        array_name, info, list(arrays[array_name].keys()),
+                        arrays[array_name].get, props
+                    )
 
-        if 'version' not in data.files:
-            msg = "Wrong file type! No version number recorded."
-            raise RuntimeError(msg)
-        ret = {}
-        ret["arrays"] = {}
-        version = data['version']
-        solver_data = _get_dict_from_arrays(data["solver_data"])
-        ret["solver_data"] = solver_data
-
-        if version == 1:
-            arrays = _get_dict_from_arrays(data["arrays"])
-            for array_name in arrays:
-                array = get_particle_array(name=array_name,
-                                           **arrays[array_name])
-                ret["arrays"][array_name] = array
-
-        elif version == 2:
-            particles = _get_dict_from_arrays(data["particles"])
-
-            for array_name, array_info in particles.items():
-                array = ParticleArray(name=array_name,
-                                      constants=array_info["constants"],
-                                      **array_info["arrays"])
-                array.set_output_arrays(
-                    array_info.get('output_property_arrays', [])
-                )
-                for prop, prop_info in array_info["properties"].items():
-                    if prop not in array_info["arrays"]:
-                        array.add_property(**prop_info)
-                ret["arrays"][array_name] = array
+            elif version == 2:
+                particles = _get_dict_from_arrays(data["particles"])
+                for array_name, array_info in particles.items():
+                    particles[array_name] = LazyParticleArray(
+                        array_name, array_info,
+                        list(array_info["arrays"].keys()),
+                        array_info["arrays"].get, props
+                    )
 
-        else:
-            raise RuntimeError("Version not understood!")
+            elif version == 3:
+                particles = _get_dict_from_arrays(data["particles"])
+                for array_name, array_info in particles.items():
+                    prefix = "arrays/%s/"%array_name
+                    stored = [key[len(prefix):] for key in data.files
+                              if key.startswith(prefix)]
+                    particles[array_name] = LazyParticleArray(
+                        array_name, array_info, stored,
+                        self._get_reader(fname, data, prefix, lazy), props
+                    )
+
+            else:
+                raise RuntimeError("Version not understood!")
+            ret["arrays"] = _get_arrays(particles, lazy)
+        finally:
+            data.close()
         return ret
 
+    def _get_reader(self, fname, data, prefix, lazy):
+        if lazy:
+            # The file is opened again when a property is read.
+            return lambda prop: _read_npz(fname, prefix + prop)
+        else:
+            return lambda prop: data[prefix + prop]
+
 
 class HDFOutput(Output):
+    """Output in the HDF5 format.
+
+    If `parallel` is True and an MPI communicator is given, every processor
+    writes its own data into a single file instead of gathering all the data
+    on the root.  MPI-IO is used if h5py is built with MPI support, otherwise
+    each processor writes its data to a separate file and the root writes a
+    file with virtual datasets which refer to these.
+    """
+    def __init__(self, detailed_output=False, only_real=True, mpi_comm=None,
+                 compress=False, parallel=False):
+        super(HDFOutput, self).__init__(
+            detailed_output, only_real, mpi_comm, compress
+        )
+        self.parallel = parallel
+
+    def dump(self, fname, particles, solver_data):
+        if self.parallel and self.mpi_comm is not None:
+            self._dump_parallel(fname, particles, solver_data)
+        else:
+            super(HDFOutput, self).dump(fname, particles, solver_data)
+
+    def _dump_parallel(self, filename, particles, solver_data):
+        import h5py
+        comm = self.mpi_comm
+        # The meta data must be the same on all the processors.
+        self.particle_data = comm.bcast(
+            dict(get_particles_info(particles)), root=0
+        )
+        self.solver_data = comm.bcast(solver_data, root=0)
+        self.all_array_data = dict(
+            (array.name, array.get_property_arrays(
+                all=self.detailed_output, only_real=self.only_real
+            )) for array in particles
+        )
+        counts = comm.allgather(dict(
+            (array.name, array.get_number_of_particles(self.only_real))
+            for array in particles
+        ))
+        if h5py.get_config().mpi:
+            self._dump_mpio(filename, counts)
+        else:
+            self._dump_virtual(filename, counts)
+
+    def _dump_mpio(self, filename, counts):
+        import h5py
+        comm = self.mpi_comm
+        rank = comm.Get_rank()
+
+        def _create_slice(grp, name, array, ptype):
+            start = sum(c[ptype] for c in counts[:rank])
+            total = sum(c[ptype] for c in counts)
+            prop = grp.create_dataset(
+                name, (total,) + array.shape[1:], dtype=array.dtype
+            )
+            prop[start:start + len(array)] = array
+            return prop
+
+        # Filters (compression) are not supported with parallel writes.
+        with h5py.File(filename, 'w', driver='mpio', comm=comm) as f:
+            self._write(f, _create_slice)
+
+    def _dump_virtual(self, filename, counts):
+        import h5py
+        comm = self.mpi_comm
+        rank = comm.Get_rank()
+        size = comm.Get_size()
+
+        # The parts do not end with the extension so they are not found by
+        # `get_files`.
+        parts = [filename + '.rank%d' % i for i in range(size)]
+        with h5py.File(parts[rank], 'w') as f:
+            for ptype, data in self.all_array_data.items():
+                arrays_grp = f.create_group('particles/%s/arrays' % ptype)
+                for name, array in data.items():
+                    self._create_dataset(arrays_grp, name, array, ptype)
+        comm.barrier()
+
+        def _create_virtual(grp, name, array, ptype):
+            total = sum(c[ptype] for c in counts)
+            layout = h5py.VirtualLayout(
+                shape=(total,) + array.shape[1:], dtype=array.dtype
+            )
+            start = 0
+            for part, c in zip(parts, counts):
+                n = c[ptype]
+                if n > 0:
+                    # A relative path is resolved relative to this file.
+                    path = 'particles/%s/arrays/%s' % (ptype, name)
+                    layout[start:start + n] = h5py.VirtualSource(
+                        basename(part), path, shape=(n,) + array.shape[1:]
+                    )
+                start += n
+            return grp.create_virtual_dataset(name, layout)
+
+        if rank == 0:
+            with h5py.File(filename, 'w') as f:
+                self._write(f, _create_virtual)
+        comm.barrier()
 
     def _dump(self, filename):
         import h5py
         with h5py.File(filename, 'w') as f:
-            solver_grp = f.create_group('solver_data')
-            particles_grp = f.create_group('particles')
-            for ptype, pdata in self.particle_data.items():
-                ptype_grp = particles_grp.create_group(ptype)
-                arrays_grp = ptype_grp.create_group('arrays')
-                data = self.all_array_data[ptype]
-                self._set_constants(pdata, ptype_grp)
-                self._set_properties(pdata, arrays_grp, data)
-            self._set_solver_data(solver_grp)
-
-    def _load(self, fname):
+            self._write(f, self._create_dataset)
+
+    def _write(self, f, create_dataset):
+        """Write the data to the given file, `create_dataset` is called with
+        the group, the name of the property, its data and the name of the
+        particle array and returns the created dataset.
+        """
+        import h5py
+        solver_grp = f.create_group('solver_data')
+        particles_grp = f.create_group('particles')
+        for ptype, pdata in self.particle_data.items():
+            ptype_grp = particles_grp.create_group(ptype)
+            arrays_grp = ptype_grp.create_group('arrays')
+            data = self.all_array_data[ptype]
+            self._set_constants(pdata, ptype_grp)
+            self._set_properties(
+                pdata, arrays_grp, data, ptype, create_dataset
+            )
+        self._set_solver_data(solver_grp)
+
+    def _load(self, fname, props=None, lazy=False):
         if has_h5py():
             import h5py
         else:
@@ -157,31 +453,41 @@ class HDFOutput(Output):
             solver_grp = f['solver_data']
             particles_grp = f['particles']
             ret["solver_data"] = self._get_solver_data(solver_grp)
-            ret["arrays"] = self._get_particles(particles_grp)
+            particles = self._get_particles(fname, particles_grp, props, lazy)
+            ret["arrays"] = _get_arrays(particles, lazy)
         return ret
 
-    def _get_particles(self, grp):
+    def _get_particles(self, fname, grp, props, lazy):
 
         particles = {}
         for name, prop_array in grp.items():
+            name = str(name)
             output_array = []
             const_grp = prop_array['constants']
             arrays_grp = prop_array['arrays']
-            constants = self._get_constants(const_grp)
-            array = ParticleArray(str(name), constants=constants)
-
+            properties = {}
             for pname, h5obj in arrays_grp.items():
                 prop_name = str(h5obj.attrs['name'])
-                type_ = str(h5obj.attrs['type'])
-                default = h5obj.attrs['default']
+                properties[prop_name] = dict(
+                    name=prop_name, type=str(h5obj.attrs['type']),
+                    default=h5obj.attrs['default']
+                )
                 if h5obj.attrs['stored']:
                     output_array.append(str(pname))
-                    array.add_property(
-                            prop_name, type_, default, numpy.array(h5obj))
-                else:
-                    array.add_property(prop_name, type_)
-            array.set_output_arrays(output_array)
-            particles[str(name)] = array
+            info = dict(
+                properties=properties,
+                constants=self._get_constants(const_grp),
+                output_property_arrays=output_array
+            )
+            if lazy:
+                # The file is opened again when a property is read.
+                path = 'particles/%s/arrays/'%name
+                reader = lambda prop, path=path: _read_hdf5(fname, path + prop)
+            else:
+                reader = lambda prop, grp=arrays_grp: numpy.array(grp[prop])
+            particles[name] = LazyParticleArray(
+                name, info, output_array, reader, props
+            )
         return particles
 
     def _get_solver_data(self, grp):
@@ -202,19 +508,21 @@ class HDFOutput(Output):
         for constName, constArray in pconstants.items():
             constGroup.create_dataset(constName, data=constArray)
 
-    def _set_properties(self, pdata, ptype_grp, data):
+    def _create_dataset(self, grp, name, array, ptype):
+        if self.compress:
+            prop = grp.create_dataset(
+                    name, data=array,
+                    compression="gzip", compression_opts=9
+                    )
+        else:
+            prop = grp.create_dataset(name, data=array)
+        return prop
+
+    def _set_properties(self, pdata, ptype_grp, data, ptype, create_dataset):
         for propname, attributes in pdata['properties'].items():
             if propname in data:
-                array = data[propname]
-                if self.compress:
-                    prop = ptype_grp.create_dataset(
-                            propname, data=array)
-                else:
-                    prop = ptype_grp.create_dataset(
-                            propname, data=array,
-                            compression="gzip", compression_opts=9
-                            )
-
+                prop = create_dataset(ptype_grp, propname, data[propname],
+                                      ptype)
                 prop.attrs['stored'] = True
             else:
                 prop = ptype_grp.create_dataset(propname, (0,))
@@ -230,7 +538,112 @@ class HDFOutput(Output):
             grp.attrs[name] = data
 
 
-def load(fname):
+def _read_hdf5(fname, path):
+    """Return the data of the given dataset in the HDF5 file, which is
+    memory mapped if it is stored contiguously without compression.
+    """
+    import h5py
+    with h5py.File(fname, 'r') as f:
+        dataset = f[path]
+        offset = dataset.id.get_offset()
+        if dataset.chunks is None and offset is not None and \
+           not getattr(dataset, 'is_virtual', False) and dataset.size > 0:
+            return numpy.memmap(
+                fname, dtype=dataset.dtype, mode='r', shape=dataset.shape,
+                offset=offset
+            )
+        return numpy.array(dataset)
+
+
+def _copy_arrays(arrays, buffer):
+    """Copy the given dictionary of arrays into the arrays in `buffer`
+    (allocating new ones if needed) and return a dictionary of the copies.
+    """
+    result = {}
+    for prop, data in arrays.items():
+        buf = buffer.get(prop)
+        if buf is None or buf.shape != data.shape or buf.dtype != data.dtype:
+            buf = numpy.empty_like(data)
+            buffer[prop] = buf
+        buf[:] = data
+        result[prop] = buf
+    return result
+
+
+class AsyncOutput(object):
+    """Write output files in a background thread.
+
+    The data to be written is copied into one of `n_buffers` buffers, which
+    are reused between dumps, and is written by a background thread while the
+    simulation proceeds.  If all the buffers are in use, i.e. the writes are
+    falling behind, `dump` waits for a write to complete.  Call `flush` to
+    wait for all pending writes to complete.
+
+    Any error raised when writing a file is raised by the next call to `dump`
+    or `flush`.
+    """
+    def __init__(self, n_buffers=2):
+        self._free = queue.Queue()
+        for i in range(n_buffers):
+            self._free.put({})
+        self._jobs = queue.Queue()
+        self._thread = None
+        self._error = None
+
+    def dump(self, filename, particles, solver_data, detailed_output=False,
+             only_real=True, mpi_comm=None, compress=False, parallel=False):
+        """Dump the given particles and solver data to the given filename in
+        the background, the arguments are the same as for `dump`.
+
+        Parallel writes are collective and are done immediately.
+        """
+        self._check_error()
+        output, filename = _get_output(
+            filename, detailed_output, only_real, mpi_comm, compress, parallel
+        )
+        if parallel and mpi_comm is not None:
+            self.flush()
+            output.dump(filename, particles, solver_data)
+            return
+        buffers = self._free.get()
+        output._set_data(particles, solver_data, buffers)
+        if mpi_comm is None or mpi_comm.Get_rank() == 0:
+            self._start()
+            self._jobs.put((output, filename, buffers))
+        else:
+            self._free.put(buffers)
+
+    def flush(self):
+        """Wait for all the pending writes to complete.
+        """
+        self._jobs.join()
+        self._check_error()
+
+    def _check_error(self):
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            output, filename, buffers = self._jobs.get()
+            try:
+                output._dump(filename)
+            except Exception as e:
+                self._error = e
+            finally:
+                output.all_array_data = None
+                self._free.put(buffers)
+                self._jobs.task_done()
+
+
+def load(fname, props=None, lazy=False):
     """
     Load the output data
 
@@ -239,6 +652,16 @@ def load(fname):
     fname: str
         Name of the file or full path
 
+    props: list
+        Names of the properties to load, all the properties are loaded if
+        this is None.
+
+    lazy: bool
+        Return a `LazyParticleArray` for each particle array instead of a
+        `ParticleArray`.  Its properties are only read from the file when
+        they are used and are memory mapped if they are stored without
+        compression.
+
 
     Examples
     --------
@@ -253,6 +676,10 @@ def load(fname):
     pysph.base.particle_array.ParticleArray
     >>> data['solver_data']
     {'count': 100, 'dt': 4.6416394784204199e-05, 't': 0.0039955855395528766}
+    >>> data = load('elliptical_drop_100.hdf5', props=['x', 'y'], lazy=True)
+    >>> fluid = data['arrays']['fluid']
+    >>> x, y = fluid.get('x', 'y')
+    >>> pa = fluid.get_particle_array()
     """
 
     if fname.endswith('npz'):
@@ -260,14 +687,14 @@ def load(fname):
     elif fname.endswith('hdf5'):
         output = HDFOutput()
     if os.path.isfile(fname):
-        return output.load(fname)
+        return output.load(fname, props, lazy)
     else:
         msg = "File not present"
         raise RuntimeError(msg)
 
 
 def dump(filename, particles, solver_data, detailed_output=False,
-         only_real=True, mpi_comm=None, compress=False):
+         only_real=True, mpi_comm=None, compress=False, parallel=False):
 
     """
     Dump the given particles and solver data to the given filename.
@@ -296,9 +723,25 @@ def dump(filename, particles, solver_data, detailed_output=False,
     compress: bool
         Specify if the  file is to be compressed or not.
 
+    parallel: bool
+        Write the data of every processor directly to a single HDF5 file
+        instead of gathering it on rank 0.
+
     If `mpi_comm` is not passed or is set to None the local particles alone
-    are dumped, otherwise only rank 0 dumps the output.
+    are dumped, otherwise only rank 0 dumps the output unless `parallel` is
+    True and the output is in the HDF5 format.
 
+    """
+    output, filename = _get_output(
+        filename, detailed_output, only_real, mpi_comm, compress, parallel
+    )
+    output.dump(filename, particles, solver_data)
+
+
+def _get_output(filename, detailed_output, only_real, mpi_comm, compress,
+                parallel=False):
+    """Return the Output instance to use for the given filename and the
+    filename with the appropriate extension.
     """
     if filename.endswith(output_formats):
         fname = os.path.splitext(filename)[0]
@@ -307,9 +750,9 @@ def dump(filename, particles, solver_data, detailed_output=False,
         filename = fname + '.hdf5'
     if filename.endswith('hdf5') and has_h5py():
         file_format = 'hdf5'
-        output = HDFOutput(detailed_output, only_real, mpi_comm, compress)
+        output = HDFOutput(detailed_output, only_real, mpi_comm, compress,
+                           parallel)
     else:
         output = NumpyOutput(detailed_output, only_real, mpi_comm, compress)
         file_format = 'npz'
-    filename = fname + '.' + file_format
-    output.dump(filename, particles, solver_data)
+    return output, fname + '.' + file_format
@@ -10,6 +10,7 @@ from pysph.sph.acceleration_eval import AccelerationEval
 from pysph.sph.sph_compiler import SPHCompiler
 
 from pysph.solver.utils import FloatPBar, load, dump
+from pysph.solver.output import AsyncOutput
 
 import logging
 logger = logging.getLogger(__name__)
@@ -108,10 +109,17 @@ class Solver(object):
         # default output printing frequency
         self.pfreq = 100
 
+        # frequency (in iterations) of spatially reordering the particles,
+        # zero disables reordering.
+        self.reorder_freq = 0
+
         # Compress generated files.
         self.compress_output = False
         self.disable_output = False
 
+        # Writes the output in the background if not None.
+        self.async_output = None
+
         # the process id for parallel runs
         self.pid = None
 
@@ -194,8 +202,9 @@ class Solver(object):
             self.kernel = kernel
 
         mode = 'mpi' if self.in_parallel else 'serial'
+        domain = nnps.domain if nnps is not None else None
         self.acceleration_eval = AccelerationEval(
-            particles, equations, self.kernel, mode
+            particles, equations, self.kernel, mode, domain
         )
 
         sep = '-'*70
@@ -216,6 +225,10 @@ class Solver(object):
 
         # set the parallel manager for the integrator
         self.integrator.set_parallel_manager(self.pm)
+        if self.pm is not None:
+            self._set_remote_props()
+            # used to measure the work of the particles.
+            self.pm.set_nnps(nnps)
 
         # Set the post_stage_callback.
         self.integrator.set_post_stage_callback(self._post_stage_callback)
@@ -317,6 +330,12 @@ class Solver(object):
         """ Set the time step to use """
         self.dt = dt
 
+    def set_reorder_freq(self, n):
+        """Spatially reorder the particles along a Z-order curve every `n`
+        iterations to improve memory locality.  Use 0 to disable this.
+        """
+        self.reorder_freq = n
+
     def set_print_freq(self, n):
         """ Set the output print frequency """
         self.pfreq = n
@@ -356,6 +375,8 @@ class Solver(object):
     def set_output_only_real(self, output_only_real):
         """ Set the flag to save out only real particles """
         self.output_only_real = output_only_real
+        if self.pm is not None and self.acceleration_eval is not None:
+            self._set_remote_props()
 
     def set_output_directory(self, path):
         """ Set the output directory """
@@ -375,6 +396,19 @@ class Solver(object):
         """
         self.compress_output = compress
 
+    def set_async_output(self, value, n_buffers=2):
+        """Write the output files in a background thread so the simulation
+        is not blocked while they are written.
+
+        The particle data is copied into one of `n_buffers` buffers, if all
+        the buffers are in use, dumping the output waits for a write to
+        complete.  All pending writes are completed when `solve` returns.
+        """
+        if value:
+            self.async_output = AsyncOutput(n_buffers)
+        else:
+            self.async_output = None
+
     def set_parallel_output_mode(self, mode="collected"):
         """Set the default solver dump mode in parallel.
 
@@ -386,8 +420,11 @@ class Solver(object):
 
         distributed : Each processor dumps a file locally.
 
+        parallel : Each processor writes its data directly to a single
+                   HDF5 file (falls back to collected without h5py).
+
         """
-        assert mode in ("collected", "distributed")
+        assert mode in ("collected", "distributed", "parallel")
         self.parallel_output_mode = mode
 
     def set_command_handler(self, callable, command_interval=1):
@@ -424,65 +461,75 @@ class Solver(object):
         bar = FloatPBar(self.t, self.tf, show=show)
         self._epsilon = EPSILON*self.tf
 
-        # Initial solution
-        self.dump_output()
-        self.barrier() # everybody waits for this to complete
-
-        # Compute the accelerations once for the predictor corrector
-        # integrator to work correctly at the first time step.
-        self.acceleration_eval.compute(self.t, self.dt)
-
-        # Now get a suitable adaptive (if requested) and damped timestep to
-        # integrate with.
-        self.dt = self._get_timestep()
-
-        while (self.tf - self.t) > self._epsilon and \
-              (self.count < self.max_steps):
-
-            # perform any pre step functions
-            for callback in self.pre_step_callbacks:
-                callback(self)
-
-            if self.rank == 0:
-                logger.debug(
-                    "Iteration=%d, time=%f, timestep=%f" % \
-                        (self.count, self.t, self.dt)
-                )
-            # perform the integration and update the time.
-            #print 'Solver Iteration', self.count, self.dt, self.t
-            self.integrator.step(self.t, self.dt)
-
-            # perform any post step functions
-            for callback in self.post_step_callbacks:
-                callback(self)
-
-            # update time and iteration counters if successfully
-            # integrated
-            self.t += self.dt
-            self.count += 1
-            self._epsilon = EPSILON*self.tf*self.count
-
-            # Compute the next timestep.
+        try:
+            # Initial solution
+            self.dump_output()
+            self.barrier() # everybody waits for this to complete
+
+            # Compute the accelerations once for the predictor corrector
+            # integrator to work correctly at the first time step.
+            self.acceleration_eval.compute(self.t, self.dt)
+
+            # Now get a suitable adaptive (if requested) and damped timestep to
+            # integrate with.
             self.dt = self._get_timestep()
 
-            # Note: this may adjust dt to land at a desired time.
-            self._dump_output_if_needed()
+            while (self.tf - self.t) > self._epsilon and \
+                  (self.count < self.max_steps):
 
-            # update progress bar
-            bar.update(self.t)
+                # perform any pre step functions
+                for callback in self.pre_step_callbacks:
+                    callback(self)
 
-            # update the time for all arrays
-            self.update_particle_time()
+                if self.rank == 0:
+                    logger.debug(
+                        "Iteration=%d, time=%f, timestep=%f" % \
+                            (self.count, self.t, self.dt)
+                    )
+                # perform the integration and update the time.
+                #print 'Solver Iteration', self.count, self.dt, self.t
+                self.integrator.step(self.t, self.dt)
 
-            if self.execute_commands is not None:
-                if self.count % self.command_interval == 0:
-                    self.execute_commands(self)
+                # perform any post step functions
+                for callback in self.post_step_callbacks:
+                    callback(self)
 
-        # close the progress bar
-        bar.finish()
+                # update time and iteration counters if successfully
+                # integrated
+                self.t += self.dt
+                self.count += 1
+                self._epsilon = EPSILON*self.tf*self.count
 
-        # final output save
-        self.dump_output()
+                if self.reorder_freq > 0 and \
+                   self.count % self.reorder_freq == 0:
+                    self.acceleration_eval.nnps.reorder_particles()
+
+                # Compute the next timestep.
+                self.dt = self._get_timestep()
+
+                # Note: this may adjust dt to land at a desired time.
+                self._dump_output_if_needed()
+
+                # update progress bar
+                bar.update(self.t)
+
+                # update the time for all arrays
+                self.update_particle_time()
+
+                if self.execute_commands is not None:
+                    if self.count % self.command_interval == 0:
+                        self.execute_commands(self)
+
+            # close the progress bar
+            bar.finish()
+
+            # final output save
+            self.dump_output()
+        finally:
+            # Wait for any output being written in the background, also when
+            # a step fails or the run is interrupted.
+            if self.async_output is not None:
+                self.async_output.flush()
 
     def update_particle_time(self):
         for array in self.particles:
@@ -535,13 +582,19 @@ class Solver(object):
                              self.fname  + '_' + str(self.count))
 
         comm = None
-        if self.parallel_output_mode == "collected" and self.in_parallel:
+        mode = self.parallel_output_mode
+        if mode in ("collected", "parallel") and self.in_parallel:
             comm = self.comm
 
-        dump(fname, self.particles, self._get_solver_data(),
-             detailed_output=self.detailed_output,
-             only_real=self.output_only_real, mpi_comm=comm,
-             compress=self.compress_output)
+        if self.async_output is not None:
+            dump_method = self.async_output.dump
+        else:
+            dump_method = dump
+        dump_method(fname, self.particles, self._get_solver_data(),
+                    detailed_output=self.detailed_output,
+                    only_real=self.output_only_real, mpi_comm=comm,
+                    compress=self.compress_output,
+                    parallel=(mode == "parallel"))
 
     def load_output(self, count):
         """Load particle data from dumped output file.
@@ -746,5 +799,14 @@ class Solver(object):
         for callback in self.post_stage_callbacks:
             callback(time, dt, stage)
 
+    def _set_remote_props(self):
+        # Only exchange the properties read from the remote particles, all
+        # of them are needed when the remote particles are saved.
+        if self.output_only_real:
+            props = self.acceleration_eval.get_remote_props()
+        else:
+            props = {}
+        self.pm.set_remote_props(props)
+
 
 ############################################################################
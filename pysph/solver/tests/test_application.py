@@ -11,7 +11,7 @@ try:
 except ImportError:
     import mock
 
-from pysph.solver.application import Application
+from pysph.solver.application import Application, combine_profiles
 from pysph.solver.solver import Solver
 
 class MockApp(Application):
@@ -70,3 +70,24 @@ class TestApplication(TestCase):
         error_message = "Expected %f, got %f"%(expected, app.testarg)
         self.assertEqual(expected,app.testarg,error_message)
 
+
+class TestCombineProfiles(TestCase):
+    def test_should_report_max_mean_and_rank_times(self):
+        # Given
+        p0 = [dict(name='a', time=1.0, calls=2, equations=[]),
+              dict(name='b', time=3.0, calls=2, equations=[])]
+        p1 = [dict(name='a', time=4.0, calls=2, equations=[])]
+
+        # When
+        result = combine_profiles([p0, p1])
+
+        # Then
+        self.assertEqual([x['name'] for x in result], ['a', 'b'])
+        a, b = result
+        self.assertEqual(a['time'], 4.0)
+        self.assertEqual(a['mean_time'], 2.5)
+        self.assertEqual(a['rank_times'], [1.0, 4.0])
+        self.assertEqual(a['calls'], 2)
+        self.assertEqual(b['time'], 3.0)
+        self.assertEqual(b['mean_time'], 1.5)
+        self.assertEqual(b['rank_times'], [3.0, 0.0])
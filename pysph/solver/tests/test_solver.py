@@ -107,6 +107,44 @@ class TestSolver(TestCase):
             np.max(np.abs(expected - record)) < 1e-12, error_message
         )
 
+    def test_solver_flushes_async_output_when_a_step_fails(self):
+        # Given
+        solver = Solver(
+            integrator=self.integrator, tf=1.0, dt=0.1,
+            adaptive_timestep=False
+        )
+        solver.acceleration_eval = self.a_eval
+        solver.particles = []
+        solver.dump_output = mock.Mock()
+        solver.async_output = mock.Mock()
+        self.integrator.step.side_effect = RuntimeError('step failed')
+
+        # When
+        self.assertRaises(RuntimeError, solver.solve, show_progress=False)
+
+        # Then
+        solver.async_output.flush.assert_called_once_with()
+
+    def test_solver_exchanges_all_remote_props_when_dumping_remote(self):
+        # Given
+        solver = Solver(integrator=self.integrator, tf=1.0, dt=0.1)
+        solver.acceleration_eval = self.a_eval
+        self.a_eval.get_remote_props.return_value = {'fluid': set(['rho'])}
+        pm = mock.Mock()
+        solver.set_parallel_manager(pm)
+
+        # When
+        solver.set_output_only_real(True)
+
+        # Then
+        pm.set_remote_props.assert_called_with({'fluid': set(['rho'])})
+
+        # When
+        solver.set_output_only_real(False)
+
+        # Then
+        pm.set_remote_props.assert_called_with({})
+
 
 if __name__ == '__main__':
     main()
@@ -12,7 +12,8 @@ except ImportError:
     from unittest import TestCase, main, skipUnless
 
 from pysph.base.utils import get_particle_array, get_particle_array_wcsph
-from pysph.solver.utils import dump, load, dump_v1
+from pysph.solver.utils import dump, load, dump_v1, iter_output
+from pysph.solver.output import AsyncOutput, LazyParticleArray
 
 
 class TestOutputNumpy(TestCase):
@@ -43,7 +44,8 @@ class TestOutputNumpy(TestCase):
         self.assertTrue(np.allclose(pa.y, pa1.y, atol=1e-14))
 
     def test_dump_and_load_works_with_compress(self):
-        x = np.linspace(0, 1.0, 10)
+        # Enough data so the compression is worth its overhead.
+        x = np.linspace(0, 1.0, 1000)
         y = x*2.0
         dt = 1.0
         pa = get_particle_array(name='fluid', x=x, y=y)
@@ -117,6 +119,100 @@ class TestOutputNumpy(TestCase):
         self.assertEqual(set(pa.output_property_arrays), set(output_arrays))
         self.assertEqual(set(pa1.output_property_arrays), set(output_arrays))
 
+    def test_async_dump_writes_a_snapshot_of_the_data(self):
+        # Given
+        x = np.linspace(0, 1.0, 10)
+        pa = get_particle_array(name='fluid', x=x, y=2*x)
+        writer = AsyncOutput(n_buffers=2)
+
+        # When
+        fnames = [self._get_filename('async_%d' % i) for i in range(4)]
+        for i, fname in enumerate(fnames):
+            writer.dump(fname, [pa], solver_data={'count': i})
+            # Change the data before the file is written.
+            pa.x[:] += 1.0
+        writer.flush()
+
+        # Then
+        for i, fname in enumerate(fnames):
+            data = load(fname)
+            pa1 = data['arrays']['fluid']
+            self.assertEqual(data['solver_data']['count'], i)
+            self.assertTrue(np.allclose(pa1.x, x + i, atol=1e-14))
+            self.assertTrue(np.allclose(pa1.y, 2*x, atol=1e-14))
+
+    def test_load_only_the_given_properties(self):
+        # Given
+        x = np.linspace(0, 1.0, 10)
+        pa = get_particle_array_wcsph(name='fluid', x=x, y=2*x, p=3*x)
+        fname = self._get_filename('simple')
+        dump(fname, [pa], solver_data={})
+
+        # When
+        data = load(fname, props=['x', 'p'])
+        pa1 = data['arrays']['fluid']
+
+        # Then
+        self.assertTrue('x' in pa1.properties)
+        self.assertTrue('p' in pa1.properties)
+        self.assertFalse('y' in pa1.properties)
+        self.assertFalse('rho' in pa1.properties)
+        self.assertTrue(np.allclose(pa1.p, 3*x, atol=1e-14))
+        self.assertEqual(set(pa1.output_property_arrays), set(['x', 'p']))
+
+    def test_lazy_load(self):
+        # Given
+        x = np.linspace(0, 1.0, 10)
+        pa = get_particle_array_wcsph(name='fluid', x=x, y=2*x, p=3*x)
+        pa.add_constant('c1', [1.0, 2.0])
+        for compress in (False, True):
+            fname = self._get_filename('simple%d' % compress)
+            dump(fname, [pa], solver_data={'dt': 1.0}, compress=compress)
+
+            # When
+            data = load(fname, lazy=True)
+            pa1 = data['arrays']['fluid']
+
+            # Then
+            self.assertTrue(isinstance(pa1, LazyParticleArray))
+            self.assertEqual(data['solver_data']['dt'], 1.0)
+            self.assertEqual(pa1.get_number_of_particles(), 10)
+            self.assertTrue(np.allclose(pa1.p, 3*x, atol=1e-14))
+            self.assertTrue(np.allclose(pa1.c1, [1.0, 2.0], atol=1e-14))
+            y, p = pa1.get('y', 'p')
+            self.assertTrue(np.allclose(y, 2*x, atol=1e-14))
+            self.assertEqual(isinstance(y, np.memmap), not compress)
+
+            # When
+            pa2 = pa1.get_particle_array()
+
+            # Then
+            self.assertListEqual(list(sorted(pa.properties.keys())),
+                                 list(sorted(pa2.properties.keys())))
+            self.assertTrue(np.allclose(pa2.x, x, atol=1e-14))
+            self.assertTrue(np.allclose(pa2.p, 3*x, atol=1e-14))
+            self.assertTrue(np.allclose(pa2.c1, [1.0, 2.0], atol=1e-14))
+
+    def test_iter_output_with_lazy_properties(self):
+        # Given
+        x = np.linspace(0, 1.0, 10)
+        pa = get_particle_array_wcsph(name='fluid', x=x, y=2*x, p=3*x)
+        fnames = []
+        for i in range(3):
+            fnames.append(self._get_filename('simple_%d' % i))
+            pa.p[:] = i
+            dump(fnames[-1], [pa], solver_data={'count': i})
+
+        # When
+        result = list(iter_output(fnames, 'fluid', props=['p'], lazy=True))
+
+        # Then
+        for i, (solver_data, pa1) in enumerate(result):
+            self.assertEqual(solver_data['count'], i)
+            self.assertEqual(pa1.stored, ['p'])
+            self.assertTrue(np.allclose(pa1.p, i, atol=1e-14))
+            self.assertRaises(AttributeError, getattr, pa1, 'x')
+
 
 class TestOutputHdf5(TestOutputNumpy):
     @skipUnless(has_h5py(), "h5py module is not present")
@@ -395,7 +395,7 @@ def get_files(dirname=None, fname=None, endswith=output_formats):
     return files
 
 
-def iter_output(files, *arrays):
+def iter_output(files, *arrays, **kw):
     """Given an iterable of the solution files, this loads the files, and
     yields the solver data and the requested arrays.
 
@@ -410,6 +410,15 @@ def iter_output(files, *arrays):
     *arrays : strings
         Optional series of array names of arrays to return.
 
+    props : list
+        Optional keyword argument with the names of the properties to
+        load, see `load`.
+
+    lazy : bool
+        Optional keyword argument, if True `LazyParticleArray` instances
+        are returned whose properties are only read when they are used, see
+        `load`.
+
     Examples
     --------
 
@@ -421,9 +430,17 @@ def iter_output(files, *arrays):
     >>> for solver_data, fluid in iter_output(files, 'fluid'):
     ...     print(solver_data['t'], fluid.name)
 
+    >>> for solver_data, fluid in iter_output(files, 'fluid', props=['p'],
+    ...                                       lazy=True):
+    ...     print(solver_data['t'], fluid.p.max())
+
     """
+    props = kw.pop('props', None)
+    lazy = kw.pop('lazy', False)
+    if len(kw) > 0:
+        raise TypeError('Unexpected keyword arguments: %s'%', '.join(kw))
     for file in files:
-        data = load(file)
+        data = load(file, props=props, lazy=lazy)
         solver_data = data['solver_data']
         if len(arrays) == 0:
             yield solver_data, data['arrays']
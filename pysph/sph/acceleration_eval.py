@@ -4,7 +4,9 @@ try:
 except ImportError:
     from ordereddict import OrderedDict
 
-from pysph.sph.equation import Group, get_arrays_used_in_equation
+from pysph.base.config import get_config
+from pysph.sph.equation import (Group, get_arrays_used_in_equation,
+    get_arrays_written_by_equation)
 
 
 ###############################################################################
@@ -25,6 +27,56 @@ def group_equations(equations):
         return equations
 
 
+###############################################################################
+def _get_interactions(group):
+    return set((eq.dest, src) for eq in group.equations
+               if not eq.no_source for src in eq.sources)
+
+
+def _can_fuse(first, second):
+    for group in (first, second):
+        if group.has_subgroups or group.iterate or group.has_reduce():
+            return False
+    if first.update_nnps or first.real != second.real:
+        return False
+    if len(_get_interactions(first) & _get_interactions(second)) == 0:
+        return False
+    for a, b in ((first, second), (second, first)):
+        written = set()
+        for equation in a.equations:
+            written.update(
+                x[2:] for x in get_arrays_written_by_equation(equation)
+            )
+        src, dest = b.get_array_names()
+        used = set(x[2:] for x in src | dest)
+        if len(written & used) > 0:
+            return False
+    return True
+
+
+def fuse_groups(groups):
+    """Merge consecutive groups that can be evaluated together and return
+    the new list of groups.
+
+    Two groups are merged when they share a destination and source, are
+    neither iterated nor have sub-groups or reductions, have the same
+    `real` and the first does not update the NNPS.  Neither group may
+    modify a property (of any particle array) that the other uses,
+    including the properties used by the precomputed symbols.  The merged
+    group finds the neighbors and computes symbols like `DWIJ` once for
+    each pair instead of once in each group.
+    """
+    result = []
+    for group in groups:
+        if len(result) > 0 and _can_fuse(result[-1], group):
+            first = result.pop()
+            equations = list(first.equations) + list(group.equations)
+            group = Group(equations, real=first.real,
+                          update_nnps=group.update_nnps)
+        result.append(group)
+    return result
+
+
 ###############################################################################
 def check_equation_array_properties(equation, particle_arrays):
     """Given an equation and the particle arrays, check if the particle arrays
@@ -140,7 +192,8 @@ class MegaGroup(object):
 
 ###############################################################################
 class AccelerationEval(object):
-    def __init__(self, particle_arrays, equations, kernel, mode='serial'):
+    def __init__(self, particle_arrays, equations, kernel, mode='serial',
+                 domain=None):
         """
 
         Parameters
@@ -150,12 +203,15 @@ class AccelerationEval(object):
         equations: list: A list of equations/groups.
         kernel: The kernel to use.
         parallel: str: One of 'serial', 'mpi'.
+        domain: DomainManager: the domain, only needed when the NNPS uses
+            virtual periodic images.
         """
         self.particle_arrays = particle_arrays
         self.equation_groups = group_equations(equations)
         self.kernel = kernel
         self.nnps = None
         self.mode = mode
+        self.domain = domain
 
         all_equations = []
         for group in self.equation_groups:
@@ -169,7 +225,10 @@ class AccelerationEval(object):
         for equation in all_equations:
             check_equation_array_properties(equation, particle_arrays)
 
-        self.mega_groups = [MegaGroup(g) for g in self.equation_groups]
+        groups = self.equation_groups
+        if get_config().use_fused_groups:
+            groups = fuse_groups(groups)
+        self.mega_groups = [MegaGroup(g) for g in groups]
         self.c_acceleration_eval = None
 
     ##########################################################################
@@ -181,6 +240,69 @@ class AccelerationEval(object):
         """
         self.c_acceleration_eval.compute(t, dt)
 
+    def get_remote_props(self):
+        """Return the properties that are read from the remote particles of
+        each array as a dictionary keyed on the array name.
+
+        These are the source properties used by the equations, the
+        destination properties of groups that also compute on remote
+        particles (``real=False``) and of symmetric loops (which read them
+        at the source index).  Arrays that are the destination of an
+        equation with a ``reduce`` method are left out as the reduction may
+        use all the properties of all the particles.  This is used by the
+        parallel manager to only exchange the needed properties for the
+        remote particles.
+        """
+        props = defaultdict(set)
+        full = set()
+
+        def _update(mega_group):
+            if mega_group.has_subgroups:
+                for mg in mega_group.data:
+                    _update(mg)
+                return
+            for dest, (eqs_no_src, sources, all_eqs) in mega_group.data.items():
+                if all_eqs.has_reduce():
+                    full.add(dest)
+                if not mega_group.real:
+                    d = all_eqs.get_array_names()[1]
+                    props[dest].update(x[2:] for x in d)
+                for src, group in sources.items():
+                    s, d = group.get_array_names()
+                    props[src].update(x[2:] for x in s)
+                    if src == dest and group.has_symmetric_loop():
+                        props[src].update(x[2:] for x in d)
+
+        for mega_group in self.mega_groups:
+            _update(mega_group)
+
+        names = [pa.name for pa in self.particle_arrays]
+        return dict(
+            (name, props[name]) for name in names if name not in full
+        )
+
+    def get_profile_info(self):
+        """Return the timings collected when the code is generated with
+        profiling enabled (see ``Config.use_profiling``).
+
+        A list of dictionaries, one per timed section, is returned sorted by
+        the total time in decreasing order.  Each has the keys ``name``,
+        ``time``, ``calls`` and ``equations``.
+        """
+        profile_data = self.c_acceleration_eval.profile_data
+        result = []
+        for name, data in profile_data.items():
+            info = dict(name=name)
+            info.update(data)
+            result.append(info)
+        result.sort(key=lambda x: x['time'], reverse=True)
+        return result
+
+    def reset_profile(self):
+        """Discard any timings collected so far.
+        """
+        self.c_acceleration_eval.reset_profile()
+
     def set_compiled_object(self, c_acceleration_eval):
         """Set the high-performance compiled object to call internally.
         """
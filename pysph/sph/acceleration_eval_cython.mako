@@ -6,39 +6,7 @@ ${' '*4*level}${l}
 % endfor
 </%def>
 
-<%def name="do_group(helper, group, level=0)" buffered="True">
-#######################################################################
-## Iterate over destinations in this group.
-#######################################################################
-% for dest, (eqs_with_no_source, sources, all_eqs) in group.data.items():
-# ---------------------------------------------------------------------
-# Destination ${dest}.\
-#######################################################################
-## Setup destination array pointers.
-#######################################################################
-
-dst = self.${dest}
-${indent(helper.get_dest_array_setup(dest, eqs_with_no_source, sources, group.real), 0)}
-dst_array_index = dst.index
-
-#######################################################################
-## Initialize all equations for this destination.
-#######################################################################
-% if all_eqs.has_initialize():
-# Initialization for destination ${dest}.
-for d_idx in range(NP_DEST):
-    ${indent(all_eqs.get_initialize_code(helper.object.kernel), 1)}
-% endif
-#######################################################################
-## Handle all the equations that do not have a source.
-#######################################################################
-% if len(eqs_with_no_source.equations) > 0:
-% if eqs_with_no_source.has_loop():
-# SPH Equations with no sources.
-for d_idx in range(NP_DEST):
-    ${indent(eqs_with_no_source.get_loop_code(helper.object.kernel), 1)}
-% endif
-% endif
+<%def name="do_sources(helper, dest, sources, label, indices=None)" buffered="True">
 #######################################################################
 ## Iterate over sources.
 #######################################################################
@@ -58,7 +26,75 @@ src_array_index = src.index
 ## Iterate over destination particles.
 #######################################################################
 nnps.set_context(src_array_index, dst_array_index)
+${helper.get_timer_start()}
+
+% if indices is not None:
+#######################################################################
+## Iterate over the given destination particles.
+#######################################################################
+_indices = ${indices}
+D_INDICES = _indices.data
+N_INDICES = _indices.length
+${helper.get_parallel_block()}
+    thread_id = threadid()
+    DT_ADAPT = &_DT_ADAPT.data[thread_id*aligned(3, 8)]
+    ${indent(eq_group.get_variable_array_setup(), 1)}
+    for _d in prange(N_INDICES):
+        d_idx = D_INDICES[_d]
+        nnps.get_nearest_neighbors(d_idx, <UIntArray>self.nbrs[thread_id])
+        for nbr_idx in range((<UIntArray>self.nbrs[thread_id]).length):
+            s_idx = <int>((<UIntArray>self.nbrs[thread_id]).data[nbr_idx])
+            ${indent(eq_group.get_loop_code(helper.object.kernel, helper.get_periodic_axes()), 3)}
 
+% elif helper.use_symmetric_loop(dest, source, eq_group):
+#######################################################################
+## Iterate over each pair of particles once.
+#######################################################################
+thread_id = 0
+DT_ADAPT = _DT_ADAPT.data
+${indent(eq_group.get_variable_array_setup(), 0)}
+for d_idx in range(NP_DEST):
+    nnps.get_nearest_neighbors(d_idx, <UIntArray>self.nbrs[thread_id])
+    for nbr_idx in range((<UIntArray>self.nbrs[thread_id]).length):
+        s_idx = <int>((<UIntArray>self.nbrs[thread_id]).data[nbr_idx])
+        # This pair was handled when s_idx was the destination.
+        if s_idx < d_idx:
+            continue
+        ${indent(eq_group.get_loop_code(helper.object.kernel, helper.get_periodic_axes()), 2)}
+        # Add the contribution of this pair to the source particle.
+        if s_idx > d_idx and s_idx < NP_DEST:
+            ${indent(eq_group.get_symmetric_loop_code(helper.object.kernel), 3)}
+
+% elif helper.use_cell_loop():
+#######################################################################
+## Iterate over the destination particles cell by cell.
+#######################################################################
+N_CELLS = nnps.prepare_cell_query()
+${helper.get_parallel_block()}
+    thread_id = threadid()
+    DT_ADAPT = &_DT_ADAPT.data[thread_id*aligned(3, 8)]
+    ${indent(eq_group.get_variable_array_setup(), 1)}
+    for _cell in prange(N_CELLS):
+        nnps.get_cell_particles(
+            _cell, <UIntArray>self.cell_dst[thread_id],
+            <UIntArray>self.cell_candidates[thread_id],
+            <DoubleArray>self.cell_coords[thread_id]
+        )
+        for _cell_d in range((<UIntArray>self.cell_dst[thread_id]).length):
+            d_idx = (<UIntArray>self.cell_dst[thread_id]).data[_cell_d]
+            if d_idx >= NP_DEST:
+                continue
+            nnps.get_cell_neighbors(
+                d_idx, <UIntArray>self.cell_dst[thread_id],
+                <UIntArray>self.cell_candidates[thread_id],
+                <DoubleArray>self.cell_coords[thread_id],
+                <UIntArray>self.nbrs[thread_id]
+            )
+            for nbr_idx in range((<UIntArray>self.nbrs[thread_id]).length):
+                s_idx = <int>((<UIntArray>self.nbrs[thread_id]).data[nbr_idx])
+                ${indent(eq_group.get_loop_code(helper.object.kernel, helper.get_periodic_axes()), 4)}
+
+% else:
 ${helper.get_parallel_block()}
     thread_id = threadid()
     DT_ADAPT = &_DT_ADAPT.data[thread_id*aligned(3, 8)]
@@ -74,27 +110,94 @@ ${helper.get_parallel_block()}
             ###########################################################
             ## Iterate over the equations for the same set of neighbors.
             ###########################################################
-            ${indent(eq_group.get_loop_code(helper.object.kernel), 3)}
+            ${indent(eq_group.get_loop_code(helper.object.kernel, helper.get_periodic_axes()), 3)}
 
+% endif ## if indices is not None
+${helper.get_timer_stop(label, dest + ' <- ' + source, 'loop', eq_group)}
 % endif ## if eq_group.has_loop():
 # Source ${source} done.
 # --------------------------------------
 % endfor
+</%def>
+
+<%def name="do_group(helper, group, label, level=0)" buffered="True">
+#######################################################################
+## Iterate over destinations in this group.
+#######################################################################
+% for dest, (eqs_with_no_source, sources, all_eqs) in group.data.items():
+# ---------------------------------------------------------------------
+# Destination ${dest}.\
+#######################################################################
+## Setup destination array pointers.
+#######################################################################
+
+dst = self.${dest}
+${indent(helper.get_dest_array_setup(dest, eqs_with_no_source, sources, group.real), 0)}
+dst_array_index = dst.index
+
+#######################################################################
+## Initialize all equations for this destination.
+#######################################################################
+% if all_eqs.has_initialize():
+# Initialization for destination ${dest}.
+${helper.get_timer_start()}
+for d_idx in range(NP_DEST):
+    ${indent(all_eqs.get_initialize_code(helper.object.kernel), 1)}
+${helper.get_timer_stop(label, dest, 'initialize', all_eqs)}
+% endif
+#######################################################################
+## Handle all the equations that do not have a source.
+#######################################################################
+% if len(eqs_with_no_source.equations) > 0:
+% if eqs_with_no_source.has_loop():
+# SPH Equations with no sources.
+${helper.get_timer_start()}
+for d_idx in range(NP_DEST):
+    ${indent(eqs_with_no_source.get_loop_code(helper.object.kernel), 1)}
+${helper.get_timer_stop(label, dest, 'loop', eqs_with_no_source)}
+% endif
+% endif
+% if helper.get_overlap_dest(group) == dest:
+#######################################################################
+## Compute the interior particles while the halo is being exchanged.
+#######################################################################
+if self.halo is None:
+    ${indent(do_sources(helper, dest, sources, label), 1)}
+else:
+    # The NNPS was updated before the remote particles arrived, this is
+    # fine for the interior particles as they have no remote neighbors.
+    _halo = self.halo
+    self.halo = None
+    ${indent(do_sources(helper, dest, sources, label, '_halo.interior_particles[dst.name]'), 1)}
+    # Wait for the halo and bin the remote particles again to find the
+    # neighbors of the boundary particles.
+    ${helper.get_timer_start()}
+    _halo.finish_refresh_halo()
+    nnps.update()
+    ${helper.get_timer_stop(label, 'halo', 'wait')}
+    ${indent(do_sources(helper, dest, sources, label, '_halo.boundary_particles[dst.name]'), 1)}
+% else:
+${do_sources(helper, dest, sources, label)}
+% endif
 ###################################################################
 ## Do any post_loop assignments for the destination.
 ###################################################################
 % if all_eqs.has_post_loop():
 # Post loop for destination ${dest}.
+${helper.get_timer_start()}
 DT_ADAPT = _DT_ADAPT.data
 for d_idx in range(NP_DEST):
     ${indent(all_eqs.get_post_loop_code(helper.object.kernel), 1)}
+${helper.get_timer_stop(label, dest, 'post_loop', all_eqs)}
 % endif
 
 ###################################################################
 ## Do any reductions for the destination.
 ###################################################################
 % if all_eqs.has_reduce():
+${helper.get_timer_start()}
 ${indent(all_eqs.get_reduce_code(), 0)}
+${helper.get_timer_stop(label, dest, 'reduce', all_eqs)}
 % endif
 
 # Destination ${dest} done.
@@ -105,8 +208,10 @@ ${indent(all_eqs.get_reduce_code(), 0)}
 #######################################################################
 % if group.update_nnps:
 # Updating NNPS.
+${helper.get_timer_start()}
 nnps.update_domain()
 nnps.update()
+${helper.get_timer_stop(label, 'nnps', 'update')}
 % endif
 
 % endfor
@@ -115,6 +220,7 @@ nnps.update()
 from libc.math cimport *
 from libc.math cimport fabs as abs
 from libc.math cimport M_PI as pi
+cimport cython
 cimport numpy
 import numpy
 % if not helper.config.use_openmp:
@@ -134,6 +240,9 @@ from pysph.base.reduce_array import mpi_reduce_array as parallel_reduce_array
 % endif
 
 from pysph.base.nnps import get_number_of_threads
+% if helper.config.use_profiling:
+from timeit import default_timer as _timer
+% endif
 from pyzoltan.core.carray cimport (DoubleArray, FloatArray, IntArray, LongArray, UIntArray,
     aligned, aligned_free, aligned_malloc)
 
@@ -173,8 +282,19 @@ cdef class AccelerationEval:
     cdef public int n_threads
     cdef public list _nbr_refs
     cdef void **nbrs
+    # Destination particles and candidate neighbors (and scratch space for
+    # their coordinates) of a cell per thread.
+    cdef void **cell_dst
+    cdef void **cell_candidates
+    cdef void **cell_coords
     # CFL time step conditions
     cdef public double dt_cfl, dt_force, dt_viscous
+    # The periods used to find the nearest image of a pair.
+    cdef public double xtranslate, ytranslate, ztranslate
+    # Timings collected when profiling is enabled.
+    cdef public dict profile_data
+    # The halo being exchanged (see `ParallelManager.start_refresh_halo`).
+    cdef public object halo
     ${indent(helper.get_kernel_defs(), 1)}
     ${indent(helper.get_equation_defs(), 1)}
 
@@ -186,20 +306,41 @@ cdef class AccelerationEval:
             name = pa.name
             setattr(self, name, ParticleArrayWrapper(pa, i))
 
+        self.profile_data = {}
+        self.halo = None
         self.nbrs = <void**>aligned_malloc(sizeof(void*)*self.n_threads)
+        self.cell_dst = <void**>aligned_malloc(sizeof(void*)*self.n_threads)
+        self.cell_candidates = <void**>aligned_malloc(
+            sizeof(void*)*self.n_threads
+        )
+        self.cell_coords = <void**>aligned_malloc(sizeof(void*)*self.n_threads)
         cdef UIntArray _arr
+        cdef DoubleArray _coords
         self._nbr_refs = []
         for i in range(self.n_threads):
             _arr = UIntArray()
             _arr.reserve(1024)
             self.nbrs[i] = <void*>_arr
             self._nbr_refs.append(_arr)
+            _arr = UIntArray()
+            self.cell_dst[i] = <void*>_arr
+            self._nbr_refs.append(_arr)
+            _arr = UIntArray()
+            _arr.reserve(1024)
+            self.cell_candidates[i] = <void*>_arr
+            self._nbr_refs.append(_arr)
+            _coords = DoubleArray()
+            self.cell_coords[i] = <void*>_coords
+            self._nbr_refs.append(_coords)
 
         ${indent(helper.get_kernel_init(), 2)}
         ${indent(helper.get_equation_init(), 2)}
 
     def __dealloc__(self):
         aligned_free(self.nbrs)
+        aligned_free(self.cell_dst)
+        aligned_free(self.cell_candidates)
+        aligned_free(self.cell_coords)
 
     cdef _initialize_dt_adapt(self, double* DT_ADAPT):
         self.dt_cfl = self.dt_force = self.dt_viscous = -1e20
@@ -226,8 +367,23 @@ cdef class AccelerationEval:
         self.dt_force = dta[1]
         self.dt_viscous = dta[2]
 
+    cdef _add_time(self, str name, tuple equations, double elapsed):
+        cdef dict data = self.profile_data.get(name)
+        if data is None:
+            data = dict(time=0.0, calls=0, equations=list(equations))
+            self.profile_data[name] = data
+        data['time'] += elapsed
+        data['calls'] += 1
+
+    def reset_profile(self):
+        self.profile_data = {}
+
     def set_nnps(self, NNPS nnps):
         self.nnps = nnps
+        if nnps.domain is not None:
+            self.xtranslate = nnps.domain.xtranslate
+            self.ytranslate = nnps.domain.ytranslate
+            self.ztranslate = nnps.domain.ztranslate
 
     def update_particle_arrays(self, particle_arrays):
         for pa in particle_arrays:
@@ -244,6 +400,9 @@ cdef class AccelerationEval:
         cdef double* DT_ADAPT = _DT_ADAPT.data
 
         cdef int max_iterations, min_iterations, _iteration_count
+        % if helper.config.use_profiling:
+        cdef double _t0
+        % endif
 
         #######################################################################
         ##  Declare all the arrays.
@@ -256,6 +415,15 @@ cdef class AccelerationEval:
         # Variables.\
 
         cdef int src_array_index, dst_array_index
+        % if helper.use_cell_loop():
+        cdef long _cell, _cell_d, N_CELLS
+        % endif
+        % if helper.has_overlap():
+        cdef object _halo
+        cdef UIntArray _indices
+        cdef unsigned int* D_INDICES
+        cdef long _d, N_INDICES
+        % endif
         ${indent(helper.get_variable_declarations(), 2)}
         #######################################################################
         ## Iterate over groups:
@@ -280,11 +448,11 @@ cdef class AccelerationEval:
             % if group.has_subgroups:
             % for sg_idx, sub_group in enumerate(group.data):
             # Doing subgroup ${sg_idx}
-            ${indent(do_group(helper, sub_group, 3), 3)}
+            ${indent(do_group(helper, sub_group, 'Group %d.%d'%(g_idx, sg_idx), 3), 3)}
             % endfor
 
             % else:
-            ${indent(do_group(helper, group, 3), 3)}
+            ${indent(do_group(helper, group, 'Group %d'%g_idx, 3), 3)}
             % endif
             #######################################################################
             ## Break the iteration for the group.
@@ -5,6 +5,7 @@ from os.path import dirname, join
 from pyzoltan.core import carray
 from pysph.base.config import get_config
 from pysph.base.cython_generator import CythonGenerator, KnownType
+from pysph.sph.equation import get_kernel_code
 
 
 ###############################################################################
@@ -152,10 +153,15 @@ class AccelerationEvalCythonHelper(object):
             headers.extend(get_code(equation))
 
         # Kernel wrappers.
-        cg = CythonGenerator(known_types=self.known_types)
+        cg = CythonGenerator(known_types=self.known_types, final=True)
         cg.parse(object.kernel)
         headers.append(cg.get_code())
 
+        # Kernel functions specialized for the kernel used.
+        kernel_code = get_kernel_code(object.kernel)
+        if kernel_code is not None:
+            headers.append(kernel_code)
+
         # Equation wrappers.
         headers.append(object.all_group.get_equation_wrappers(
             self.known_types
@@ -210,6 +216,104 @@ class AccelerationEvalCythonHelper(object):
         else:
             return "if True: # Placeholder used for OpenMP."
 
+    def use_symmetric_loop(self, dest_name, src_name, eq_group):
+        """Returns True if the pair-wise loop for the given destination and
+        source is to be evaluated once per pair of particles.
+
+        Contributions are scattered to both the particles of a pair, which is
+        not thread-safe, so the symmetric loop is only used when OpenMP is
+        disabled.
+        """
+        config = self.config
+        return (config.use_symmetric_loop and not config.use_openmp and
+                dest_name == src_name and eq_group.has_symmetric_loop())
+
+    def use_cell_loop(self):
+        """Returns True if the neighbors of the destination particles are to
+        be found cell by cell, see `NNPS.prepare_cell_query`.
+        """
+        return self.config.use_cell_loop
+
+    def get_overlap_dest(self, group):
+        """Return the destination of the given (mega) group whose pair-wise
+        loops are split into the interior and boundary particles so the
+        halo exchange can be overlapped with the computation, or None.
+
+        Only the first destination in the equations that has a loop over
+        sources can be overlapped and only when everything computed before
+        it does not use the remote particles, i.e. all the earlier groups
+        are `real` and have no reductions.  The destination's group must
+        also be `real`, not iterated and must not use the symmetric loop.
+        """
+        overlap = self._get_overlap()
+        if overlap is not None and overlap[0] is group:
+            return overlap[1]
+
+    def has_overlap(self):
+        """Returns True if the generated code can overlap the halo exchange
+        with the computation, see `get_overlap_dest`.
+        """
+        return self._get_overlap() is not None
+
+    def _get_overlap(self):
+        if self.object.mode != 'mpi':
+            return None
+        for group in self.object.mega_groups:
+            if group.has_subgroups:
+                for sub_group in group.data:
+                    for dest, (eqs, sources, all_eqs) in sub_group.data.items():
+                        if any(g.has_loop() for g in sources.values()):
+                            return None
+                        if not sub_group.real or all_eqs.has_reduce():
+                            return None
+                continue
+            for dest, (eqs, sources, all_eqs) in group.data.items():
+                if any(g.has_loop() for g in sources.values()):
+                    symmetric = any(
+                        self.use_symmetric_loop(dest, src, g)
+                        for src, g in sources.items()
+                    )
+                    if group.real and not group.iterate and not symmetric:
+                        return group, dest
+                    return None
+                if not group.real or all_eqs.has_reduce():
+                    return None
+        return None
+
+    def get_periodic_axes(self):
+        """Return the axes along which the NNPS finds the periodic images of
+        the sources, the separation `XIJ` of a pair is shifted to the nearest
+        image along these.  This is empty unless the domain is periodic and
+        uses virtual images, the NNPS turns the images off when running in
+        parallel but the shift is then harmless.
+        """
+        domain = self.object.domain
+        if domain is None or not domain.virtual_images:
+            return ()
+        periodic = (domain.periodic_in_x, domain.periodic_in_y,
+                    domain.periodic_in_z)
+        return tuple(axis for axis, p in zip('xyz', periodic) if p)
+
+    def get_timer_start(self):
+        if self.config.use_profiling:
+            return '_t0 = _timer()'
+        else:
+            return ''
+
+    def get_timer_stop(self, label, target, phase, group=None):
+        """Return code to record the time elapsed since the last timer start
+        under the name "label/target/phase" along with the names of the
+        equations in the given group.  No code is generated if profiling is
+        disabled.
+        """
+        if not self.config.use_profiling:
+            return ''
+        name = '/'.join((label, target, phase))
+        equations = [] if group is None else [e.name for e in group.equations]
+        return 'self._add_time(%r, %r, _timer() - _t0)'%(
+            name, tuple(equations)
+        )
+
     def get_particle_array_names(self):
         parrays = [pa.name for pa in self.object.particle_arrays]
         return ', '.join(parrays)
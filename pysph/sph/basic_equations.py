@@ -11,6 +11,8 @@ class SummationDensity(Equation):
     :math:`\rho_a = \sum_b m_b W_{ab}`
 
     """
+    symmetric = True
+
     def initialize(self, d_idx, d_rho):
         d_rho[d_idx] = 0.0
 
@@ -168,6 +170,8 @@ class ContinuityEquation(Equation):
     \nabla_a W_{ab}`
 
     """
+    symmetric = True
+
     def initialize(self, d_idx, d_arho):
         d_arho[d_idx] = 0.0
 
@@ -207,6 +211,8 @@ class MonaghanArtificialViscosity(Equation):
     .. [Monaghan2005] J. Monaghan, "Smoothed particle hydrodynamics",
         Reports on Progress in Physics, 68 (2005), pp. 1703-1759.
     """
+    symmetric = True
+
     def __init__(self, dest, sources, alpha=1.0, beta=1.0):
         r"""
         Parameters
@@ -18,8 +18,10 @@ import numpy
 from textwrap import dedent
 
 # Local imports.
-from pysph.base.ast_utils import get_symbols
-from pysph.base.cython_generator import CythonGenerator, KnownType
+from pysph.base.ast_utils import get_assigned, get_symbols
+from pysph.base.config import get_config
+from pysph.base.cython_generator import (CodeGenerationError,
+    CythonGenerator, KnownType)
 
 def camel_to_underscore(name):
     """Given a CamelCase name convert it to a name with underscores,
@@ -31,6 +33,36 @@ def camel_to_underscore(name):
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
 
+# The specialized kernel code keyed on the kernel class, its attributes
+# (like the dimension) and the configuration used to generate it.
+_kernel_code_cache = {}
+
+def get_kernel_code(kernel):
+    """Return the code for the methods of the kernel as inline functions
+    specialized on the values of its attributes (like the dimension and the
+    normalization factor) or None if the kernel cannot be specialized.  See
+    `CythonGenerator.parse_specialized`.
+
+    The code is cached for each kernel class and dimension (and the other
+    numeric attributes) so the kernel is only parsed once.
+    """
+    attrs = tuple(sorted(
+        (name, value) for name, value in kernel.__dict__.items()
+        if isinstance(value, (int, float))
+    ))
+    config = get_config()
+    key = (kernel.__class__, attrs, config.use_double, config.use_openmp)
+    if key not in _kernel_code_cache:
+        cg = CythonGenerator()
+        try:
+            cg.parse_specialized(kernel)
+            code = cg.get_code()
+        except CodeGenerationError:
+            code = None
+        _kernel_code_cache[key] = code
+    return _kernel_code_cache[key]
+
+
 ##############################################################################
 # `Context` class.
 ##############################################################################
@@ -243,6 +275,13 @@ def precomputed_symbols():
     return c
 
 
+# Precomputed symbols that remain unchanged and those that only change sign
+# when the destination and source particles of a pair are interchanged.
+SYMMETRIC_SYMBOLS = set(['HIJ', 'EPS', 'RHOIJ', 'RHOIJ1', 'R2IJ', 'RIJ',
+                         'WIJ', 'WDP', 'GHIJ'])
+ANTISYMMETRIC_SYMBOLS = set(['XIJ', 'VIJ', 'DWIJ'])
+
+
 def sort_precomputed(precomputed):
     """Sorts the precomputed equations in the given dictionary as per the
     dependencies of the symbols and returns an ordered dict.
@@ -317,6 +356,27 @@ def get_arrays_used_in_equation(equation):
             dest_arrays.update(d)
     return src_arrays, dest_arrays
 
+def get_arrays_written_by_equation(equation):
+    """Return the set of arrays that may be modified by the `initialize`,
+    `loop` and `post_loop` methods of the equation.  These are the arrays
+    that are assigned to and, to be safe, any arrays passed to a function.
+    """
+    written = set()
+    for meth_name in ('initialize', 'loop', 'post_loop'):
+        meth = getattr(equation, meth_name, None)
+        if meth is not None:
+            tree = ast.parse(dedent(inspect.getsource(meth)))
+            names = get_assigned(tree)
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Call):
+                    names.update(
+                        arg.id for arg in node.args
+                        if isinstance(arg, ast.Name)
+                    )
+            src, dest = get_array_names(names)
+            written.update(src | dest)
+    return written
+
 def get_init_args(obj, method, ignore=None):
     """Return the arguments for the method given, typically an __init__.
     """
@@ -332,6 +392,13 @@ def get_init_args(obj, method, ignore=None):
 ##############################################################################
 class Equation(object):
 
+    # Set this to True if the pair-wise `loop` only accumulates into
+    # destination properties and the contribution to the source particle of
+    # a pair is obtained by calling `loop` with the indices interchanged.
+    # Such equations may be evaluated once per pair when the symmetric loop
+    # is enabled, see `Group.has_symmetric_loop`.
+    symmetric = False
+
     ##########################################################################
     # `object` interface.
     ##########################################################################
@@ -451,6 +518,7 @@ class Group(object):
         )
 
     def _get_variable_decl(self, context, mode='declare'):
+        float_type = 'double' if get_config().use_double else 'float'
         decl = []
         names = list(context.keys())
         names.sort()
@@ -462,7 +530,7 @@ class Group(object):
                                                               var=var,
                                                               value=value))
             elif isinstance(value, float):
-                declare = 'cdef double ' if mode == 'declare' else ''
+                declare = 'cdef %s '%float_type if mode == 'declare' else ''
                 decl.append('{declare}{var} = {value}'.format(declare=declare,
                                                               var=var,
                                                               value=value))
@@ -485,7 +553,7 @@ class Group(object):
             if hasattr(equation, kind):
                 return True
 
-    def _get_code(self, kind='loop'):
+    def _get_code(self, kind='loop', periodic=()):
         assert kind in ('initialize', 'loop', 'post_loop', 'reduce')
         # We assume here that precomputed quantities are only relevant
         # for loops and not post_loops and initialization.
@@ -493,8 +561,17 @@ class Group(object):
         if kind == 'loop':
             for p, cb in self.precomputed.items():
                 pre.append(cb.code.strip())
+                if p == 'XIJ':
+                    pre.extend(self._get_minimum_image_code(periodic))
             if len(pre) > 0:
                 pre.append('')
+        code = self._get_calls(kind)
+        if len(code) > 0:
+            code.append('')
+        return '\n'.join(pre + code)
+
+    def _get_calls(self, kind='loop', swap_indices=False):
+        swap = {'d_idx': 's_idx', 's_idx': 'd_idx'}
         code = []
         for eq in self.equations:
             meth = getattr(eq, kind, None)
@@ -502,20 +579,39 @@ class Group(object):
                 args = inspect.getargspec(meth).args
                 if 'self' in args:
                     args.remove('self')
+                if swap_indices:
+                    args = [swap.get(arg, arg) for arg in args]
                 call_args = ', '.join(args)
                 c = 'self.{eq_name}.{method}({args})'\
                       .format(eq_name=eq.var_name, method=kind, args=call_args)
                 code.append(c)
-        if len(code) > 0:
-            code.append('')
-        return '\n'.join(pre + code)
+        return code
+
+    def _get_minimum_image_code(self, periodic):
+        code = []
+        for axis in periodic:
+            i = 'xyz'.index(axis)
+            code.append(dedent('''\
+                if XIJ[{i}] > 0.5*self.{axis}translate:
+                    XIJ[{i}] -= self.{axis}translate
+                elif XIJ[{i}] < -0.5*self.{axis}translate:
+                    XIJ[{i}] += self.{axis}translate''').format(i=i, axis=axis))
+        return code
 
     def _set_kernel(self, code, kernel):
         if kernel is not None:
-            k_func = 'self.kernel.kernel'
-            g_func = 'self.kernel.gradient'
-            h_func = 'self.kernel.gradient_h'
-            deltap = 'self.kernel.get_deltap()'
+            if get_kernel_code(kernel) is not None:
+                # Call the specialized functions, see `get_kernel_code`.
+                name = kernel.__class__.__name__
+                k_func = name + '_kernel'
+                g_func = name + '_gradient'
+                h_func = name + '_gradient_h'
+                deltap = repr(float(kernel.get_deltap()))
+            else:
+                k_func = 'self.kernel.kernel'
+                g_func = 'self.kernel.gradient'
+                h_func = 'self.kernel.gradient_h'
+                deltap = 'self.kernel.get_deltap()'
             code = code.replace('DELTAP', deltap)
             return code.replace('GRADIENT', g_func).replace('KERNEL', k_func).replace('GRADH', h_func)
         else:
@@ -650,10 +746,53 @@ class Group(object):
     def has_loop(self):
         return self._has_code('loop')
 
-    def get_loop_code(self, kernel=None):
-        code = self._get_code(kind='loop')
+    def get_loop_code(self, kernel=None, periodic=()):
+        """Return the code for the loops of the equations.
+
+        `periodic` is a sequence of the axes ('x', 'y' or 'z') along which
+        the NNPS finds the periodic images of the sources instead of using
+        ghost particles.  `XIJ` is then shifted to the nearest image using
+        the periods stored in the `xtranslate` etc. attributes of the
+        generated class, so equations that need the separation of a pair
+        must use `XIJ` (and the symbols computed from it) rather than the
+        source positions.
+        """
+        code = self._get_code(kind='loop', periodic=periodic)
         return self._set_kernel(code, kernel)
 
+    def has_symmetric_loop(self):
+        """Returns True if the loop of this group can be evaluated once for
+        each pair of particles.
+
+        This requires that all the equations with a loop are declared
+        `symmetric` and that the precomputed symbols used are either
+        symmetric or antisymmetric with respect to an interchange of the
+        pair.  The caller must ensure that the source and destination are
+        the same particle array.
+        """
+        if not self.has_loop():
+            return False
+        for equation in self.equations:
+            if hasattr(equation, 'loop') and not equation.symmetric:
+                return False
+        allowed = SYMMETRIC_SYMBOLS | ANTISYMMETRIC_SYMBOLS
+        return set(self.precomputed.keys()) <= allowed
+
+    def get_symmetric_loop_code(self, kernel=None):
+        """Return the code that adds the contribution of the current pair to
+        the source particle.  This is to be used after the code from
+        `get_loop_code` and simply negates the antisymmetric precomputed
+        symbols before calling the loops with the indices interchanged.
+        """
+        code = []
+        for sym in sorted(ANTISYMMETRIC_SYMBOLS & set(self.precomputed)):
+            size = len(self.precomputed[sym].context[sym])
+            for i in range(size):
+                code.append('{sym}[{i}] = -{sym}[{i}]'.format(sym=sym, i=i))
+        code.extend(self._get_calls('loop', swap_indices=True))
+        code.append('')
+        return self._set_kernel('\n'.join(code), kernel)
+
     def has_post_loop(self):
         return self._has_code('post_loop')
 
@@ -691,7 +830,7 @@ class Group(object):
         wrappers = []
         predefined = dict(get_predefined_types(self.pre_comp))
         predefined.update(known_types)
-        code_gen = CythonGenerator(known_types=predefined)
+        code_gen = CythonGenerator(known_types=predefined, final=True)
         for cls in sorted(classes.keys()):
             code_gen.parse(eqs[cls])
             wrappers.append(code_gen.get_code())
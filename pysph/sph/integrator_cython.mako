@@ -23,6 +23,8 @@ cdef class Integrator:
     cdef public NNPS nnps
     cdef public double dt, t, orig_t
     cdef object _post_stage_callback
+    # whether the parallel manager has been updated in this time step
+    cdef bint _pm_updated
 
     ${indent(helper.get_stepper_defs(), 1)}
 
@@ -43,14 +45,54 @@ cdef class Integrator:
     def set_post_stage_callback(self, object callback):
         self._post_stage_callback = callback
 
+    cpdef update_parallel_manager(self):
+        """Update the parallel manager since the particles have moved.
+
+        The particles are re-partitioned only once in a time step, the
+        remote particles are simply refreshed for the later stages.
+        """
+        if self._pm_updated:
+            % if helper.acceleration_eval_helper.has_overlap():
+            # The acceleration eval waits for the halo after computing
+            # the interior particles.
+            if self.parallel_manager.start_refresh_halo():
+                self.acceleration_eval.halo = self.parallel_manager
+            % else:
+            self.parallel_manager.refresh_halo()
+            % endif
+        else:
+            self.parallel_manager.update()
+            self._pm_updated = True
+
     cpdef compute_accelerations(self):
+        % if helper.acceleration_eval_helper.config.use_profiling:
+        cdef double _t0
         # update NNPS since particles have moved
         if self.parallel_manager:
-            self.parallel_manager.update()
+            _t0 = _timer()
+            self.update_parallel_manager()
+            self.acceleration_eval._add_time(
+                'Integrator/parallel_manager/update', (), _timer() - _t0
+            )
+        _t0 = _timer()
+        self.nnps.update()
+        self.acceleration_eval._add_time(
+            'Integrator/nnps/update', (), _timer() - _t0
+        )
+        % else:
+        # update NNPS since particles have moved
+        if self.parallel_manager:
+            self.update_parallel_manager()
         self.nnps.update()
+        % endif
 
         # Evaluate
         self.acceleration_eval.compute(self.t, self.dt)
+        % if helper.acceleration_eval_helper.has_overlap():
+        if self.acceleration_eval.halo is not None:
+            self.acceleration_eval.halo = None
+            self.parallel_manager.finish_refresh_halo()
+        % endif
 
     cpdef do_post_stage(self, double stage_dt, int stage):
         """This is called after every stage of the integrator.
@@ -75,6 +117,7 @@ cdef class Integrator:
         self.orig_t = t
         self.t = t
         self.dt = dt
+        self._pm_updated = False
         self.one_timestep(t, dt)
 
     cdef one_timestep(self, double t, double dt):
@@ -24,11 +24,7 @@ class SPHCompiler(object):
         """
         if self.ext_mod is not None:
             return
-        code = self._get_code()
-        # Note, we do not add carray or particle_array as nnps_base would have
-        # been rebuilt anyway if they changed.
-        depends = ["pysph.base.nnps_base"]
-        self.ext_mod = ExtModule(code, verbose=True, depends=depends)
+        self.ext_mod = self._get_ext_module()
         mod = self.ext_mod.load()
         self.module = mod
 
@@ -37,7 +33,24 @@ class SPHCompiler(object):
         if self.integrator is not None:
             self.integrator_helper.setup_compiled_module(mod, cython_a_eval)
 
+    def compile_in_background(self):
+        """Start compiling the generated code in a separate process and return
+        immediately.
+
+        This is useful to do other setup while the code compiles, a later call
+        to `compile` (even on another SPHCompiler) that generates the same
+        code will wait for this to finish instead of compiling it again.
+        """
+        self._get_ext_module().build_in_background()
+
     #### Private interface. ####################################################
+    def _get_ext_module(self):
+        code = self._get_code()
+        # Note, we do not add carray or particle_array as nnps_base would have
+        # been rebuilt anyway if they changed.
+        depends = ["pysph.base.nnps_base"]
+        return ExtModule(code, verbose=True, depends=depends)
+
     def _get_code(self):
         main = self.acceleration_eval_helper.get_code()
         integrator_code = self.integrator_helper.get_code()
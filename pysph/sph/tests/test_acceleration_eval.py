@@ -12,13 +12,15 @@ import numpy as np
 from pysph.base.utils import get_particle_array
 from pysph.sph.equation import Equation, Group
 from pysph.sph.acceleration_eval import (AccelerationEval,
-    check_equation_array_properties)
-from pysph.sph.basic_equations import SummationDensity
+    check_equation_array_properties, fuse_groups)
+from pysph.sph.basic_equations import ContinuityEquation, SummationDensity
+from pysph.base.config import get_config
 from pysph.base.kernels import CubicSpline
 from pysph.base.nnps import LinkedListNNPS as NNPS
 from pysph.sph.sph_compiler import SPHCompiler
 
 from pysph.base.reduce_array import serial_reduce_array
+from pyzoltan.core.carray import UIntArray
 
 
 class DummyEquation(Equation):
@@ -158,6 +160,18 @@ class SimpleEquation(Equation):
             self.count = 0
         return result
 
+class ScaledEquation(Equation):
+    def __init__(self, dest, sources, fac):
+        self.fac = fac
+        super(ScaledEquation, self).__init__(dest, sources)
+
+    def initialize(self, d_idx, d_au):
+        d_au[d_idx] = 0.0
+
+    def loop(self, d_idx, d_au, s_idx, s_m):
+        d_au[d_idx] += self.fac*s_m[s_idx]
+
+
 class MixedTypeEquation(Equation):
     def initialize(self, d_idx, d_u, d_au, d_pid, d_tag):
         d_u[d_idx] = 0.0 + d_pid[d_idx]
@@ -176,6 +190,28 @@ class SimpleReduction(Equation):
         dst.total_mass[0] = serial_reduce_array(dst.array.m, op='sum')
 
 
+class HaloStub(object):
+    """Splits the particles into interior and boundary particles like the
+    ParallelManager and records when the halo is finished.
+    """
+    def __init__(self, name, interior, boundary, pa=None):
+        self.interior_particles = {name: self._make_array(interior)}
+        self.boundary_particles = {name: self._make_array(boundary)}
+        self.finished = 0
+        self.pa = pa
+        self.au_at_finish = None
+
+    def _make_array(self, indices):
+        arr = UIntArray(len(indices))
+        arr.set_data(np.asarray(indices, dtype=np.uint32))
+        return arr
+
+    def finish_refresh_halo(self):
+        self.finished += 1
+        if self.pa is not None:
+            self.au_at_finish = self.pa.au.copy()
+
+
 class TestAccelerationEval1D(unittest.TestCase):
     def setUp(self):
         self.dim = 1
@@ -187,11 +223,12 @@ class TestAccelerationEval1D(unittest.TestCase):
         pa = get_particle_array(name='fluid', x=x, h=h, m=m)
         self.pa = pa
 
-    def _make_accel_eval(self, equations, cache_nnps=False):
+    def _make_accel_eval(self, equations, cache_nnps=False, mode='serial'):
         arrays = [self.pa]
         kernel = CubicSpline(dim=self.dim)
         a_eval = AccelerationEval(
-            particle_arrays=arrays, equations=equations, kernel=kernel
+            particle_arrays=arrays, equations=equations, kernel=kernel,
+            mode=mode
         )
         comp = SPHCompiler(a_eval, integrator=None)
         comp.compile()
@@ -213,6 +250,50 @@ class TestAccelerationEval1D(unittest.TestCase):
         # Then
         self.assertEqual(pa.total_mass, 10.0)
 
+    def test_should_find_props_read_from_remote_particles(self):
+        # Given
+        pa = self.pa
+        pa.add_property('V')
+        pa.add_constant('total_mass', 0.0)
+        solid = get_particle_array(name='solid')
+        solid.add_property('V')
+        equations = [
+            Group(equations=[
+                SimpleEquation(dest='fluid', sources=['fluid', 'solid'])
+            ]),
+            Group(equations=[
+                DummyEquation(dest='solid', sources=['fluid'])
+            ], real=False)
+        ]
+        a_eval = AccelerationEval(
+            particle_arrays=[pa, solid], equations=equations,
+            kernel=CubicSpline(dim=self.dim)
+        )
+
+        # When
+        props = a_eval.get_remote_props()
+
+        # Then
+        # The precomputed symbols read the positions and smoothing lengths.
+        pos = set(['x', 'y', 'z', 'h'])
+        self.assertEqual(props, {'fluid': pos | set(['m', 'u', 'V']),
+                                 'solid': pos | set(['m', 'rho', 'V'])})
+
+        # Given
+        equations[0].equations.append(
+            SimpleReduction(dest='fluid', sources=None)
+        )
+        a_eval = AccelerationEval(
+            particle_arrays=[pa, solid], equations=equations,
+            kernel=CubicSpline(dim=self.dim)
+        )
+
+        # When
+        props = a_eval.get_remote_props()
+
+        # Then
+        self.assertEqual(props, {'solid': pos | set(['m', 'rho', 'V'])})
+
     def test_should_not_iterate_normal_group(self):
         # Given
         pa = self.pa
@@ -305,3 +386,227 @@ class TestAccelerationEval1D(unittest.TestCase):
         # Then
         expect = np.asarray([3., 4., 5., 5., 5., 5., 5., 5.,  4.,  3.])
         self.assertListEqual(list(pa.u), list(expect))
+
+    def test_symmetric_loop_should_match_normal_loop(self):
+        # Given
+        pa = self.pa
+        pa.add_property('arho')
+        pa.u[:] = np.sin(2.0*np.pi*pa.x)
+        equations = [SummationDensity(dest='fluid', sources=['fluid']),
+                     ContinuityEquation(dest='fluid', sources=['fluid'])]
+        a_eval = self._make_accel_eval(equations)
+        a_eval.compute(0.1, 0.1)
+        expect_rho = pa.rho.copy()
+        expect_arho = pa.arho.copy()
+        pa.rho[:] = 0.0
+        pa.arho[:] = 0.0
+
+        # When
+        config = get_config()
+        orig = config.use_symmetric_loop
+        config.use_symmetric_loop = True
+        try:
+            a_eval = self._make_accel_eval(equations)
+            a_eval.compute(0.1, 0.1)
+        finally:
+            config.use_symmetric_loop = orig
+
+        # Then
+        np.testing.assert_array_almost_equal(pa.rho, expect_rho)
+        np.testing.assert_array_almost_equal(pa.arho, expect_arho)
+
+    def test_cell_loop_should_match_normal_loop(self):
+        # Given
+        pa = self.pa
+        pa.add_property('arho')
+        pa.u[:] = np.sin(2.0*np.pi*pa.x)
+        pa.x[:] = pa.x[::-1]
+        equations = [SummationDensity(dest='fluid', sources=['fluid']),
+                     ContinuityEquation(dest='fluid', sources=['fluid'])]
+        a_eval = self._make_accel_eval(equations)
+        a_eval.compute(0.1, 0.1)
+        expect_rho = pa.rho.copy()
+        expect_arho = pa.arho.copy()
+
+        # When
+        config = get_config()
+        orig = config.use_cell_loop
+        config.use_cell_loop = True
+        try:
+            for cache_nnps in (False, True):
+                pa.rho[:] = 0.0
+                pa.arho[:] = 0.0
+                a_eval = self._make_accel_eval(equations, cache_nnps)
+                a_eval.compute(0.1, 0.1)
+
+                # Then
+                np.testing.assert_array_almost_equal(pa.rho, expect_rho)
+                np.testing.assert_array_almost_equal(pa.arho, expect_arho)
+        finally:
+            config.use_cell_loop = orig
+
+    def test_should_fuse_independent_groups(self):
+        # Given
+        equations = [
+            Group(equations=[SummationDensity(dest='fluid', sources=['fluid'])]),
+            Group(equations=[ContinuityEquation(dest='fluid', sources=['fluid'])],
+                  update_nnps=True),
+            Group(equations=[SimpleEquation(dest='fluid', sources=['fluid'])]),
+            Group(equations=[ContinuityEquation(dest='fluid', sources=['fluid'])]),
+            Group(equations=[SimpleReduction(dest='fluid', sources=['fluid'])]),
+        ]
+
+        # When
+        groups = fuse_groups(equations)
+
+        # Then
+        self.assertEqual(len(groups), 4)
+        names = [eq.name for eq in groups[0].equations]
+        self.assertEqual(names, ['SummationDensity', 'ContinuityEquation'])
+        self.assertTrue(groups[0].update_nnps)
+        # SimpleEquation sets u which is used by the ContinuityEquation.
+        self.assertEqual(groups[1:], equations[2:])
+
+    def test_fused_groups_should_match_separate_groups(self):
+        # Given
+        pa = self.pa
+        pa.add_property('arho')
+        pa.u[:] = np.sin(2.0*np.pi*pa.x)
+        equations = [
+            Group(equations=[SummationDensity(dest='fluid', sources=['fluid'])]),
+            Group(equations=[ContinuityEquation(dest='fluid', sources=['fluid'])]),
+        ]
+        a_eval = self._make_accel_eval(equations)
+        a_eval.compute(0.1, 0.1)
+        expect_rho = pa.rho.copy()
+        expect_arho = pa.arho.copy()
+        pa.rho[:] = 0.0
+        pa.arho[:] = 0.0
+
+        # When
+        config = get_config()
+        orig = config.use_fused_groups
+        config.use_fused_groups = True
+        try:
+            a_eval = self._make_accel_eval(equations)
+            a_eval.compute(0.1, 0.1)
+        finally:
+            config.use_fused_groups = orig
+
+        # Then
+        self.assertEqual(len(a_eval.mega_groups), 1)
+        np.testing.assert_array_almost_equal(pa.rho, expect_rho)
+        np.testing.assert_array_almost_equal(pa.arho, expect_arho)
+
+    def test_constants_should_not_change_generated_code(self):
+        # Given
+        pa = self.pa
+        kernel = CubicSpline(dim=self.dim)
+        code = []
+        for fac in (1.0, 2.0):
+            equations = [ScaledEquation(dest='fluid', sources=['fluid'],
+                                        fac=fac)]
+            a_eval = AccelerationEval([pa], equations, kernel)
+            code.append(SPHCompiler(a_eval, integrator=None)._get_code())
+
+        # When
+        a_eval = self._make_accel_eval(equations)
+        a_eval.compute(0.1, 0.1)
+
+        # Then
+        self.assertEqual(code[0], code[1])
+        expect = 2.0*np.asarray([3., 4., 5., 5., 5., 5., 5., 5., 4., 3.])
+        self.assertListEqual(list(pa.au), list(expect))
+
+    def test_should_compute_interior_and_boundary_particles_separately(self):
+        # Given
+        pa = self.pa
+        pa.add_constant('total_mass', 0.0)
+        equations = [
+            Group(equations=[FindTotalMass(dest='fluid', sources=None)]),
+            Group(equations=[SimpleEquation(dest='fluid', sources=['fluid'])]),
+        ]
+        a_eval = self._make_accel_eval(equations, mode='mpi')
+        a_eval.compute(0.1, 0.1)
+        expect = pa.u.copy()
+        pa.u[:] = 0.0
+
+        # When
+        halo = HaloStub('fluid', interior=[2, 3, 4, 5, 6, 7],
+                        boundary=[0, 1, 8, 9], pa=pa)
+        a_eval.c_acceleration_eval.halo = halo
+        a_eval.compute(0.1, 0.1)
+
+        # Then
+        self.assertEqual(halo.finished, 1)
+        self.assertEqual(a_eval.c_acceleration_eval.halo, None)
+        self.assertListEqual(list(pa.u), list(expect))
+        au = halo.au_at_finish
+        self.assertTrue(np.all(au[2:8] > 0))
+        self.assertTrue(np.all(au[[0, 1, 8, 9]] == 0))
+
+    def test_should_compute_interior_particles_with_verlet_lists(self):
+        # Given
+        pa = self.pa
+        pa.add_constant('total_mass', 0.0)
+        equations = [
+            Group(equations=[FindTotalMass(dest='fluid', sources=None)]),
+            Group(equations=[SimpleEquation(dest='fluid', sources=['fluid'])]),
+        ]
+        a_eval = self._make_accel_eval(equations, mode='mpi')
+        a_eval.compute(0.1, 0.1)
+        expect = pa.u.copy()
+        pa.u[:] = 0.0
+
+        # When
+        a_eval.nnps.set_skin(0.1)
+        halo = HaloStub('fluid', interior=[2, 3, 4, 5, 6, 7],
+                        boundary=[0, 1, 8, 9], pa=pa)
+        a_eval.c_acceleration_eval.halo = halo
+        a_eval.compute(0.1, 0.1)
+
+        # Then
+        self.assertEqual(halo.finished, 1)
+        self.assertListEqual(list(pa.u), list(expect))
+        au = halo.au_at_finish
+        self.assertTrue(np.all(au[2:8] > 0))
+        self.assertTrue(np.all(au[[0, 1, 8, 9]] == 0))
+
+    def test_profiling_should_record_group_timings(self):
+        # Given
+        pa = self.pa
+        pa.add_constant('total_mass', 0.0)
+        equations = [
+            Group(equations=[SimpleEquation(dest='fluid', sources=['fluid'])]),
+            Group(equations=[SimpleReduction(dest='fluid', sources=['fluid'])],
+                  update_nnps=True),
+        ]
+        config = get_config()
+        orig = config.use_profiling
+        config.use_profiling = True
+        try:
+            a_eval = self._make_accel_eval(equations)
+        finally:
+            config.use_profiling = orig
+
+        # When
+        a_eval.compute(0.1, 0.1)
+        a_eval.compute(0.1, 0.1)
+
+        # Then
+        profile = dict((x['name'], x) for x in a_eval.get_profile_info())
+        expect = ['Group 0/fluid/initialize', 'Group 0/fluid <- fluid/loop',
+                  'Group 0/fluid/post_loop', 'Group 1/fluid/reduce',
+                  'Group 1/nnps/update']
+        for name in expect:
+            self.assertTrue(name in profile)
+            self.assertEqual(profile[name]['calls'], 2)
+            self.assertTrue(profile[name]['time'] >= 0.0)
+        self.assertEqual(profile['Group 0/fluid <- fluid/loop']['equations'],
+                         ['SimpleEquation'])
+
+        # When
+        a_eval.reset_profile()
+
+        # Then
+        self.assertEqual(a_eval.get_profile_info(), [])
@@ -7,8 +7,14 @@ import numpy as np
 # Local library imports.
 from pysph.base.particle_array import ParticleArray
 from pysph.base.cython_generator import KnownType
+from pysph.base.kernels import CubicSpline
+from pysph.base.utils import get_particle_array_wcsph
+from pysph.sph.acceleration_eval import AccelerationEval
 from pysph.sph.acceleration_eval_cython_helper import (get_all_array_names,
-    get_known_types_for_arrays)
+    get_known_types_for_arrays, AccelerationEvalCythonHelper)
+from pysph.sph.basic_equations import SummationDensity
+from pysph.sph.equation import Group
+from pysph.sph.wc.basic import TaitEOS
 
 
 class TestGetAllArrayNames(unittest.TestCase):
@@ -48,3 +54,56 @@ class TestGetKnownTypesForAllArrays(unittest.TestCase):
         for key in expect:
             self.assertEqual(repr(result[key]), repr(expect[key]))
 
+
+class TestOverlapDest(unittest.TestCase):
+    def _make_helper(self, equations, mode='mpi'):
+        pa = get_particle_array_wcsph(name='fluid', x=[0.0, 1.0])
+        a_eval = AccelerationEval(
+            [pa], equations, CubicSpline(dim=1), mode=mode
+        )
+        return AccelerationEvalCythonHelper(a_eval)
+
+    def test_should_overlap_first_group_with_loops_in_parallel(self):
+        # Given
+        equations = [
+            Group(equations=[
+                TaitEOS(dest='fluid', sources=None, rho0=1.0, c0=1.0,
+                        gamma=7.0)
+            ]),
+            Group(equations=[
+                SummationDensity(dest='fluid', sources=['fluid'])
+            ]),
+        ]
+
+        # When
+        helper = self._make_helper(equations)
+        groups = helper.object.mega_groups
+
+        # Then
+        self.assertTrue(helper.has_overlap())
+        self.assertEqual(helper.get_overlap_dest(groups[0]), None)
+        self.assertEqual(helper.get_overlap_dest(groups[1]), 'fluid')
+
+        # When
+        helper = self._make_helper(equations, mode='serial')
+
+        # Then
+        self.assertFalse(helper.has_overlap())
+
+    def test_should_not_overlap_when_remote_particles_are_computed(self):
+        # Given
+        equations = [
+            Group(equations=[
+                TaitEOS(dest='fluid', sources=None, rho0=1.0, c0=1.0,
+                        gamma=7.0)
+            ], real=False),
+            Group(equations=[
+                SummationDensity(dest='fluid', sources=['fluid'])
+            ]),
+        ]
+
+        # When
+        helper = self._make_helper(equations)
+
+        # Then
+        self.assertFalse(helper.has_overlap())
@@ -7,7 +7,7 @@ import unittest
 # Local imports.
 from pysph.base.cython_generator import KnownType
 from pysph.sph.equation import (BasicCodeBlock, Context, Equation,
-    Group, sort_precomputed)
+    Group, get_arrays_written_by_equation, get_kernel_code, sort_precomputed)
 
 
 class TestContext(unittest.TestCase):
@@ -119,6 +119,21 @@ class TestEquations(TestBase):
         self.assertEqual(d_arho[0], 3.0)
         self.assertEqual(d_arho[1], 0.0)
 
+    def test_arrays_written_by_equation(self):
+        from pysph.sph.basic_equations import ContinuityEquation
+        e = ContinuityEquation(dest='fluid', sources=['fluid'])
+        self.assertEqual(get_arrays_written_by_equation(e), set(['d_arho']))
+
+        class Test(Equation):
+            def loop(self, d_idx, d_u, d_au, s_idx, s_v):
+                tmp = s_v[s_idx]
+                d_au[d_idx] += tmp
+                helper(d_idx, d_u)
+
+        e = Test(dest='fluid', sources=['fluid'])
+        self.assertEqual(get_arrays_written_by_equation(e),
+                         set(['d_au', 'd_u']))
+
     def test_order_of_precomputed(self):
         try:
             pre_comp = Group.pre_comp
@@ -150,6 +165,17 @@ class Equation2(Equation):
     def loop(self, d_idx, s_idx):
         x = s_idx + d_idx
 
+class EquationWDP(Equation):
+    def loop(self, WDP=0.0):
+        x = WDP
+
+class KernelWithMethodCall(object):
+    def get_deltap(self):
+        return 0.5
+
+    def kernel(self, xij=[0., 0, 0], rij=1.0, h=1.0):
+        return self.get_deltap()*rij
+
 class TestGroup(TestBase):
     def setUp(self):
         from pysph.sph.basic_equations import SummationDensity
@@ -229,7 +255,7 @@ class TestGroup(TestBase):
             XIJ[2] = d_z[d_idx] - s_z[s_idx]
             R2IJ = XIJ[0]*XIJ[0] + XIJ[1]*XIJ[1] + XIJ[2]*XIJ[2]
             RIJ = sqrt(R2IJ)
-            WIJ = self.kernel.kernel(XIJ, RIJ, HIJ)
+            WIJ = CubicSpline_kernel(XIJ, RIJ, HIJ)
 
             self.equation10.loop(WIJ)
             self.equation20.loop(d_idx, s_idx)
@@ -237,6 +263,60 @@ class TestGroup(TestBase):
         msg = 'EXPECTED:\n%s\nGOT:\n%s'%(expect, result)
         self.assertEqual(result, expect, msg)
 
+    def test_loop_code_with_periodic_images(self):
+        from pysph.base.kernels import CubicSpline
+        k = CubicSpline(dim=3)
+        g = Group([Equation1('f', ['f'])])
+        w = g.get_equation_wrappers()
+        result = g.get_loop_code(k, periodic=('x', 'z'))
+        expect = dedent('''\
+            HIJ = 0.5*(d_h[d_idx] + s_h[s_idx])
+            XIJ[0] = d_x[d_idx] - s_x[s_idx]
+            XIJ[1] = d_y[d_idx] - s_y[s_idx]
+            XIJ[2] = d_z[d_idx] - s_z[s_idx]
+            if XIJ[0] > 0.5*self.xtranslate:
+                XIJ[0] -= self.xtranslate
+            elif XIJ[0] < -0.5*self.xtranslate:
+                XIJ[0] += self.xtranslate
+            if XIJ[2] > 0.5*self.ztranslate:
+                XIJ[2] -= self.ztranslate
+            elif XIJ[2] < -0.5*self.ztranslate:
+                XIJ[2] += self.ztranslate
+            R2IJ = XIJ[0]*XIJ[0] + XIJ[1]*XIJ[1] + XIJ[2]*XIJ[2]
+            RIJ = sqrt(R2IJ)
+            WIJ = CubicSpline_kernel(XIJ, RIJ, HIJ)
+
+            self.equation10.loop(WIJ)
+            ''')
+        msg = 'EXPECTED:\n%s\nGOT:\n%s'%(expect, result)
+        self.assertEqual(result, expect, msg)
+
+    def test_loop_code_should_fold_deltap(self):
+        from pysph.base.kernels import CubicSpline
+        k = CubicSpline(dim=2)
+        g = Group([EquationWDP('f', ['f'])])
+        w = g.get_equation_wrappers()
+        result = g.get_loop_code(k)
+        self.assertTrue(
+            'WDP = CubicSpline_kernel(XIJ, %r*HIJ, HIJ)'%(2./3) in result
+        )
+
+    def test_loop_code_with_kernel_that_cannot_be_specialized(self):
+        k = KernelWithMethodCall()
+        g = Group([EquationWDP('f', ['f'])])
+        w = g.get_equation_wrappers()
+        result = g.get_loop_code(k)
+        self.assertTrue(
+            'WDP = self.kernel.kernel(XIJ, self.kernel.get_deltap()*HIJ, HIJ)'
+            in result
+        )
+
+    def test_kernel_code_should_be_cached(self):
+        from pysph.base.kernels import CubicSpline
+        code = get_kernel_code(CubicSpline(dim=2))
+        self.assertTrue(get_kernel_code(CubicSpline(dim=2)) is code)
+        self.assertNotEqual(get_kernel_code(CubicSpline(dim=3)), code)
+
     def test_post_loop_code(self):
         from pysph.base.kernels import CubicSpline
         k = CubicSpline(dim=3)
@@ -252,5 +332,33 @@ class TestGroup(TestBase):
         msg = 'EXPECTED:\n%s\nGOT:\n%s'%(expect, result)
         self.assertEqual(result, expect, msg)
 
+    def test_symmetric_loop_code(self):
+        from pysph.base.kernels import CubicSpline
+        from pysph.sph.basic_equations import ContinuityEquation
+        k = CubicSpline(dim=3)
+        g = Group([ContinuityEquation('f', ['f'])])
+        w = g.get_equation_wrappers()
+        self.assertTrue(g.has_symmetric_loop())
+        result = g.get_symmetric_loop_code(k)
+        expect = dedent('''\
+            DWIJ[0] = -DWIJ[0]
+            DWIJ[1] = -DWIJ[1]
+            DWIJ[2] = -DWIJ[2]
+            VIJ[0] = -VIJ[0]
+            VIJ[1] = -VIJ[1]
+            VIJ[2] = -VIJ[2]
+            XIJ[0] = -XIJ[0]
+            XIJ[1] = -XIJ[1]
+            XIJ[2] = -XIJ[2]
+            self.continuity_equation0.loop(s_idx, d_arho, d_idx, s_m, DWIJ, VIJ)
+            ''')
+        msg = 'EXPECTED:\n%s\nGOT:\n%s'%(expect, result)
+        self.assertEqual(result, expect, msg)
+
+    def test_has_symmetric_loop(self):
+        self.assertFalse(self.group.has_symmetric_loop())
+        g = Group([Equation1('f', ['f']), Equation2('f', ['f'])])
+        self.assertFalse(g.has_symmetric_loop())
+
 if __name__ == '__main__':
     unittest.main()
@@ -219,5 +219,36 @@ class TestPEFRLIntegrator(TestIntegratorBase):
         self.assertTrue(err1/err2 > 16.0)
 
 
+class ParallelManagerRecorder(object):
+    """Records the calls made by the integrator to the parallel manager.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def update(self):
+        self.calls.append('update')
+
+    def refresh_halo(self):
+        self.calls.append('refresh_halo')
+
+
+class TestIntegratorParallelManager(TestIntegratorBase):
+    def test_should_update_parallel_manager_once_per_step(self):
+        # Given.
+        integrator = PEFRLIntegrator(fluid=PEFRLStep())
+        equations = [SHM(dest="fluid", sources=None)]
+        self._setup_integrator(equations=equations, integrator=integrator)
+        pm = ParallelManagerRecorder()
+        integrator.set_parallel_manager(pm)
+
+        # When
+        integrator.step(0.0, 0.1)
+        integrator.step(0.1, 0.1)
+
+        # Then
+        expect = ['update'] + ['refresh_halo']*3
+        self.assertEqual(pm.calls, expect*2)
+
+
 if __name__ == '__main__':
     unittest.main()
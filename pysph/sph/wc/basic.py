@@ -159,6 +159,8 @@ class MomentumEquation(Equation):
     .. [Monaghan1992] J. Monaghan, Smoothed Particle Hydrodynamics, "Annual 
         Review of Astronomy and Astrophysics", 30 (1992), pp. 543-574.
     """
+    symmetric = True
+
     def __init__(self, dest, sources, c0,
                  alpha=1.0, beta=1.0, gx=0.0, gy=0.0, gz=0.0,
                  tensile_correction=False):
@@ -294,6 +296,8 @@ class MomentumEquationDeltaSPH(Equation):
         pp 1468--1480.
        
     """
+    symmetric = True
+
     def __init__(
         self, dest, sources, rho0, c0, alpha=1.0,
         gx=0.0, gy=0.0, gz=0.0):
@@ -385,6 +389,8 @@ class ContinuityEquationDeltaSPH(Equation):
         violent impact flows", Computer Methods in Applied Mechanics and 
         Engineering, 200 (2011), pp 1526--1542.
     """
+    symmetric = True
+
     def __init__(self, dest, sources, c0, delta=0.1):
         r"""
         Parameters
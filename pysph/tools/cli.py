@@ -5,6 +5,7 @@ from __future__ import print_function
 
 from argparse import ArgumentParser
 from os.path import exists, join
+import subprocess
 import sys
 
 def run_viewer(args):
@@ -19,6 +20,47 @@ def output_vtk(args):
     from pysph.solver.vtk_output import main
     main(args)
 
+def _compile_example(args):
+    cmd = [sys.executable, '-m', 'pysph.tools.cli', 'run'] + args + \
+        ['--compile-only']
+    return subprocess.call(cmd)
+
+def compile_examples(args):
+    """Compile the code for the given examples (without running them) so the
+    compiled modules are cached.  Any arguments after a "--" are passed on to
+    each example.
+    """
+    from multiprocessing import cpu_count
+    from multiprocessing.pool import ThreadPool
+    if '--' in args:
+        idx = args.index('--')
+        args, extra = args[:idx], args[idx+1:]
+    else:
+        extra = []
+    parser = ArgumentParser(
+        prog='pysph compile',
+        description='Compile the code for PySPH examples without running '
+        'them.  Arguments after a "--" are passed to each example.'
+    )
+    parser.add_argument(
+        "-j", "--jobs", action="store", type=int, dest="jobs",
+        default=cpu_count(),
+        help="Number of examples to compile simultaneously."
+    )
+    parser.add_argument(
+        "examples", nargs="+", help="Names of the examples to compile."
+    )
+    options = parser.parse_args(args)
+    pool = ThreadPool(options.jobs)
+    status = pool.map(
+        _compile_example, [[x] + extra for x in options.examples]
+    )
+    pool.close()
+    failed = [x for x, code in zip(options.examples, status) if code != 0]
+    if len(failed) > 0:
+        print("Compilation failed for: %s" % ', '.join(failed))
+        sys.exit(1)
+
 def _has_pysph_dir():
     init_py = join('pysph', '__init__.py')
     init_pyc = join('pysph', '__init__.pyc')
@@ -54,6 +96,12 @@ def main():
          add_help=False
     )
     vtk_out.set_defaults(func=output_vtk)
+    compiler = subparsers.add_parser(
+        'compile', help='Compile the code for examples without running them',
+        add_help=False
+    )
+    compiler.set_defaults(func=compile_examples)
+
     tests = subparsers.add_parser(
         'test', help='Run entire PySPH test-suite',
         add_help=False
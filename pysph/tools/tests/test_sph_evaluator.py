@@ -51,6 +51,24 @@ class TestSPHEvaluator(unittest.TestCase):
         # Then.
         self.assertAlmostEqual(dest.rho[0], 9.0, places=2)
 
+    def test_evaluation_with_tabulated_kernel(self):
+        # Given
+        from pysph.base.kernels import CubicSpline, TabulatedKernel
+        xd = [0.5]
+        hd = self.src.h[:1]
+        dest = get_particle_array(name='dest', x=xd, h=hd)
+        kernel = TabulatedKernel(CubicSpline(dim=1), n=1000)
+        sph_eval = SPHEvaluator(
+            arrays=[dest, self.src], equations=self.equations, dim=1,
+            kernel=kernel
+        )
+
+        # When.
+        sph_eval.evaluate()
+
+        # Then.
+        self.assertAlmostEqual(dest.rho[0], 9.0, places=2)
+
     def test_updating_particle_arrays(self):
         # Given
         xd = [0.5]
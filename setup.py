@@ -319,7 +319,7 @@ def get_basic_extensions():
             sources=["pysph/base/spatial_hash_nnps.pyx"],
             depends=get_deps(
                 "pysph/base/nnps_base"
-            ),
+            ) + ["pysph/base/spatial_hash.h"],
             include_dirs=include_dirs,
             extra_compile_args=extra_compile_args + openmp_compile_args,
             extra_link_args=openmp_link_args,
@@ -359,7 +359,7 @@ def get_basic_extensions():
             sources=["pysph/base/stratified_hash_nnps.pyx"],
             depends=get_deps(
                 "pysph/base/nnps_base"
-            ),
+            ) + ["pysph/base/spatial_hash.h"],
             include_dirs=include_dirs,
             extra_compile_args=extra_compile_args + openmp_compile_args,
             extra_link_args=openmp_link_args,
@@ -494,6 +494,7 @@ def get_parallel_extensions():
 
     MPI4PY_V2 = False if mpi4py.__version__.startswith('1.') else True
     cython_compile_time_env = {'MPI4PY_V2': MPI4PY_V2}
+    openmp_compile_args, openmp_link_args, openmp_env = get_openmp_flags()
 
     zoltan_lib = 'zoltan'
     if os.environ.get('USE_TRILINOS', None) is not None:
@@ -565,9 +566,12 @@ def get_parallel_extensions():
             include_dirs=include_dirs + mpi_inc_dirs + zoltan_include_dirs,
             library_dirs=zoltan_library_dirs,
             libraries=[zoltan_lib, 'mpi'],
-            extra_link_args=mpi_link_args,
-            extra_compile_args=mpi_compile_args+extra_compile_args,
-            cython_compile_time_env=cython_compile_time_env,
+            extra_link_args=mpi_link_args + openmp_link_args,
+            extra_compile_args=(mpi_compile_args + extra_compile_args +
+                                openmp_compile_args),
+            cython_compile_time_env=dict(
+                cython_compile_time_env, OPENMP=openmp_env
+            ),
             language="c++"
         ),
     ]